@@ -1,5 +1,6 @@
 import streamlit as st
-import pandas as pd
+
+from recursos import catalogo_fichas
 
 # Configuración de la página
 st.set_page_config(page_title="Redestinación de Contenedores", layout="wide", page_icon="📦")
@@ -17,11 +18,9 @@ uploaded_file = st.sidebar.file_uploader("Sube tu archivo de Fichas Técnicas (E
 
 if uploaded_file is not None:
     try:
-        # Lógica para leer Excel o CSV
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        # Lógica para leer Excel o CSV (una vez por contenido, compartido entre sesiones)
+        catalogo = catalogo_fichas(uploaded_file)
+        df = catalogo.df
         
         # Validación básica de columnas
         columnas_requeridas = ['Cliente', 'Producto', 'Tipo', 'Analisis', 'Minimo', 'Maximo']
@@ -34,24 +33,20 @@ if uploaded_file is not None:
             st.header("2. Seleccionar Producto a Redestinar")
             
             # Obtener lista única de productos
-            productos_disponibles = df['Producto'].dropna().unique()
+            productos_disponibles = catalogo.productos
             producto_seleccionado = st.selectbox(
                 "Elija el tipo de producto disponible en el contenedor:",
                 options=productos_disponibles
             )
 
             # 3. Filtrado y Procesamiento
-            # Filtramos por el producto seleccionado y por Tipo = 'Analisis' (según requerimiento)
-            df_filtrado = df[
-                (df['Producto'] == producto_seleccionado) & 
-                (df['Tipo'].astype(str).str.lower() == 'analisis')
-            ]
+            # Filas del producto seleccionado con Tipo = 'Analisis' (según requerimiento), ya agrupadas por Cliente
+            por_cliente = catalogo.analisis_por_cliente(producto_seleccionado)
 
-            if df_filtrado.empty:
+            if not por_cliente:
                 st.warning(f"No se encontraron especificaciones de tipo 'Analisis' para el producto: {producto_seleccionado}")
             else:
-                # Agrupar por Cliente
-                clientes_unicos = df_filtrado['Cliente'].unique()
+                clientes_unicos = list(por_cliente)
                 
                 st.markdown(f"### 📋 Clientes potenciales encontrados: {len(clientes_unicos)}")
                 st.markdown("---")
@@ -60,7 +55,7 @@ if uploaded_file is not None:
                 for cliente in clientes_unicos:
                     with st.expander(f"👤 Cliente: {cliente}", expanded=True):
                         # Sub-dataframe para este cliente
-                        datos_cliente = df_filtrado[df_filtrado['Cliente'] == cliente]
+                        datos_cliente = por_cliente[cliente]
                         
                         # Seleccionamos columnas relevantes para la toma de decisión
                         cols_mostrar = ['Analisis', 'Minimo', 'Maximo']
@@ -1,5 +1,6 @@
 import streamlit as st
-import pandas as pd
+
+from recursos import catalogo_fichas
 
 # Configuración de la página
 st.set_page_config(page_title="Redestinación Inteligente", layout="wide", page_icon="🎯")
@@ -14,16 +15,10 @@ uploaded_file = st.sidebar.file_uploader("Sube Fichas Técnicas (Excel/CSV)", ty
 
 if uploaded_file is not None:
     try:
-        # Lectura de datos
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-        
-        # Limpieza y conversión de tipos (CRUCIAL para filtrar números)
-        # Convertimos 'Minimo' y 'Maximo' a numérico, errores se vuelven NaN
-        df['Minimo_num'] = pd.to_numeric(df['Minimo'], errors='coerce')
-        df['Maximo_num'] = pd.to_numeric(df['Maximo'], errors='coerce')
+        # Lectura de datos: una vez por contenido, compartida entre sesiones. El catálogo ya trae
+        # 'Minimo_num' y 'Maximo_num' (texto y vacíos -> NaN) y el índice de intervalos.
+        catalogo = catalogo_fichas(uploaded_file)
+        df, indice = catalogo.df, catalogo.intervalos
 
         st.success("✅ Datos cargados correctamente")
 
@@ -34,11 +29,11 @@ if uploaded_file is not None:
         
         with col1:
             st.header("2. Producto")
-            productos_disponibles = sorted(df['Producto'].dropna().unique())
+            productos_disponibles = sorted(catalogo.productos)
             producto_sel = st.selectbox("Producto en Contenedor:", productos_disponibles)
         
         # Filtrar DF base por producto
-        df_prod = df[df['Producto'] == producto_sel].copy()
+        df_prod = catalogo.filas_producto(producto_sel)
 
         # ---------------------------------------------------------
         # 3. FILTROS AVANZADOS (Lo que pediste)
@@ -78,15 +73,13 @@ if uploaded_file is not None:
         # ---------------------------------------------------------
         
         # Empezamos con el DF del producto y el análisis seleccionado
-        df_filtrado = df_prod[df_prod['Analisis'] == analisis_sel]
+        df_filtrado = catalogo.filas_analisis(producto_sel, analisis_sel)
 
         # Aplicar filtros si están activados
         if usar_valor_producto:
             # Lógica: El cliente sirve si Min_Cliente <= Valor_Producto <= Max_Cliente
-            # Usamos fillna para no perder filas donde no haya limite (ej. Min=0 implicito)
-            mask = (df_filtrado['Minimo_num'].fillna(0) <= valor_producto) & \
-                   (df_filtrado['Maximo_num'].fillna(999999) >= valor_producto)
-            df_filtrado = df_filtrado[mask]
+            # (consulta al índice de intervalos; Min vacío = 0 y Max vacío = 999999)
+            df_filtrado = df.iloc[indice.filas(producto_sel, analisis_sel, valor_producto)]
             st.info(f"🔍 Buscando clientes que acepten un valor de **{valor_producto}** para **{analisis_sel}**.")
 
         if usar_rango_manual:
@@ -116,9 +109,37 @@ if uploaded_file is not None:
             # Detalle expandible (ver la ficha completa de esos clientes)
             with st.expander("Ver Fichas Completas de estos Clientes"):
                 # Filtramos el DF original completo para estos clientes
-                df_completo_match = df_prod[df_prod['Cliente'].isin(clientes_match)]
+                df_completo_match = catalogo.filas_clientes(producto_sel, clientes_match)
                 st.dataframe(df_completo_match, use_container_width=True)
 
+        # ---------------------------------------------------------
+        # 6. LOTE COMPLETO (VARIOS ANÁLISIS)
+        # ---------------------------------------------------------
+        st.markdown("---")
+        st.header("6. Evaluar un Lote Completo")
+        st.caption("Ingresa los valores del lote en varios análisis: se listan los clientes cuya ficha los acepta todos.")
+
+        analisis_lote = st.multiselect("Análisis medidos en el lote:", analisis_disponibles)
+        if analisis_lote:
+            valores_lote = {}
+            cols_lote = st.columns(min(len(analisis_lote), 4))
+            for i, analisis in enumerate(analisis_lote):
+                with cols_lote[i % len(cols_lote)]:
+                    valores_lote[analisis] = st.number_input(f"{analisis}:", value=0.0, key=f"lote_{analisis}")
+            sin_exigencia_acepta = st.checkbox(
+                "Aceptar clientes sin exigencia en alguno de estos análisis", value=False,
+                help="Si no se marca, el cliente debe especificar un rango para cada análisis elegido."
+            )
+
+            clientes_lote = indice.clientes_compatibles(producto_sel, valores_lote, sin_exigencia_acepta)
+            if not clientes_lote:
+                st.warning("⚠️ Ningún cliente acepta el lote completo.")
+            else:
+                st.success(f"🎉 {len(clientes_lote)} clientes aceptan el lote completo.")
+                df_lote = catalogo.filas_clientes(producto_sel, clientes_lote)
+                df_lote = df_lote[df_lote['Analisis'].isin(analisis_lote)]
+                st.dataframe(df_lote[['Cliente', 'Analisis', 'Minimo', 'Maximo']], use_container_width=True, hide_index=True)
+
     except Exception as e:
         st.error(f"Error procesando el archivo: {e}")
         st.write("Detalle técnico:", e)
@@ -1,453 +1,588 @@
+import functools
+import sqlite3
+import time
+import uuid
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import re
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
+
+from recursos import almacen_fichas, catalogo_fichas, clave_archivo
+from redestino import diagnostico, historial, segundo_plano
+from redestino.imputacion import ESTRATEGIAS_IMPUTACION
+from redestino.inverso import construir_indice_lotes, lotes_para_ficha
+from redestino.ingesta import listar_hojas
+from redestino.paralelo import procesar_libro
+from redestino.pipeline import (COLUMNAS_REPORTE, MODO_HISTORIAL, cabecera_planta, cargar_planta, evaluar_lotes,
+                                ingresar_historial, memoria_mb, preparar_planta, rangos_tandas, seleccionar_candidatos,
+                                seleccionar_columnas)
+from redestino.resultados import CacheResultados, estadisticas
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(page_title="Matchmaker Pro: TURBO", layout="wide", page_icon="⚡")
 
 st.title("⚡ Buscador de Clientes (Optimizado + Imputación Robusta)")
-st.markdown("version 3"")
+st.markdown("version 3")
+
+# Diagnóstico de esta corrida (tiempos por etapa, conteos, aciertos de caché)
+diag = diagnostico.iniciar()
+
+# --- ETAPAS CON CACHÉ ---
+def cache_medido(**opciones):
+    """`st.cache_data` que además cuenta llamadas y fallos (el cuerpo solo corre en un fallo)."""
+    def decorar(funcion):
+        @functools.wraps(funcion)
+        def cuerpo(*args, **kwargs):
+            diagnostico.actual().fallo_cache(funcion.__name__)
+            return funcion(*args, **kwargs)
+        cacheada = st.cache_data(**opciones)(cuerpo)
+
+        @functools.wraps(funcion)
+        def llamada(*args, **kwargs):
+            diagnostico.actual().llamada_cache(funcion.__name__)
+            return cacheada(*args, **kwargs)
+        return llamada
+    return decorar
+
+# Cada etapa se guarda con la clave de sus entradas reales: `clave` = (hash fichas, hash planta,
+# hoja, modo de lectura). Los archivos van en parámetros con "_" (Streamlit no los hashea: el
+# contenido ya está en la clave). Las etapas llaman a las anteriores, que responden desde caché.
+def cargar_fichas_tecnicas(clave_fichas, _file):
+    # Índice columnar (motor) + vista dict-of-dicts para el resto de la app. Salen del catálogo
+    # compartido (st.cache_resource): una sola copia por archivo para todas las sesiones.
+    indice, db_fichas, error = catalogo_fichas(_file, clave_fichas).fichas
+    return db_fichas, indice, error
+
+@cache_medido(ttl=600)
+def hojas_planta(clave_planta, modo, _file):
+    return historial.listar_hojas() if modo == MODO_HISTORIAL else listar_hojas(_file)
+
+@cache_medido(ttl=600)
+def cabecera_hoja(clave_planta, hoja, modo, _file):
+    return cabecera_planta(_file, hoja, modo)
+
+@cache_medido(ttl=600)
+def etapa_columnas(clave, _archivos):
+    clave_fichas, clave_planta, hoja, modo = clave
+    _, indice, _ = cargar_fichas_tecnicas(clave_fichas, _archivos[0])
+    return seleccionar_columnas(indice, cabecera_hoja(clave_planta, hoja, modo, _archivos[1]))
+
+@cache_medido(ttl=600)
+def cargar_planta_completa(clave_planta, hoja, modo, columnas, col_estado_retenidos, rango, _file):
+    # Parquet en caché por hash de contenido: solo la primera lectura parsea el XLSX.
+    # Solo se cargan las `columnas` pedidas y, si se indica la columna de estado, solo los retenidos.
+    # Del historial se leen solo las particiones del `rango` (con un libro, `rango` es None).
+    return cargar_planta(_file, hoja, modo, columnas, col_estado_retenidos, rango)
+
+@cache_medido(ttl=600, max_entries=16)
+def etapa_preparacion(clave, solo_retenidos, rango, estrategia, liviano, _archivos):
+    _, clave_planta, hoja, modo = clave
+    seleccion = etapa_columnas(clave, _archivos)
+    col_estado = seleccion['meta']['status'] if solo_retenidos else None
+    # Un libro se carga entero (mover el rango reutiliza la carga); el historial, solo el rango
+    rango_carga = rango if modo == MODO_HISTORIAL else None
+    df_planta = cargar_planta_completa(clave_planta, hoja, modo, seleccion['cols_carga'], col_estado, rango_carga,
+                                       _archivos[1])
+    # La copia que entrega la caché es propia: en modo liviano se modifica en su lugar
+    return preparar_planta(df_planta, seleccion, rango, estrategia, liviano)
+
+@cache_medido(ttl=600, max_entries=16)
+def etapa_indice_inverso(clave, solo_retenidos, rango, estrategia, liviano, _archivos):
+    # Índice ordenado por columna sobre los retenidos (búsqueda "qué lotes cumplen esta ficha"),
+    # con la condición GF y el tipo de cada lote: no se evalúan todos los pares lotes x fichas
+    _, indice, _ = cargar_fichas_tecnicas(clave[0], _archivos[0])
+    seleccion = etapa_columnas(clave, _archivos)
+    df_retenidos, _ = etapa_preparacion(clave, solo_retenidos, rango, estrategia, liviano, _archivos)
+    return construir_indice_lotes(df_retenidos, indice, seleccion, clave[2])
+
+# Compatibilidad + top-K de la vista por lote: en un hilo aparte (ver redestino/segundo_plano.py),
+# por tandas. La primera es chica para mostrar los primeros lotes enseguida; la página se vuelve
+# a correr cada INTERVALO_REFRESCO segundos mientras el trabajo sigue en curso.
+PRIMERA_TANDA = 250
+TAMANO_TANDA = 2000
+INTERVALO_REFRESCO = 0.5
+
+def trabajo_candidatos(clave, solo_retenidos, rango, estrategia, liviano, top_k, recordar, df_retenidos, mascara, indice,
+                       seleccion, almacen, reintentar=False):
+    # Las entradas se leen aquí (con caché); el hilo solo usa funciones puras del pipeline.
+    # Cada parte: (lotes, es_gf, n_compatibles, tops, (reutilizados, completados, calculados)).
+    def tandas():
+        cache = None
+        cambios, versiones = almacen
+        if recordar and cambios:
+            # Caché persistente por lote: solo se evalúa lo nuevo o cambiado (ver redestino/resultados.py)
+            cache = CacheResultados(indice, seleccion, clave[2], cambios['almacen'], cambios['version'], versiones)
+        for inicio, fin in rangos_tandas(len(df_retenidos), TAMANO_TANDA, PRIMERA_TANDA):
+            tanda = df_retenidos.iloc[inicio:fin]
+            if cache is not None:
+                try:
+                    es_gf, n_compatibles, tops = cache.candidatos(tanda, mascara.subconjunto(np.arange(inicio, fin)), top_k)
+                    yield fin - inicio, es_gf, n_compatibles, tops, (cache.aciertos, cache.parciales, cache.calculados)
+                    continue
+                except (sqlite3.Error, OSError):
+                    # Sin caché en disco (solo lectura, bloqueado): se sigue evaluando todo
+                    cache = None
+            evaluacion = evaluar_lotes(tanda, indice, seleccion, clave[2])
+            n_compatibles, tops = seleccionar_candidatos(evaluacion, indice, top_k)
+            yield fin - inicio, evaluacion['es_gf_lotes'], n_compatibles, tops, None
+
+    sesion = st.session_state.setdefault('id_sesion', uuid.uuid4().hex)
+    return segundo_plano.obtener((clave, solo_retenidos, rango, estrategia, liviano, top_k, recordar), sesion, tandas,
+                                 reintentar)
+
+@cache_medido(ttl=600, max_entries=8)
+def etapa_libro(clave_fichas, clave_planta, modo, solo_retenidos, rango, estrategia, liviano, top_k, _archivos):
+    # Todas las hojas en procesos paralelos contra el mismo índice de fichas
+    _, indice, _ = cargar_fichas_tecnicas(clave_fichas, _archivos[0])
+    reporte, errores, tiempos = [], [], {}
+    for hoja, filas, error, segundos in procesar_libro(_archivos[1], indice, rango=rango, estrategia=estrategia, modo=modo,
+                                                        solo_retenidos=solo_retenidos, top_k=top_k, liviano=liviano):
+        if error: errores.append(error)
+        reporte.extend(filas)
+        tiempos[hoja] = segundos
+    return reporte, errores, tiempos
 
 # ==========================================
-# 🧠 CONFIGURACIÓN Y MAPEOS
+# 📋 COMPONENTES DE RESULTADOS
 # ==========================================
-MAPEO_PARAMETROS = {
-    'hojuelas quemadas': ['quemadas', "quemada"],
-    'hojuelas gelatinizadas': ['gelatinas', 'gelatina', 'gelatinizadas'],
-    'materias extrañas': ['mat extraña', 'materia extraña', 'impurezas'],
-    'materia extraña': ['mat extraña', 'materia extraña', 'impurezas'],
-    'granos dañados': ['dañados', 'grano dañado'],
-    'densidad aparente': ['densidad', 'peso hectolitrico', 'peso especifico'],
-    'peroxidos': ['ind perioxido', 'peroxido', 'indice de peroxido'],
-    'acidez': ['acidez', 'indice de acidez']
-}
-
-SINONIMOS_TIPOS = {
-    'instantanea': ['quick', 'instant', 'instantanea', 'instantánea', 'inst'],
-    'tradicional': ['rolled', 'traditional', 'tradicional', 'regular', 'old fashioned'],
-    'integral': ['whole', 'wholegrain', 'integral', 'grano entero'],
-    'laminada': ['rolled', 'flake', 'laminada'],
-    'fina': ['fine', 'fina', 'baby'],
-    'ultra fina': ['super fine', 'ultra', 'dust'],
-    'avena pelada': ['groat', 'kernel', 'pelada'],
-    'estabilizada': ['stabilized', 'estabilizada']
-}
-
-# --- FUNCIONES OPTIMIZADAS ---
-@st.cache_data
-def normalizar_texto(texto):
-    if not isinstance(texto, str): return str(texto)
-    texto = texto.lower().strip()
-    texto = texto.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-    texto = texto.replace('n°', '').replace('no.', '').replace('num', '')
-    for char in ['.', ',', '-', '/', '_', '%']:
-        texto = texto.replace(char, ' ')
-    return " ".join(texto.split())
-
-def detectar_familia_hoja(nombre_hoja):
-    h = normalizar_texto(nombre_hoja)
-    if 'groat' in h or 'pelada' in h: return 'groat'
-    if 'harina' in h: return 'harina'
-    if 'pillow' in h: return 'pillow'
-    if 'hojuela' in h: return 'hojuela'
-    return 'otros'
-
-def es_texto_gf(texto):
-    t = normalizar_texto(texto)
-    if 'gf' in t: return True
-    if 'gluten' in t and any(x in t for x in ['free', 'sin', 'libre', 'no']): return True
-    return False
-
-def check_tipo_producto_score(lote_tipo_norm, ficha_producto_norm):
-    if not lote_tipo_norm or lote_tipo_norm == 'nan': return 0
-    
-    if lote_tipo_norm in ficha_producto_norm: return 1
-    for clave, variaciones in SINONIMOS_TIPOS.items():
-        if clave in lote_tipo_norm:
-            for var in variaciones:
-                if var in ficha_producto_norm: return 1
-    return 0
-
-# --- CARGA DE DATOS CON CACHÉ ---
-@st.cache_data(ttl=3600)
-def cargar_fichas_tecnicas(file):
-    if file.name.endswith('.csv'):
-        df = pd.read_csv(file)
-    else:
-        df = pd.read_excel(file)
-    
-    cols_map = {normalizar_texto(c): c for c in df.columns}
-    
-    def get_col(keywords):
-        for k in keywords:
-            kn = normalizar_texto(k)
-            for cn, cr in cols_map.items():
-                if kn in cn: return cr
-        return None
-
-    c_cod = get_col(['codigo ft', 'cod'])
-    c_cli = get_col(['cliente'])
-    c_fam = get_col(['familia', 'family'])
-    c_prod = get_col(['producto', 'descripción'])
-    c_tipo = get_col(['tipo'])
-    c_param = get_col(['analisis', 'parametro'])
-    c_min = get_col(['min', 'mínimo'])
-    c_max = get_col(['max', 'máximo'])
-
-    if not all([c_cod, c_cli, c_prod, c_tipo, c_param, c_min, c_max]):
-        return None, "Faltan columnas clave en Fichas"
-
-    df['min_val'] = pd.to_numeric(df[c_min], errors='coerce').fillna(0)
-    df['max_val'] = pd.to_numeric(df[c_max], errors='coerce').fillna(float('inf'))
-
-    db_fichas = {}
-    for cod, grupo in df.groupby(c_cod):
-        first = grupo.iloc[0]
-        cliente = str(first[c_cli])
-        if "_Cliente de PruebaX" in cliente or "NO BORRAR" in cliente: continue
-
-        familia_txt = str(first[c_fam]) if c_fam else ""
-        prod_txt = str(first[c_prod])
-        es_ficha_gf = es_texto_gf(familia_txt) or es_texto_gf(prod_txt)
-        
-        fam_norm = detectar_familia_hoja(familia_txt)
-        prod_norm = normalizar_texto(prod_txt)
-        
-        if 'harina' in prod_norm: fam_norm = 'harina'
-        elif 'avena pelada' in prod_norm: fam_norm = 'groat'
-        elif 'pillow' in prod_norm: fam_norm = 'pillow'
-        elif 'hojuela' in prod_norm or 'laminada' in prod_norm: fam_norm = 'hojuela'
-
-        params = []
-        for _, row in grupo.iterrows():
-            if str(row[c_tipo]).lower().strip() == 'analisis':
-                p_norm = normalizar_texto(row[c_param])
-                tipo_param = 'otro'
-                if 'espesor' in p_norm: tipo_param = 'espesor'
-                elif any(x in p_norm for x in ['malla', 'ret', 'bajo', 'a traves']): tipo_param = 'malla'
-                
-                params.append({
-                    'nombre': row[c_param],
-                    'nombre_norm': p_norm,
-                    'min': row['min_val'],
-                    'max': row['max_val'],
-                    'tipo_param': tipo_param
-                })
-        
-        if params:
-            db_fichas[cod] = {
-                'cliente': cliente,
-                'familia_norm': fam_norm,
-                'producto': prod_txt,
-                'producto_norm': prod_norm,
-                'es_gf': es_ficha_gf,
-                'params': params
-            }
-    return db_fichas, None
-
-@st.cache_data(ttl=600)
-def cargar_planta_completa(file, hoja):
-    return pd.read_excel(file, sheet_name=hoja, header=1)
-
-# --- UTILIDAD DE BÚSQUEDA ---
-def encontrar_columna_opt(cols_norm_dict, keywords):
-    for key in keywords:
-        key_norm = normalizar_texto(key)
-        for col_norm, col_real in cols_norm_dict.items():
-            if key_norm in col_norm: return col_real
+TAMANOS_PAGINA = [25, 50, 100, 200]
+
+def selector_rango(hoy=None):
+    hoy = hoy or datetime.now().date()
+    date1, date2 = st.columns(2)
+    with date1:
+        rango_sel = st.date_input("Filtrar Fecha:", (hoy - timedelta(days=30), hoy), format="DD/MM/YYYY")
+    if isinstance(rango_sel, tuple) and len(rango_sel) == 2:
+        return tuple(rango_sel)
     return None
 
-def es_match_granulometria(header_ficha_norm, header_planta_norm):
-    nums_f = re.search(r'\d+', header_ficha_norm)
-    nums_p = re.search(r'\d+', header_planta_norm)
-    
-    if not nums_f or not nums_p: return False
-    if nums_f.group() != nums_p.group(): return False
-
-    vocab_bajo = {'a traves', 'bajo', 'pasa', 'menor', '<', 'fondo', 'base', 'minus'}
-    vocab_sobre = {'retencion', 'retenido', 'sobre', 'arriba', 'mayor', '>', 'encima', 'ret'}
-
-    dir_f = 'bajo' if any(k in header_ficha_norm for k in vocab_bajo) else ('sobre' if any(k in header_ficha_norm for k in vocab_sobre) else 'u')
-    dir_p = 'bajo' if any(k in header_planta_norm for k in vocab_bajo) else ('sobre' if any(k in header_planta_norm for k in vocab_sobre) else 'u')
-
-    return dir_f != 'u' and dir_p != 'u' and dir_f == dir_p
+def tabla_paginada(filas_resumen, clave='lotes'):
+    # Se envía al navegador una sola página de la tabla (y luego el detalle de un lote),
+    # así el costo de dibujar no crece con la cantidad de lotes.
+    if not filas_resumen:
+        st.warning("No hay lotes retenidos en el rango seleccionado.")
+        detener()
+
+    pag1, pag2 = st.columns(2)
+    tam_pagina = pag1.selectbox("Lotes por página:", TAMANOS_PAGINA, index=1)
+    n_paginas = (len(filas_resumen) + tam_pagina - 1) // tam_pagina
+    # Clave fija: la carga progresiva agrega páginas sin devolver al usuario a la primera
+    clave_pagina = f"pagina_{clave}"
+    if st.session_state.get(clave_pagina, 1) > n_paginas:
+        st.session_state[clave_pagina] = n_paginas
+    pagina = pag2.number_input("Página:", min_value=1, max_value=n_paginas, step=1, key=clave_pagina)
+    desde = (int(pagina) - 1) * tam_pagina
+    hasta = min(desde + tam_pagina, len(filas_resumen))
+
+    st.dataframe(pd.DataFrame(filas_resumen[desde:hasta]), use_container_width=True, hide_index=True)
+    st.caption(f"Página {int(pagina)} de {n_paginas} | Lotes {desde + 1} - {hasta} de {len(filas_resumen)}")
+    return desde, hasta
+
+def panel_diagnostico():
+    if not mostrar_diagnostico: return
+    datos = diag.como_dict()
+    with st.sidebar.expander("🩺 Diagnóstico", expanded=True):
+        corrida = f"{datos['memoria_corrida_mb']:+.0f} MB" if datos['memoria_corrida_mb'] is not None else "n/d"
+        pico = f"{datos['memoria_pico_proceso_mb']:.0f} MB" if datos['memoria_pico_proceso_mb'] is not None else "n/d"
+        st.caption(f"Corrida: {datos['segundos_total'] * 1000:.0f} ms, memoria {corrida} | "
+                   f"Pico del proceso (desde que arrancó): {pico}")
+        etapas = [{'Etapa': n, 'ms': round(d['segundos'] * 1000, 1), 'Veces': d['veces'],
+                   'Conteos': ", ".join(f"{k}={v}" for k, v in d.items() if k not in ('segundos', 'veces'))}
+                  for n, d in datos['etapas'].items()]
+        if etapas:
+            st.dataframe(pd.DataFrame(etapas), use_container_width=True, hide_index=True)
+        cache = [{'Función': f, 'Llamadas': d['llamadas'], 'Aciertos': d['aciertos'], 'Fallos': d['fallos']}
+                 for f, d in datos['cache'].items()]
+        if cache:
+            st.dataframe(pd.DataFrame(cache), use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Exportar diagnóstico (JSON)", diag.como_json().encode('utf-8'),
+                           file_name=f"diagnostico_{datetime.now():%Y%m%d_%H%M%S}.json", mime="application/json")
+
+def detener():
+    # st.stop() corta el script: el panel de diagnóstico se dibuja antes
+    panel_diagnostico()
+    st.stop()
+
+# Archivos subidos cuyo hash recuerda cada sesión (el historial puede recibir muchos libros)
+MAX_SUBIDAS_SESION = 64
+
+def clave_subida(file):
+    # El hash del contenido se calcula una vez por archivo subido, no en cada rerun (p. ej. los refrescos)
+    claves = st.session_state.setdefault('claves_archivo', {})
+    id_subida = getattr(file, 'file_id', None)
+    if id_subida is None:
+        return clave_archivo(file)
+    if id_subida not in claves:
+        claves[id_subida] = clave_archivo(file)
+        while len(claves) > MAX_SUBIDAS_SESION:
+            claves.pop(next(iter(claves)))
+    return claves[id_subida]
+
+def refrescar():
+    # Trabajo en curso: se dibuja el panel y la página se vuelve a correr con las tandas nuevas
+    panel_diagnostico()
+    time.sleep(INTERVALO_REFRESCO)
+    st.rerun()
 
 # --- UI PRINCIPAL ---
+trabajo_en_curso = False
 col1, col2 = st.columns(2)
-file_prod = col1.file_uploader("1. Excel Planta (Control)", type=['xlsx', 'xls'])
+origen_historial = st.sidebar.radio("Origen de los lotes:", ["Libro subido", "Historial de libros"],
+                                    help="Historial: los libros de planta (p. ej. uno por mes) se suman a un almacén "
+                                         "particionado por fecha y el rango elegido lee solo los meses que toca.") != "Libro subido"
+if origen_historial:
+    libros_planta = col1.file_uploader("1. Libros de Planta (se suman al historial)", type=['xlsx', 'xls'],
+                                       accept_multiple_files=True)
+    file_prod = None
+else:
+    file_prod = col1.file_uploader("1. Excel Planta (Control)", type=['xlsx', 'xls'])
 file_fichas = col2.file_uploader("2. Fichas Técnicas", type=['xlsx', 'xls', 'csv'])
+lectura_rapida = st.sidebar.checkbox("Lectura rápida (libros muy grandes)", value=False,
+                                     help="Parsea solo la hoja elegida con el lector de solo lectura más rápido disponible.")
+estrategia_imputacion = st.sidebar.selectbox("Imputación de vacíos:", list(ESTRATEGIAS_IMPUTACION),
+                                             format_func=lambda e: {'media': 'Promedio lote → global',
+                                                                    'mediana': 'Mediana lote → global',
+                                                                    'ventana_fecha': 'Promedio lote → últimos 7 días → global'}[e])
+solo_retenidos = st.sidebar.checkbox("Cargar solo filas retenidas", value=False,
+                                     help="Menos memoria en hojas grandes. Los promedios de imputación se calculan solo con retenidos.")
+top_k = st.sidebar.number_input("Candidatos por lote (top-K):", min_value=1, max_value=500, value=10, step=1)
+modo_liviano = st.sidebar.checkbox("Modo liviano (menos memoria)", value=False,
+                                   help="Mediciones en float32 y estado/lote/cliente/motivo/tipo como categorías. "
+                                        "Los límites se comparan con la misma precisión.")
+recordar_resultados = st.sidebar.checkbox("Reutilizar resultados de días anteriores", value=True,
+                                          help="Guarda en disco las fichas compatibles de cada lote; solo se recalculan lotes "
+                                               "nuevos o cambiados y, para los demás, las fichas que cambiaron.")
+vista_inversa = st.sidebar.radio("Vista:", ["Por lote", "Por ficha (lotes que la cumplen)"],
+                                 help="Por ficha: elige el Codigo FT de un pedido y se listan los lotes retenidos compatibles.") != "Por lote"
+todas_hojas = st.sidebar.checkbox("Procesar todas las hojas", value=False,
+                                  help="Cada hoja se procesa en paralelo y se arma un reporte consolidado.")
+mostrar_diagnostico = st.sidebar.checkbox("Mostrar diagnóstico", value=False,
+                                          help="Tiempos y conteos por etapa, aciertos de caché y memoria; exportable a JSON.")
+
+if (file_prod or origen_historial) and file_fichas:
+    clave_fichas = clave_subida(file_fichas)
+    archivos = (file_fichas, file_prod)
 
-if file_prod and file_fichas:
     # 1. CARGAR FICHAS
-    db_fichas, error = cargar_fichas_tecnicas(file_fichas)
+    with diag.etapa('fichas') as conteos:
+        db_fichas, indice_fichas, error = cargar_fichas_tecnicas(clave_fichas, file_fichas)
+        if not error:
+            conteos.update(fichas=len(indice_fichas['codigos']), parametros=int(indice_fichas['param_offsets'][-1]))
     if error:
         st.error(error)
-        st.stop()
+        detener()
+    cambios, _ = almacen_fichas(file_fichas, clave_fichas)
+    if cambios:
+        st.sidebar.caption(f"📚 Fichas versión {cambios['version']}: {len(cambios['nuevas'])} nuevas, "
+                           f"{len(cambios['modificadas'])} modificadas, {len(cambios['eliminadas'])} eliminadas, "
+                           f"{cambios['sin_cambios']} sin cambios.")
+
+    modo_lectura = 'hoja' if lectura_rapida else 'libro'
+    fin_rango = None
+    if origen_historial:
+        # Los libros subidos se suman al historial una vez por subida: la sesión recuerda (historial,
+        # nombre, hash) de lo ya ingerido, así los reruns (también los refrescos del trabajo) no releen nada
+        ingeridos = st.session_state.setdefault('libros_ingeridos', set())
+        id_historial = historial.identificador()
+        with diag.etapa('historial') as conteos:
+            ingresos = []
+            try:
+                for f in libros_planta or []:
+                    if (id_historial, f.name, clave_subida(f)) in ingeridos: continue
+                    ingresos.append(ingresar_historial(f, f.name))
+                    # El id se relee: la primera ingesta crea el historial
+                    id_historial = historial.identificador()
+                    ingeridos.add((id_historial, f.name, clave_subida(f)))
+            except (RuntimeError, ValueError, OSError) as e:
+                st.error(f"No se pudo agregar el libro al historial: {e}")
+                detener()
+            datos_historial = historial.resumen()
+            conteos.update(libros_ingeridos=sum(1 for i in ingresos if i['estado'] != 'sin_cambios'), **datos_historial)
+        for ingreso in ingresos:
+            if ingreso['estado'] != 'sin_cambios':
+                st.sidebar.caption(f"🗃️ {ingreso['libro']}: {ingreso['filas']} filas ({ingreso['estado']}).")
+        if not datos_historial['hojas']:
+            st.info("El historial está vacío: sube uno o más libros de planta.")
+            detener()
+        periodo = (f", del {datos_historial['desde'][:10]} al {datos_historial['hasta'][:10]}"
+                   if datos_historial['hasta'] else "")
+        st.sidebar.caption(f"🗃️ Historial: {datos_historial['libros']} libros, {datos_historial['filas']} filas{periodo}.")
+        clave_planta = historial.version()
+        modo_lectura = MODO_HISTORIAL
+        # El rango propuesto termina en el último día con datos
+        if datos_historial['hasta']:
+            fin_rango = min(datetime.fromisoformat(datos_historial['hasta']).date(), datetime.now().date())
+    else:
+        clave_planta = clave_subida(file_prod)
+
+    # --- MODO TODAS LAS HOJAS: reporte consolidado ---
+    if todas_hojas and origen_historial:
+        st.warning("'Procesar todas las hojas' trabaja sobre un libro subido; con el historial se elige una hoja.")
+    elif todas_hojas:
+        rango = selector_rango()
+        with diag.etapa('todas_las_hojas') as conteos:
+            reporte, errores, tiempos = etapa_libro(clave_fichas, clave_planta, modo_lectura, solo_retenidos, rango,
+                                                    estrategia_imputacion, modo_liviano, int(top_k), archivos)
+            conteos.update(hojas=len(tiempos), filas_reporte=len(reporte))
+        for error in errores:
+            st.warning(f"{error} (omitida)")
+
+        # Una fila por lote: su mejor candidato (rank 1) o rank vacío si no tuvo
+        filas_resumen = [{
+            'Hoja': f['hoja'],
+            'Folio': f['folio'],
+            'Lote': f['lote'],
+            'Producto': f"{f['producto']}{' (GF)' if f['gf'] else ''}",
+            'Motivo': f['motivo'],
+            'Mejor Cliente': (f['cliente'] + (" ⭐" if f['txt'] else "")) if f['rank'] else "Ninguno",
+            'Score': round(f['score'], 1) if f['rank'] else None,
+            'Match': f['match'] or "",
+            'Candidatos': f['n_compatibles']
+        } for f in reporte if f['rank'] in (None, 1)]
+
+        st.info(f"Procesando {len(filas_resumen)} lotes en {len(tiempos)} hojas "
+                f"(hoja más lenta: {max(tiempos.values(), default=0):.2f} s).")
+        with diag.etapa('render') as conteos:
+            conteos['lotes'] = len(filas_resumen)
+            tabla_paginada(filas_resumen)
+            st.download_button("⬇️ Descargar reporte consolidado (CSV)",
+                               pd.DataFrame(reporte, columns=COLUMNAS_REPORTE).to_csv(index=False).encode('utf-8'),
+                               file_name="redestino_todas_las_hojas.csv", mime="text/csv")
+            st.caption("Para ver el detalle por parámetro de un lote, desmarca 'Procesar todas las hojas' y elige su hoja.")
+        detener()
 
     # 2. SELECCIONAR HOJA
-    xls = pd.ExcelFile(file_prod)
-    hoja_sel = st.selectbox("Selecciona Hoja de Planta:", xls.sheet_names)
-    
-    # 3. CARGAR PLANTA
-    df_planta = cargar_planta_completa(file_prod, hoja_sel)
+    with diag.etapa('hojas'):
+        hojas = hojas_planta(clave_planta, modo_lectura, file_prod)
+    hoja_sel = st.selectbox("Selecciona Hoja de Planta:", hojas)
     
-    cols_planta_norm = {normalizar_texto(c): c for c in df_planta.columns}
-    
-    c_status = encontrar_columna_opt(cols_planta_norm, ['estado', 'status'])
-    c_lote = encontrar_columna_opt(cols_planta_norm, ['lote', 'batch', 'n° lote'])
-    c_folio = encontrar_columna_opt(cols_planta_norm, ['folio', 'id muestra'])
-    c_cond = encontrar_columna_opt(cols_planta_norm, ['condición', 'condicion', 'gf'])
-    c_tipo = encontrar_columna_opt(cols_planta_norm, ['tipo de producto', 'variedad'])
-    c_cli_orig = encontrar_columna_opt(cols_planta_norm, ['cliente', 'customer'])
-    c_motivo = encontrar_columna_opt(cols_planta_norm, ['motivo', 'razon'])
-    c_fecha = encontrar_columna_opt(cols_planta_norm, ['fecha etiqueta', 'fecha producción', 'date'])
-
-    col_agrupacion = c_lote if c_lote else c_folio
-
-    if not c_status:
+    # 3. CABECERA Y MAPEO (se resuelve todo contra la fila de títulos, sin cargar datos)
+    clave = (clave_fichas, clave_planta, hoja_sel, modo_lectura)
+    with diag.etapa('cabecera_y_mapeo') as conteos:
+        seleccion = etapa_columnas(clave, archivos)
+        conteos.update(columnas_cargadas=len(seleccion['cols_carga']),
+                       columnas_mapeadas=len(set(c for c in seleccion['mapa_nombres'].values() if c)))
+    meta = seleccion['meta']
+    mapa_nombres = seleccion['mapa_nombres']
+    cols_tech = seleccion['cols_tech']
+    c_lote, c_folio, c_tipo = meta['lote'], meta['folio'], meta['tipo']
+    c_cli_orig, c_motivo, c_fecha = meta['cli_orig'], meta['motivo'], meta['fecha']
+
+    if not meta['status']:
         st.error("❌ Falta columna ESTADO")
-        st.stop()
+        detener()
 
     # --- FILTRO FECHA ---
-    if c_fecha:
-        df_planta[c_fecha] = pd.to_datetime(df_planta[c_fecha], errors='coerce')
-        hoy = datetime.now().date()
-        date1, date2 = st.columns(2)
-        with date1:
-            rango = st.date_input("Filtrar Fecha:", (hoy - timedelta(days=30), hoy), format="DD/MM/YYYY")
-        
-        if isinstance(rango, tuple) and len(rango) == 2:
-            mask = (df_planta[c_fecha].dt.date >= rango[0]) & (df_planta[c_fecha].dt.date <= rango[1])
-            df_planta_filtrada = df_planta[mask].copy()
+    rango = selector_rango(fin_rango) if c_fecha else None
+
+    # 4. CARGA + IMPUTACIÓN + RETENIDOS (en caché)
+    # Mientras corre el trabajo de la vista por lote, la sesión guarda su clave y sus lotes: cada
+    # refresco con la misma clave los reutiliza en vez de volver a sacarlos de la caché
+    clave_trabajo = (clave, solo_retenidos, rango, estrategia_imputacion, modo_liviano, int(top_k), recordar_resultados)
+    en_curso = st.session_state.get('trabajo_candidatos')
+    if en_curso and (vista_inversa or en_curso['clave'] != clave_trabajo):
+        st.session_state.pop('trabajo_candidatos')
+        en_curso = None
+    with diag.etapa('carga_e_imputacion') as conteos:
+        if en_curso:
+            df_retenidos, mascara_ret = en_curso['lotes']
         else:
-            df_planta_filtrada = df_planta.copy()
-    else:
-        df_planta_filtrada = df_planta.copy()
-
-    # =========================================================
-    # 🚨 IMPUTACIÓN DE DATOS REFORZADA 🚨
-    # =========================================================
-    
-    # 1. FORZAR CONVERSIÓN NUMÉRICA
-    # Identificamos columnas que NO son metadatos y tratamos de convertirlas a números.
-    # Esto es crucial para que "Promedio Espesor" no se quede como 'object' si tiene NaNs o texto vacío.
-    cols_meta = [c_status, c_lote, c_folio, c_cond, c_tipo, c_cli_orig, c_motivo, c_fecha]
-    cols_potenciales = [c for c in df_planta_filtrada.columns if c not in cols_meta and c is not None]
-    
-    for col in cols_potenciales:
-        # errors='coerce' convierte texto no válido en NaN, permitiendo el cálculo de promedios
-        df_planta_filtrada[col] = pd.to_numeric(df_planta_filtrada[col], errors='coerce')
-
-    # 2. Selección de columnas numéricas (ahora sí incluye todas)
-    cols_num = df_planta_filtrada.select_dtypes(include=[np.number]).columns
-    
-    # 3. Crear máscara booleana de dónde faltan datos ANTES de rellenar
-    # (Para mostrar visualmente después)
-    mask_imputados = df_planta_filtrada[cols_num].isna()
-    
-    # 4. Calcular promedio global como respaldo
-    global_means = df_planta_filtrada[cols_num].mean() 
-    
-    # 5. Rellenar con promedio del LOTE (Prioridad 1)
-    if col_agrupacion:
-        df_planta_filtrada[cols_num] = df_planta_filtrada.groupby(col_agrupacion)[cols_num].transform(lambda x: x.fillna(x.mean()))
-    
-    # 6. Rellenar vacíos restantes con promedio GLOBAL (Prioridad 2)
-    df_planta_filtrada[cols_num] = df_planta_filtrada[cols_num].fillna(global_means)
-
-    # Filtrar Retenidos
-    mask_ret = df_planta_filtrada[c_status].astype(str).apply(normalizar_texto).str.contains('retenido', na=False)
-    df_retenidos = df_planta_filtrada[mask_ret]
-    
-    # Filtrar también la máscara de imputados para alinear índices
-    mask_imputados_ret = mask_imputados[mask_ret]
+            df_retenidos, mascara_ret = etapa_preparacion(clave, solo_retenidos, rango, estrategia_imputacion,
+                                                          modo_liviano, archivos)
+        conteos.update(lotes_retenidos=len(df_retenidos), columnas=df_retenidos.shape[1],
+                       mascara_imputados_kb=round(mascara_ret.nbytes / 1024, 1))
+        if modo_liviano or mostrar_diagnostico:
+            conteos['memoria_mb'] = memoria_mb(df_retenidos, mascara_ret)
+    # --- VISTA INVERSA: LOTES RETENIDOS QUE CUMPLEN UNA FICHA ---
+    if vista_inversa:
+        with diag.etapa('indice_inverso') as conteos:
+            indice_lotes = etapa_indice_inverso(clave, solo_retenidos, rango, estrategia_imputacion, modo_liviano, archivos)
+            conteos['columnas_indexadas'] = len(indice_lotes['ordenados'])
+        ficha_sel = st.selectbox("Ficha del pedido (Codigo FT):", range(len(indice_fichas['codigos'])),
+                                 format_func=lambda f: f"{indice_fichas['codigos'][f]} | {indice_fichas['cliente'][f]} | {indice_fichas['producto'][f]}")
+        with diag.etapa('busqueda_inversa') as conteos:
+            lotes_ficha = lotes_para_ficha(indice_lotes, indice_fichas, ficha_sel, hoja_sel)
+            conteos['lotes_compatibles'] = len(lotes_ficha)
+        if not lotes_ficha:
+            st.warning("Ningún lote retenido cumple esta ficha.")
+            detener()
+
+        st.success(f"🎯 {len(lotes_ficha)} lotes retenidos cumplen la ficha {indice_fichas['codigos'][ficha_sel]} "
+                   f"({indice_fichas['cliente'][ficha_sel]}).")
+        posiciones = [pos for pos, _, _ in lotes_ficha]
+        def textos_lotes(col, defecto):
+            return [str(v) for v in df_retenidos[col].iloc[posiciones].tolist()] if col else [defecto] * len(posiciones)
+
+        folios_inv = textos_lotes(c_folio, "") if c_folio else [f"{df_retenidos.index[p]}" for p in posiciones]
+        lotes_inv, tipos_inv, motivos_inv = textos_lotes(c_lote, "N/A"), textos_lotes(c_tipo, ""), textos_lotes(c_motivo, "")
+        filas_inversa = [{
+            'Folio': folios_inv[i],
+            'Lote': lotes_inv[i],
+            'Producto': f"{tipos_inv[i]}{' (GF)' if indice_lotes['es_gf_lotes'][pos] else ''}{' ⭐' if txt else ''}",
+            'Motivo': motivos_inv[i],
+            'Holgura %': round(holgura * 100, 1),
+        } for i, (pos, txt, holgura) in enumerate(lotes_ficha)]
+        st.caption("Orden: tipo de producto coincidente (⭐) y luego holgura, la menor distancia relativa de una medición "
+                   "al borde de su rango (50% = todas al centro).")
+        with diag.etapa('render') as conteos:
+            conteos['lotes'] = len(filas_inversa)
+            tabla_paginada(filas_inversa, clave="inversa")
+        detener()
+
+    # 5. COMPATIBILIDAD + TOP-K EN SEGUNDO PLANO: se muestra lo evaluado hasta ahora. Con las mismas
+    # entradas se retoma el mismo trabajo (en curso o terminado); si cambian, el anterior se cancela.
+    with diag.etapa('compatibilidad') as conteos:
+        if en_curso and not en_curso['trabajo'].cancelado:
+            trabajo = en_curso['trabajo']
+        else:
+            trabajo = trabajo_candidatos(*clave_trabajo, df_retenidos, mascara_ret, indice_fichas,
+                                         etapa_columnas(clave, archivos),
+                                         almacen_fichas(file_fichas, clave_fichas),
+                                         reintentar=st.session_state.pop('reintentar_trabajo', False))
+        trabajo.esperar(INTERVALO_REFRESCO, partes=1)
+        terminado, partes = trabajo.estado()
+        trabajo_en_curso = not terminado
+        if trabajo_en_curso:
+            st.session_state['trabajo_candidatos'] = {'clave': clave_trabajo, 'trabajo': trabajo,
+                                                      'lotes': (df_retenidos, mascara_ret)}
+        else:
+            st.session_state.pop('trabajo_candidatos', None)
+        if trabajo.error:
+            # El error queda a la vista (no se reintenta solo en cada rerun) hasta que se pida
+            st.error(f"Error evaluando los lotes: {trabajo.error}")
+            st.button("🔁 Reintentar", on_click=lambda: st.session_state.update(reintentar_trabajo=True))
+            detener()
+        es_gf_lotes = np.concatenate([p[1] for p in partes]) if partes else np.zeros(0, dtype=bool)
+        n_compatibles = np.concatenate([p[2] for p in partes]) if partes else np.zeros(0, dtype=np.int64)
+        tops = [top for p in partes for top in p[3]]
+        conteos.update(lotes_procesados=len(tops), tandas=len(partes), pares_compatibles=int(n_compatibles.sum()),
+                       en_curso=trabajo_en_curso)
+        # Caché persistente: (reutilizados, completados con fichas cambiadas, calculados) hasta la última tanda
+        reutilizados = partes[-1][4] if partes and partes[-1][4] else None
+        if reutilizados:
+            conteos.update(lotes_reutilizados=reutilizados[0], lotes_completados=reutilizados[1],
+                           lotes_calculados=reutilizados[2])
+        if reutilizados and mostrar_diagnostico:
+            try:
+                historico = estadisticas()
+            except (sqlite3.Error, OSError):
+                historico = None
+            if historico and historico['tasa_aciertos'] is not None:
+                conteos.update(cache_entradas=historico['entradas'], cache_tasa_aciertos=round(historico['tasa_aciertos'], 3))
 
     st.info(f"Procesando {len(df_retenidos)} lotes.")
-
-    # --- PRE-MAPEO COLUMNAS ---
-    mapa_columnas_fichas = {} 
-
-    for cod_ft, ficha in db_fichas.items():
-        mapa_columnas_fichas[cod_ft] = {}
+    if trabajo_en_curso:
+        st.progress(len(tops) / max(len(df_retenidos), 1),
+                    text=f"Evaluando lotes en segundo plano: {len(tops)} de {len(df_retenidos)}...")
+        if not partes:
+            refrescar()
+    elif mostrar_diagnostico:
+        st.caption(f"Compatibilidad evaluada en {trabajo.segundos:.2f} s ({len(partes)} tandas).")
+    if reutilizados:
+        st.caption(f"♻️ {reutilizados[0]} lotes reutilizados, {reutilizados[1]} completados solo con las fichas cambiadas "
+                   f"y {reutilizados[2]} calculados.")
+    if modo_liviano:
+        st.caption(f"🪶 Modo liviano: los lotes en memoria ocupan {diag.etapas['carga_e_imputacion']['memoria_mb']} MB "
+                   f"(mediciones en float32, metadatos como categorías).")
+
+    # --- RESUMEN POR LOTE (solo textos y el mejor candidato; nada de detalles) ---
+    with diag.etapa('resumen') as conteos:
+        def textos_columna(col):
+            return [str(v) for v in df_retenidos[col].tolist()]
+
+        folios = textos_columna(c_folio) if c_folio else [f"{idx}" for idx in df_retenidos.index]
+        lotes = textos_columna(c_lote) if c_lote else ["N/A"] * len(df_retenidos)
+        tipos = textos_columna(c_tipo) if c_tipo else [""] * len(df_retenidos)
+        motivos = textos_columna(c_motivo) if c_motivo else [""] * len(df_retenidos)
+
+        filas_resumen = []
+        for pos in range(len(tops)):
+            top = tops[pos]
+            gf_lbl = " (GF)" if es_gf_lotes[pos] else ""
+            mejor = indice_fichas['cliente'][top[0][0]] if top else "Ninguno"
+            if top and top[0][1] > 0: mejor += " ⭐"
+            filas_resumen.append({
+                'Folio': folios[pos],
+                'Lote': lotes[pos],
+                'Producto': f"{tipos[pos]}{gf_lbl}",
+                'Motivo': motivos[pos],
+                'Mejor Cliente': mejor,
+                'Score': round(top[0][2], 1) if top else None,
+                'Match': f"{top[0][3]}/{top[0][4]}" if top else "",
+                'Candidatos': int(n_compatibles[pos])
+            })
+        conteos['lotes'] = len(filas_resumen)
+
+    # --- DETALLE BAJO DEMANDA (solo para el lote que se abre) ---
+    def resumen_lote(pos, row):
+        datos_resumen = {}
+        for col in cols_tech:
+            val = row[col]
+            if isinstance(val, (int, float, np.number)):
+                 try: 
+                     fmt_val = f"{float(val):.2f}"
+                     if mascara_ret.valor(pos, col): fmt_val += " (Auto)"
+                     datos_resumen[col[:20]] = fmt_val
+                 except: pass
+        return datos_resumen
+
+    def detalle_ficha(pos, row, ficha):
+        # En una ficha compatible todo parámetro mapeado cumple: el detalle solo formatea
+        detalles = []
         for p in ficha['params']:
-            p_norm = p['nombre_norm']
-            col_match = None
+            col_real = mapa_nombres.get(p['nombre_norm'])
             
-            # 1. Exacta
-            if p_norm in cols_planta_norm:
-                col_match = cols_planta_norm[p_norm]
+            estado = "⚪"
+            val_str = "---"
             
-            # 2. Diccionario
-            if not col_match:
-                for key, aliases in MAPEO_PARAMETROS.items():
-                    if key in p_norm:
-                        for alias in aliases:
-                            alias_norm = normalizar_texto(alias)
-                            matches = [v for k,v in cols_planta_norm.items() if alias_norm in k]
-                            if matches:
-                                col_match = matches[0]
-                                break
-                    if col_match: break
-            
-            # 3. Espesor
-            if not col_match and p['tipo_param'] == 'espesor':
-                matches = [v for k,v in cols_planta_norm.items() if 'promedio' in k and 'espesor' in k]
-                if matches: col_match = matches[0]
-
-            # 4. Granulometría
-            if not col_match and p['tipo_param'] == 'malla':
-                for k, v in cols_planta_norm.items():
-                    if es_match_granulometria(p_norm, k):
-                        col_match = v
-                        break
-            
-            # 5. Difusa
-            if not col_match and p_norm != 'humedad':
-                best_r = 0
-                best_c = None
-                for k, v in cols_planta_norm.items():
-                    r = SequenceMatcher(None, p_norm, k).ratio()
-                    if r > best_r:
-                        best_r = r
-                        best_c = v
-                if best_r > 0.8: col_match = best_c
-
-            mapa_columnas_fichas[cod_ft][p['nombre']] = col_match
-
-    # --- BUCLE PRINCIPAL ---
-    fam_lote = detecting_fam = detectar_familia_hoja(hoja_sel)
-    es_hoja_gf = es_texto_gf(hoja_sel)
-
-    keys_tech = ['humedad', 'espesor', 'malla', 'ret', 'bajo', 'sobre', 'densidad', 'gelatina', 'quemada', 'peroxido', 'acidez', 'materia']
-
-    for idx, row in df_retenidos.iterrows():
-        folio_txt = str(row[c_folio]) if c_folio else f"{idx}"
-        lote_txt = str(row[c_lote]) if c_lote else "N/A"
-        cond_val = str(row[c_cond]) if c_cond else ""
-        es_lote_gf = es_hoja_gf or es_texto_gf(cond_val)
-        tipo_esp = str(row[c_tipo]) if c_tipo else ""
-        tipo_esp_norm = normalizar_texto(tipo_esp)
-        
-        datos_resumen = {}
-        for col in df_planta.columns:
-            cn = normalizar_texto(col)
-            if any(k in cn for k in keys_tech):
-                val = row[col]
+            if col_real:
+                val_str = f"{row[col_real]:.2f}"
                 
-                # Verificar imputación
-                es_imputado = False
-                if col in mask_imputados_ret.columns:
-                    if mask_imputados_ret.loc[idx, col]:
-                        es_imputado = True
-
-                if isinstance(val, (int, float, np.number)):
-                     try: 
-                         fmt_val = f"{float(val):.2f}"
-                         if es_imputado: fmt_val += " (Auto)"
-                         datos_resumen[col[:20]] = fmt_val
-                     except: pass
-
-        candidatos = []
-
-        for cod_ft, ficha in db_fichas.items():
+                # Marca visual SOLO en el string de visualización
+                if mascara_ret.valor(pos, col_real):
+                    val_str += " 🔄"
+                estado = "✅ Cumple"
             
-            if es_lote_gf:
-                if not ficha['es_gf']: continue
-            else:
-                if fam_lote in ['harina', 'hojuela', 'pillow'] and ficha['es_gf']: continue
-
-            if fam_lote != 'otros':
-                if fam_lote == 'hojuela' and ficha['familia_norm'] == 'harina': continue
-                if fam_lote == 'harina' and ficha['familia_norm'] == 'hojuela': continue
-                if ficha['familia_norm'] != fam_lote and ficha['familia_norm'] != 'otros':
-                     if not (fam_lote in ['hojuela', 'pillow'] and ficha['familia_norm'] in ['hojuela', 'pillow']):
-                         continue
-
-            score_txt = 0
-            if check_tipo_producto_score(tipo_esp_norm, ficha['producto_norm']): score_txt = 2
-
-            aciertos = 0
-            encontrados = 0
-            detalles = []
-            compatible = True
-
-            for p in ficha['params']:
-                col_real = mapa_columnas_fichas[cod_ft].get(p['nombre'])
-                
-                estado = "⚪"
-                val_str = "---"
-                
-                if col_real:
-                    encontrados += 1
-                    val_num = row[col_real] # Valor numérico REAL para el cálculo
-                    
-                    # Verificación de imputación para este parámetro específico
-                    es_imputado_param = False
-                    if col_real in mask_imputados_ret.columns:
-                        if mask_imputados_ret.loc[idx, col_real]:
-                            es_imputado_param = True
-
-                    if isinstance(val_num, (int, float, np.number)) and not np.isnan(val_num):
-                        val_str = f"{val_num:.2f}"
-                        
-                        # Marca visual SOLO en el string de visualización
-                        if es_imputado_param:
-                            val_str += " 🔄"
-                        
-                        # CÁLCULO MATEMÁTICO PURO (Sin afectar por la marca)
-                        if p['min'] <= val_num <= p['max']:
-                            aciertos += 1
-                            estado = "✅ Cumple"
-                        else:
-                            compatible = False
-                            estado = "❌ Fuera"
-                    else:
-                        compatible = False
-                        estado = "⚠️ Error"
-                        val_str = str(val_num)
-                
-                detalles.append({
-                    "Parámetro": p['nombre'],
-                    "Rango": f"{p['min']} - {p['max']}",
-                    "Columna": col_real if col_real else "No encontrada",
-                    "Valor": val_str,
-                    "Estado": estado
-                })
-
-            if compatible and encontrados > 0:
-                pct = (aciertos / encontrados) * 100
-                candidatos.append({
-                    'Cliente': ficha['cliente'],
-                    'Producto': ficha['producto'],
-                    'Score': pct,
-                    'Txt': score_txt,
-                    'Match': f"{aciertos}/{encontrados}",
-                    'Detalle': detalles,
-                    'N': encontrados
-                })
-
-        candidatos.sort(key=lambda x: (x['Txt'], x['Score'], x['N']), reverse=True)
-        
-        gf_lbl = " (GF)" if es_lote_gf else ""
-        motivo = str(row[c_motivo]) if c_motivo else ""
-        orig = str(row[c_cli_orig]) if c_cli_orig else ""
-        mejor = candidatos[0]['Cliente'] if candidatos else "Ninguno"
-        if candidatos and candidatos[0]['Txt']>0: mejor += " ⭐"
-
-        head = f"📦 Folio: {folio_txt} | Lote: {lote_txt} | Prod: {tipo_esp}{gf_lbl} | {motivo} ➡️ {mejor}"
-        
-        with st.expander(head):
+            detalles.append({
+                "Parámetro": p['nombre'],
+                "Rango": f"{p['min']} - {p['max']}",
+                "Columna": col_real if col_real else "No encontrada",
+                "Valor": val_str,
+                "Estado": estado
+            })
+        return detalles
+
+    # --- RESULTADOS: TABLA RESUMEN PAGINADA + DETALLE DE UN LOTE ---
+    with diag.etapa('render') as conteos:
+        desde, hasta = tabla_paginada(filas_resumen)
+
+        # Detalle bajo demanda: solo el lote elegido de la página actual
+        pos_sel = st.selectbox("Ver detalle del lote:", range(desde, hasta),
+                               format_func=lambda p: f"Folio: {filas_resumen[p]['Folio']} | Lote: {filas_resumen[p]['Lote']}")
+        fila_sel = filas_resumen[pos_sel]
+        row = df_retenidos.iloc[pos_sel]
+        conteos.update(lotes=len(filas_resumen), filas_pagina=hasta - desde, candidatos_detalle=len(tops[pos_sel]))
+        head = f"📦 Folio: {fila_sel['Folio']} | Lote: {fila_sel['Lote']} | Prod: {fila_sel['Producto']} | {fila_sel['Motivo']} ➡️ {fila_sel['Mejor Cliente']}"
+    
+        with st.expander(head, expanded=True):
+            datos_resumen = resumen_lote(pos_sel, row)
             if datos_resumen:
                 st.dataframe(pd.DataFrame([datos_resumen]), use_container_width=True, hide_index=True)
-            
-            if candidatos:
-                for c in candidatos:
-                    icon = "⭐" if c['Txt'] > 0 else "📄"
-                    sub_head = f"{icon} {c['Cliente']} | {c['Producto']} | {c['Score']:.0f}% ({c['Match']})"
+        
+            if tops[pos_sel]:
+                if n_compatibles[pos_sel] > len(tops[pos_sel]):
+                    st.caption(f"Mostrando los {len(tops[pos_sel])} mejores de {n_compatibles[pos_sel]} fichas compatibles.")
+                for f, txt, score, aciertos, encontrados in tops[pos_sel]:
+                    ficha = db_fichas[indice_fichas['codigos'][f]]
+                    icon = "⭐" if txt > 0 else "📄"
+                    sub_head = f"{icon} {ficha['cliente']} | {ficha['producto']} | {score:.0f}% ({aciertos}/{encontrados})"
                     with st.expander(sub_head):
-                        st.dataframe(pd.DataFrame(c['Detalle']), use_container_width=True, hide_index=True)
+                        st.dataframe(pd.DataFrame(detalle_ficha(pos_sel, row, ficha)), use_container_width=True, hide_index=True)
             else:
                 st.warning("Sin candidatos compatibles.")
+
+# Sin archivos o al terminar: el panel va al final (los cortes con detener() ya lo dibujaron)
+if trabajo_en_curso:
+    refrescar()
+panel_diagnostico()
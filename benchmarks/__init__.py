@@ -0,0 +1 @@
+# Benchmarks del proceso de redestinación con datos sintéticos.
@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+
+# ==========================================
+# 📊 COMPARACIÓN DE RESULTADOS DE BENCHMARK
+# ==========================================
+# python -m benchmarks.comparar base.json nuevo.json [--tolerancia 0.15]
+# Sale con código 1 si alguna etapa es más lenta que la base por sobre la tolerancia
+# (relativa) y además por más de --minimo-ms (las etapas de pocos ms son puro ruido).
+
+
+def comparar(base, nuevo, tolerancia=0.15, minimo_ms=5.0):
+    """Filas (etapa, s base, s nuevo, razón nuevo/base, ¿regresión?) de las etapas en común."""
+    filas = []
+    for etapa, datos in nuevo['etapas'].items():
+        if etapa not in base['etapas']: continue
+        t_base = base['etapas'][etapa]['segundos']
+        t_nuevo = datos['segundos']
+        razon = t_nuevo / t_base if t_base else float('inf')
+        regresion = razon > 1 + tolerancia and (t_nuevo - t_base) * 1000 > minimo_ms
+        filas.append((etapa, t_base, t_nuevo, razon, regresion))
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.comparar')
+    parser.add_argument('base')
+    parser.add_argument('nuevo')
+    parser.add_argument('--tolerancia', type=float, default=0.15, help="Aumento relativo permitido (defecto 0.15).")
+    parser.add_argument('--minimo-ms', type=float, default=5.0, help="Diferencia absoluta mínima para marcar (defecto 5 ms).")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding='utf-8') as fh: base = json.load(fh)
+    with open(args.nuevo, encoding='utf-8') as fh: nuevo = json.load(fh)
+
+    if base.get('escala') != nuevo.get('escala'):
+        print("⚠️ Las escalas no coinciden; la comparación es solo referencial.")
+    print(f"{'etapa':<24} {'base (ms)':>12} {'nuevo (ms)':>12} {'razón':>8}")
+    filas = comparar(base, nuevo, args.tolerancia, args.minimo_ms)
+    for etapa, t_base, t_nuevo, razon, regresion in filas:
+        marca = "  ❌" if regresion else ""
+        print(f"{etapa:<24} {t_base * 1000:12.1f} {t_nuevo * 1000:12.1f} {razon:8.2f}{marca}")
+    return 1 if any(f[4] for f in filas) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.sinteticos import generar_archivos
+
+# ==========================================
+# ⏱️ BENCHMARK POR ETAPA DEL PROCESO
+# ==========================================
+# python -m benchmarks.medir --escala mediana -o resultados.json
+# python -m benchmarks.comparar base.json resultados.json
+#
+# Mide por separado cada etapa del proceso de appV3 (lectura, normalización, mapeo,
+# imputación, compatibilidad, top-K) sobre libros sintéticos y escribe los tiempos y
+# conteos en JSON, para comparar entre commits. La caché de redestino se aísla en un
+# directorio temporal: las lecturas "xlsx" son en frío y las "cache" en caliente.
+
+ESCALAS = {
+    'chica': dict(n_fichas=50, n_lotes=1000, n_columnas=20),
+    'mediana': dict(n_fichas=500, n_lotes=20000, n_columnas=80),
+    'grande': dict(n_fichas=5000, n_lotes=200000, n_columnas=300),
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Cronometro:
+    def __init__(self, repeticiones):
+        self.repeticiones = repeticiones
+        self.etapas = {}
+
+    def una_vez(self, nombre, funcion):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        self.etapas[nombre] = {'segundos': time.perf_counter() - inicio, 'repeticiones': 1}
+        return resultado
+
+    def repetir(self, nombre, funcion, preparar=None):
+        """Mejor tiempo de `repeticiones` corridas; `preparar` arma la entrada fuera del tiempo medido."""
+        tiempos = []
+        for _ in range(self.repeticiones):
+            entrada = preparar() if preparar else None
+            inicio = time.perf_counter()
+            resultado = funcion(entrada) if preparar else funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        self.etapas[nombre] = {'segundos': min(tiempos), 'mediana': statistics.median(tiempos),
+                               'repeticiones': len(tiempos)}
+        return resultado
+
+
+def medir(ruta_fichas, ruta_planta, repeticiones=3, top_k=10):
+    # Import tardío: DIR_CACHE se lee al importar redestino
+    from redestino import columnas as mod_columnas
+    from redestino.fichas import compilar_fichas
+    from redestino.imputacion import convertir_numericas, imputar
+    from redestino.ingesta import leer_hoja, listar_hojas
+    from redestino.pipeline import (cabecera_planta, cargar_planta, evaluar_lotes, seleccionar_candidatos,
+                                    seleccionar_columnas)
+    from redestino.texto import contiene_normalizado, es_texto_gf_serie, normalizar_serie
+
+    crono = Cronometro(repeticiones)
+    hoja = listar_hojas(ruta_planta)[0]
+
+    # --- FICHAS ---
+    df_fichas = crono.una_vez('fichas_lectura_xlsx', lambda: leer_hoja(ruta_fichas, 0))
+    crono.repetir('fichas_lectura_cache', lambda: leer_hoja(ruta_fichas, 0))
+    indice, error = crono.repetir('fichas_compilacion', lambda: compilar_fichas(df_fichas))
+    if error:
+        raise ValueError(error)
+
+    # --- CABECERA Y MAPEO (en frío: sin memoria ni archivo de mapeos) ---
+    columnas_planta = crono.una_vez('planta_lectura_xlsx', lambda: cabecera_planta(ruta_planta, hoja))
+
+    def mapeo_en_frio(_):
+        return seleccionar_columnas(indice, columnas_planta)
+
+    def limpiar_mapeos():
+        mod_columnas._memo_mapeos.clear()
+        if os.path.exists(mod_columnas.ARCHIVO_CACHE_MAPEO):
+            os.remove(mod_columnas.ARCHIVO_CACHE_MAPEO)
+    seleccion = crono.repetir('mapeo_columnas', mapeo_en_frio, preparar=limpiar_mapeos)
+    meta = seleccion['meta']
+
+    # --- PLANTA (proyección de columnas desde la caché Parquet) ---
+    df_planta = crono.repetir('planta_lectura_cache', lambda: cargar_planta(ruta_planta, hoja, 'libro', seleccion['cols_carga']))
+
+    # --- NORMALIZACIÓN DE TEXTO ---
+    def normalizar():
+        mask_ret = contiene_normalizado(df_planta[meta['status']], 'retenido')
+        if meta['tipo']: normalizar_serie(df_planta[meta['tipo']])
+        if meta['cond']: es_texto_gf_serie(df_planta[meta['cond']])
+        return mask_ret
+    mask_ret = crono.repetir('normalizacion', normalizar)
+
+    # --- CONVERSIÓN E IMPUTACIÓN (cada corrida sobre una copia fresca) ---
+    cols_usadas = set(c for c in seleccion['mapa_nombres'].values() if c) | set(seleccion['cols_tech'])
+    cols_imputar = [c for c in df_planta.columns if c in cols_usadas]
+    cols_convertir = [c for c in cols_imputar if c not in seleccion['cols_meta']]
+    crono.repetir('conversion_numerica', lambda df: convertir_numericas(df, cols_convertir), preparar=df_planta.copy)
+    df_convertido = df_planta.copy()
+    convertir_numericas(df_convertido, cols_convertir)
+    crono.repetir('imputacion', lambda df: imputar(df, cols_imputar, meta['agrupacion'], col_fecha=meta['fecha']),
+                  preparar=df_convertido.copy)
+    imputar(df_convertido, cols_imputar, meta['agrupacion'], col_fecha=meta['fecha'])
+    df_retenidos = df_convertido[mask_ret.to_numpy()]
+
+    # --- COMPATIBILIDAD Y TOP-K ---
+    evaluacion = crono.repetir('compatibilidad', lambda: evaluar_lotes(df_retenidos, indice, seleccion, hoja))
+    n_compatibles, _ = crono.repetir('top_k', lambda: seleccionar_candidatos(evaluacion, indice, top_k))
+
+    pares = sum(int(r['compatible'].size) for _, r in evaluacion['resultados_gf'].values())
+    conteos = {
+        'fichas': len(indice['codigos']),
+        'parametros': int(indice['param_offsets'][-1]) if len(indice['param_offsets']) else 0,
+        'nombres_parametro': len(indice['nombres_norm']),
+        'columnas_planta': len(columnas_planta),
+        'columnas_cargadas': len(seleccion['cols_carga']),
+        'columnas_mapeadas': len(set(c for c in seleccion['mapa_nombres'].values() if c)),
+        'lotes': len(df_planta),
+        'lotes_retenidos': len(df_retenidos),
+        'pares_evaluados': pares,
+        'pares_compatibles': int(n_compatibles.sum()),
+    }
+    return crono.etapas, conteos
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.medir', description="Benchmark por etapa con datos sintéticos.")
+    parser.add_argument('--escala', choices=list(ESCALAS), default='chica', help="Escala predefinida (defecto: chica).")
+    parser.add_argument('--fichas', type=int, help="Cantidad de fichas (reemplaza la escala).")
+    parser.add_argument('--lotes', type=int, help="Lotes por hoja de planta (reemplaza la escala).")
+    parser.add_argument('--columnas', type=int, help="Columnas de medición (reemplaza la escala).")
+    parser.add_argument('--vacios', type=float, default=0.2, help="Fracción de mediciones vacías (defecto 0.2).")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--datos', default=os.path.join(tempfile.gettempdir(), 'redestino_bench'),
+                        help="Directorio donde se guardan los libros generados (se reutilizan).")
+    parser.add_argument('-o', '--salida', help="Archivo JSON de resultados (por defecto, salida estándar).")
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    escala = dict(ESCALAS[args.escala])
+    if args.fichas is not None: escala['n_fichas'] = args.fichas
+    if args.lotes is not None: escala['n_lotes'] = args.lotes
+    if args.columnas is not None: escala['n_columnas'] = args.columnas
+
+    inicio = time.perf_counter()
+    ruta_fichas, ruta_planta = generar_archivos(args.datos, frac_vacios=args.vacios, semilla=args.semilla, **escala)
+    print(f"Datos listos en {time.perf_counter() - inicio:.1f} s: {os.path.dirname(ruta_planta)}", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as dir_cache:
+        os.environ['REDESTINO_CACHE_DIR'] = dir_cache
+        etapas, conteos = medir(ruta_fichas, ruta_planta, args.repeticiones, args.top_k)
+
+    resultado = {
+        'commit': _commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'escala': dict(escala, nombre=args.escala, frac_vacios=args.vacios, semilla=args.semilla, top_k=args.top_k),
+        'etapas': etapas,
+        'conteos': conteos,
+    }
+
+    for nombre, datos in etapas.items():
+        print(f"  {nombre:<24} {datos['segundos'] * 1000:10.1f} ms", file=sys.stderr)
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as fh:
+            fh.write(texto + '\n')
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 🧪 DATOS SINTÉTICOS PARA BENCHMARKS
+# ==========================================
+# Libros de fichas técnicas y de planta con la forma de los reales: cabeceras en
+# español con variantes de escritura, columnas de malla (retenido / pasa), fechas,
+# estados mezclados y valores faltantes o con texto.
+
+FAMILIAS = ['Hojuela', 'Harina', 'Pillow', 'Avena Pelada', 'Hojuela GF', 'Otros']
+PRODUCTOS = ['Avena instantanea', 'Hojuela tradicional', 'Harina de avena fina', 'Avena pelada groat',
+             'Pillow rolled', 'Quick oats GF', 'Hojuela integral', 'Hojuela laminada estabilizada']
+HOJAS_PLANTA = ['Hojuela', 'Harina', 'Avena Pelada', 'Pillow GF']
+MALLAS = [4, 6, 8, 10, 12, 14, 16, 18, 20, 25, 30, 35, 40, 50, 60, 70, 80, 100]
+
+# (nombre en ficha, mínimo, máximo) con variantes de escritura
+PARAMETROS_FICHA = [
+    ('Humedad', 8, 12), ('Humedad (%)', 8, 12), ('Espesor', 0.5, 0.9), ('Espesor promedio', 0.5, 0.9),
+    ('Densidad Aparente', 300, 500), ('Hojuelas Quemadas', 0, 5), ('Hojuelas gelatinizadas', 0, 5),
+    ('Peróxidos', 0, 2), ('Indice de Acidez', 0, 1), ('Materias extrañas', 0, 1), ('Granos dañados', 0, 3),
+    ('Proteína', 10, 16), ('Cenizas totales', 0, 2), ('Fibra dietaria', 5, 12),
+]
+# (cabecera de planta, rango de valores generados)
+MEDICIONES_PLANTA = [
+    ('Humedad %', 7, 13), ('Promedio Espesor', 0.4, 1.0), ('Densidad', 280, 520), ('Quemadas', 0, 6),
+    ('Gelatinas', 0, 6), ('Ind Perioxido', 0, 3), ('Indice de Acidez', 0, 1.5), ('Mat extraña', 0, 1.2),
+    ('Grano dañado', 0, 4), ('Proteinas', 9, 17), ('Cenizas total', 0, 2.5), ('Fibra', 4, 13),
+]
+
+
+def generar_fichas(n_fichas=500, semilla=0):
+    """Fichas técnicas en formato largo (una fila por parámetro, como el Excel real)."""
+    rng = np.random.default_rng(semilla)
+    filas = []
+    for i in range(n_fichas):
+        cod = f"FT-{i:05d}"
+        cli = f"Cliente {i % max(1, n_fichas // 4)}"
+        fam = FAMILIAS[rng.integers(len(FAMILIAS))]
+        prod = PRODUCTOS[rng.integers(len(PRODUCTOS))]
+        n_params = int(rng.integers(2, 12))
+        elegidos = [PARAMETROS_FICHA[j] for j in rng.choice(len(PARAMETROS_FICHA), min(n_params, len(PARAMETROS_FICHA)), replace=False)]
+        # Parámetros de malla (retenido / bajo) con números de malla variados
+        for _ in range(int(rng.integers(0, 3))):
+            malla = MALLAS[rng.integers(len(MALLAS))]
+            elegidos.append((f"Malla {malla} Retención" if rng.random() < .5 else f"Bajo malla {malla}", 0, 20))
+        for nombre, lo, hi in elegidos:
+            a = round(float(rng.uniform(lo, (lo + hi) / 2)), 2)
+            b = round(float(rng.uniform((lo + hi) / 2, hi * 1.2)), 2)
+            filas.append([cod, cli, fam, prod, 'Analisis', nombre,
+                          a if rng.random() > .1 else None, b if rng.random() > .1 else None])
+        filas.append([cod, cli, fam, prod, 'Envase', 'Bolsa', None, None])
+    return pd.DataFrame(filas, columns=['Codigo FT', 'Cliente', 'Familia', 'Producto', 'Tipo', 'Analisis', 'Min', 'Max'])
+
+
+def generar_planta(n_lotes=10000, n_columnas=40, frac_vacios=0.2, semilla=0):
+    """Hoja de planta con metadatos + `n_columnas` columnas de medición (aprox.)."""
+    rng = np.random.default_rng(semilla)
+    n = n_lotes
+    df = pd.DataFrame({
+        'Fecha Etiqueta': pd.Timestamp.now().normalize() - pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+        'Folio': [f"F{i}" for i in range(n)],
+        'N° Lote': rng.integers(1, max(2, n // 3), n),
+        'Estado': rng.choice(['Retenido', 'RETENIDO ', 'Liberado', 'retenido.', None], n),
+        'Condición': rng.choice(['GF', 'Normal', '', 'Gluten free'], n),
+        'Tipo de Producto': rng.choice(['Instantanea', 'Tradicional', 'Integral', 'fina', 'groat', ''], n),
+        'Cliente': rng.choice(['A', 'B', 'C', 'D'], n),
+        'Motivo': rng.choice(['Humedad alta', 'Espesor', 'Color', 'Granulometría'], n),
+    })
+
+    cabeceras = []
+    for nombre, lo, hi in MEDICIONES_PLANTA:
+        cabeceras.append((nombre, lo, hi))
+    for malla in MALLAS:
+        cabeceras.append((f"Retenido Malla N° {malla}", 0, 25))
+        cabeceras.append((f"Pasa malla {malla}", 0, 12))
+    k = 1
+    while len(cabeceras) < n_columnas:
+        cabeceras.append((f"Espesor {k}" if k <= 10 else f"Medición auxiliar {k}", 0.4, 1.0))
+        k += 1
+
+    medidas = {}
+    for nombre, lo, hi in cabeceras[:n_columnas]:
+        valores = rng.uniform(lo, hi, n)
+        valores[rng.random(n) < frac_vacios] = np.nan
+        medidas[nombre] = valores
+    df = pd.concat([df, pd.DataFrame(medidas)], axis=1)
+
+    # Algunas celdas con texto (se convierten a NaN al imputar)
+    if n_columnas:
+        col_texto = cabeceras[2][0] if n_columnas > 2 else cabeceras[0][0]
+        df[col_texto] = df[col_texto].astype(object)
+        df.loc[rng.random(n) < .02, col_texto] = 'n/a'
+    return df
+
+
+def escribir_planta(ruta, hojas):
+    """Escribe {nombre_hoja: DataFrame} con una fila de título y la cabecera en la fila 1 (como el real)."""
+    with pd.ExcelWriter(ruta) as escritor:
+        for nombre, df in hojas.items():
+            df.to_excel(escritor, sheet_name=nombre, index=False, startrow=1)
+            escritor.sheets[nombre].cell(row=1, column=1, value='Control de calidad')
+
+
+def generar_archivos(directorio, n_fichas, n_lotes, n_columnas, n_hojas=1, frac_vacios=0.2, semilla=0):
+    """Genera (o reutiliza) fichas.xlsx y planta.xlsx para una escala. Devuelve sus rutas.
+
+    Los libros grandes tardan en escribirse, así que quedan guardados por escala y semilla.
+    """
+    nombre = f"f{n_fichas}_l{n_lotes}_c{n_columnas}_h{n_hojas}_v{frac_vacios}_s{semilla}"
+    destino = os.path.join(directorio, nombre)
+    ruta_fichas = os.path.join(destino, 'fichas.xlsx')
+    ruta_planta = os.path.join(destino, 'planta.xlsx')
+    if os.path.exists(ruta_fichas) and os.path.exists(ruta_planta):
+        return ruta_fichas, ruta_planta
+
+    os.makedirs(destino, exist_ok=True)
+    generar_fichas(n_fichas, semilla).to_excel(ruta_fichas, index=False)
+    hojas = {HOJAS_PLANTA[h % len(HOJAS_PLANTA)] + ('' if h < len(HOJAS_PLANTA) else f" {h}"):
+             generar_planta(n_lotes, n_columnas, frac_vacios, semilla + h) for h in range(n_hojas)}
+    escribir_planta(ruta_planta, hojas)
+    return ruta_fichas, ruta_planta
@@ -0,0 +1,47 @@
+import streamlit as st
+
+from redestino import diagnostico
+from redestino.almacen import ruta_almacen
+from redestino.catalogo import Catalogo
+from redestino.ingesta import hash_contenido, leer_bytes
+from redestino.pipeline import leer_fichas
+
+# ==========================================
+# 🗂️ RECURSOS COMPARTIDOS ENTRE LAS APPS
+# ==========================================
+# app.py, appV1.py y appV3.py importan el catálogo desde aquí: al ser la misma función
+# en caché (st.cache_resource), un servidor que sirve las tres vistas guarda UNA copia
+# del catálogo por contenido de archivo, compartida por todas las sesiones. Solo appV3
+# (que reutiliza resultados por versión de ficha) lo registra además en el almacén
+# versionado, en un paso aparte: el catálogo es el mismo objeto para las tres apps.
+
+def clave_archivo(file):
+    return hash_contenido(leer_bytes(file))
+
+@st.cache_resource(max_entries=4)
+def _catalogo(clave, _file):
+    diag = diagnostico.actual()
+    if diag: diag.fallo_cache('catalogo_fichas')
+    return Catalogo(leer_fichas(_file))
+
+def catalogo_fichas(file, clave=None):
+    """Catálogo del archivo de fichas (se lee una vez por contenido)."""
+    diag = diagnostico.actual()
+    if diag: diag.llamada_cache('catalogo_fichas')
+    return _catalogo(clave or clave_archivo(file), file)
+
+@st.cache_resource(max_entries=8)
+def _almacen(clave, nombre, _file):
+    diag = diagnostico.actual()
+    if diag: diag.fallo_cache('almacen_fichas')
+    # Solo en un fallo (contenido o nombre nuevo): el almacén del libro reescribe únicamente las fichas que cambiaron
+    return _catalogo(clave, _file).sincronizar_almacen(ruta_almacen(nombre))
+
+def almacen_fichas(file, clave=None):
+    """(resumen de cambios, versiones por código) del almacén propio del libro (por nombre de archivo).
+
+    Una sincronización por (contenido, nombre); lo entregado se comparte y no se debe modificar.
+    """
+    diag = diagnostico.actual()
+    if diag: diag.llamada_cache('almacen_fichas')
+    return _almacen(clave or clave_archivo(file), getattr(file, 'name', None) or 'fichas', file)
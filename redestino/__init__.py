@@ -0,0 +1 @@
+# Lógica compartida de redestinación (sin dependencia de Streamlit).
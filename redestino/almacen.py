@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from redestino.config import DIR_CACHE
+
+# ==========================================
+# 🗄️ ALMACÉN INCREMENTAL DE FICHAS (SQLite)
+# ==========================================
+# Cada ficha (grupo de filas de un mismo Codigo FT) se registra con una huella de su
+# contenido (no se copian sus filas: el libro subido es la fuente). Al subir una nueva
+# versión del libro solo se reescriben las fichas cuya huella cambió y se borran las
+# que ya no están. El almacén lleva un número de versión
+# que sube en cada sincronización con cambios; cada ficha recuerda la versión en que
+# cambió por última vez, así lo que depende de una ficha se invalida solo para ella.
+# Cada libro de fichas (por nombre de archivo) tiene su propio almacén: si dos libros
+# distintos compartieran uno, cada sincronización borraría las fichas del otro.
+
+DIR_ALMACENES = os.path.join(DIR_CACHE, 'fichas')
+# Sube si cambia el esquema (cada formato usa su propio archivo)
+VERSION_FORMATO = 2
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS fichas (
+    codigo TEXT PRIMARY KEY,
+    huella TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def ruta_almacen(nombre):
+    """Archivo del almacén del libro de fichas `nombre` (legible + hash del nombre completo)."""
+    nombre = str(nombre)
+    legible = re.sub(r'[^\w-]+', '_', os.path.splitext(os.path.basename(nombre))[0])[:40]
+    sufijo = hashlib.blake2b(f"{VERSION_FORMATO}:{nombre}".encode('utf-8'), digest_size=6).hexdigest()
+    return os.path.join(DIR_ALMACENES, f"{legible}-{sufijo}.sqlite")
+
+
+@contextmanager
+def _conexion(ruta):
+    """Conexión en una transacción (commit al salir sin errores) que siempre se cierra."""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    conn = sqlite3.connect(ruta, timeout=30)
+    try:
+        conn.executescript(_ESQUEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _version(conn):
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()
+    return int(fila[0]) if fila else 0
+
+
+def _id_almacen(conn):
+    """Identificador del archivo del almacén: uno recreado vuelve a contar versiones desde 1."""
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = 'id'").fetchone()
+    if fila: return fila[0]
+    nuevo = uuid.uuid4().hex
+    conn.execute("INSERT INTO meta (clave, valor) VALUES ('id', ?)", (nuevo,))
+    return nuevo
+
+
+def _canonico(v):
+    """Texto estable de una celda: 5, 5.0 y np.float64(5) dan lo mismo (el dtype de la
+    columna cambia con un solo valor vacío o de texto y no debe alterar las demás fichas)."""
+    if isinstance(v, (bool, np.bool_)): return f"b:{v}"
+    if isinstance(v, (int, float, np.number)): return f"n:{float(v)!r}"
+    if isinstance(v, (pd.Timestamp, datetime)): return f"t:{pd.Timestamp(v).isoformat()}"
+    return f"s:{v}"
+
+
+def huellas_fichas(df, col_codigo):
+    """{codigo (texto): huella} por grupo de Codigo FT, sin códigos vacíos.
+
+    La huella cubre los nombres de columna y los valores de las filas del grupo en orden.
+    """
+    canonicas = {}
+    for j, col in enumerate(df.columns):
+        # Una conversión por valor único; los vacíos (-1) caen en el último texto
+        codigos, unicos = pd.factorize(df.iloc[:, j])
+        canonicas[j] = np.array([_canonico(u) for u in unicos] + [''], dtype=object)[codigos]
+    hash_filas = pd.util.hash_pandas_object(pd.DataFrame(canonicas), index=False).to_numpy()
+    base = repr([str(c) for c in df.columns]).encode('utf-8')
+    huellas = {}
+    for codigo, pos in df.groupby(col_codigo, sort=False).indices.items():
+        pos = np.sort(pos)
+        h = hashlib.blake2b(base, digest_size=16)
+        h.update(hash_filas[pos].tobytes())
+        huellas[str(codigo)] = h.hexdigest()
+    return huellas
+
+
+def sincronizar(df, col_codigo, ruta):
+    """Lleva el almacén al contenido de `df`. Devuelve el resumen de cambios.
+
+    {'almacen', 'version', 'nuevas', 'modificadas', 'eliminadas', 'sin_cambios'}; las tres
+    listas tienen códigos (texto). La versión solo sube si hubo algún cambio y solo tiene
+    sentido junto al identificador `almacen`.
+    """
+    huellas = huellas_fichas(df, col_codigo)
+    with _conexion(ruta) as conn:
+        # Bloqueo de escritura desde la lectura: dos sincronizaciones no se pisan
+        conn.execute("BEGIN IMMEDIATE")
+        guardadas = dict(conn.execute("SELECT codigo, huella FROM fichas"))
+        nuevas = [c for c in huellas if c not in guardadas]
+        modificadas = [c for c in huellas if c in guardadas and guardadas[c] != huellas[c]]
+        eliminadas = [c for c in guardadas if c not in huellas]
+
+        id_almacen = _id_almacen(conn)
+        version = _version(conn)
+        if nuevas or modificadas or eliminadas:
+            version += 1
+            conn.executemany("INSERT OR REPLACE INTO fichas (codigo, huella, version) VALUES (?, ?, ?)",
+                             ((c, huellas[c], version) for c in nuevas + modificadas))
+            conn.executemany("DELETE FROM fichas WHERE codigo = ?", ((c,) for c in eliminadas))
+            conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('version', ?)", (str(version),))
+    return {
+        'almacen': id_almacen,
+        'version': version,
+        'nuevas': nuevas,
+        'modificadas': modificadas,
+        'eliminadas': eliminadas,
+        'sin_cambios': len(huellas) - len(nuevas) - len(modificadas),
+    }
+
+
+def versiones(ruta):
+    """{codigo: versión del almacén en que la ficha cambió por última vez}."""
+    with _conexion(ruta) as conn:
+        return dict(conn.execute("SELECT codigo, version FROM fichas"))
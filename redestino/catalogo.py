@@ -0,0 +1,106 @@
+import sqlite3
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from redestino import almacen
+from redestino.fichas import compilar_fichas, detectar_columnas_fichas, fichas_como_dict
+from redestino.intervalos import IndiceIntervalos
+
+# ==========================================
+# 🗂️ CATÁLOGO DE FICHAS PRE-AGRUPADO
+# ==========================================
+# El archivo de fichas se lee una vez y se agrupa por Producto, (Producto, Cliente) y
+# (Producto, Analisis): elegir un producto o recorrer sus clientes es una búsqueda en
+# un dict en vez de una máscara sobre todo el DataFrame. Las vistas de cada app
+# (índice de intervalos, índice compilado del motor) se arman al primer uso.
+#
+# El catálogo se comparte entre sesiones: nada de lo que entrega se debe modificar.
+
+
+def _posiciones(df, columnas):
+    """{clave: posiciones de fila ordenadas} sin grupos de claves nulas."""
+    return {k: np.sort(v) for k, v in df.groupby(columnas, sort=False).indices.items()}
+
+
+class Catalogo:
+    def __init__(self, df):
+        if 'Minimo' in df.columns and 'Maximo' in df.columns:
+            # Límites numéricos (texto y vacíos -> NaN) para los filtros por valor, en un
+            # frame nuevo: el que se recibe no se modifica
+            df = df.assign(Minimo_num=pd.to_numeric(df['Minimo'], errors='coerce'),
+                           Maximo_num=pd.to_numeric(df['Maximo'], errors='coerce'))
+        self.df = df
+        self.productos = list(df['Producto'].dropna().unique()) if 'Producto' in df.columns else []
+
+    def sincronizar_almacen(self, ruta):
+        """Registra el contenido en el almacén incremental `ruta` (solo fichas con Codigo FT).
+
+        Devuelve (resumen de cambios, {codigo: versión en que cambió}) o (None, {}) sin
+        almacén. No guarda nada en el catálogo, que se comparte entre libros de igual contenido.
+        """
+        col_codigo = detectar_columnas_fichas(self.df.columns)['cod']
+        if not col_codigo: return None, {}
+        try:
+            return almacen.sincronizar(self.df, col_codigo, ruta), almacen.versiones(ruta)
+        except (sqlite3.Error, OSError):
+            # Sin almacén (disco de solo lectura, archivo bloqueado): se sigue sin versiones
+            return None, {}
+
+    @cached_property
+    def _por_producto(self):
+        return _posiciones(self.df, 'Producto')
+
+    @cached_property
+    def _por_cliente(self):
+        # Cliente vacío agrupado bajo None (como isin, que también lo encuentra)
+        grupos = self.df.groupby(['Producto', 'Cliente'], sort=False, dropna=False).indices
+        return {(p, None if pd.isna(c) else c): np.sort(pos) for (p, c), pos in grupos.items() if not pd.isna(p)}
+
+    @cached_property
+    def _por_analisis(self):
+        return _posiciones(self.df, ['Producto', 'Analisis'])
+
+    @cached_property
+    def _clientes_analisis(self):
+        """{producto: {cliente: posiciones}} de las filas Tipo = 'analisis', clientes en orden de aparición."""
+        filas = np.flatnonzero((self.df['Tipo'].astype(str).str.lower() == 'analisis').to_numpy())
+        # Igual que Series.unique(), un cliente vacío también cuenta como grupo
+        grupos = self.df.iloc[filas].groupby(['Producto', 'Cliente'], sort=False, dropna=False).indices
+        por_producto = {}
+        for (producto, cliente), pos in sorted(grupos.items(), key=lambda kv: kv[1][0]):
+            if pd.isna(producto): continue
+            por_producto.setdefault(producto, {})[cliente] = filas[pos]
+        return por_producto
+
+    def _filas(self, grupos, clave):
+        return self.df.iloc[grupos.get(clave, np.empty(0, dtype=np.int64))]
+
+    def filas_producto(self, producto):
+        return self._filas(self._por_producto, producto)
+
+    def filas_analisis(self, producto, analisis):
+        return self._filas(self._por_analisis, (producto, analisis))
+
+    def filas_clientes(self, producto, clientes):
+        """Filas del producto de los `clientes` indicados, en el orden del archivo."""
+        claves = {(producto, None if pd.isna(c) else c) for c in clientes}
+        pos = [self._por_cliente[k] for k in claves if k in self._por_cliente]
+        return self.df.iloc[np.sort(np.concatenate(pos)) if pos else np.empty(0, dtype=np.int64)]
+
+    def analisis_por_cliente(self, producto):
+        """{cliente: filas Tipo = 'analisis'} del producto."""
+        return {c: self.df.iloc[pos] for c, pos in self._clientes_analisis.get(producto, {}).items()}
+
+    @cached_property
+    def intervalos(self):
+        return IndiceIntervalos(self.df)
+
+    @cached_property
+    def fichas(self):
+        """(índice compilado, vista dict-of-dicts, error) para el motor de appV3."""
+        indice, error = compilar_fichas(self.df)
+        if error:
+            return None, None, error
+        return indice, fichas_como_dict(indice), None
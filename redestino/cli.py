@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import date
+
+from redestino.imputacion import ESTRATEGIAS_IMPUTACION
+from redestino.ingesta import listar_hojas
+from redestino.paralelo import procesar_libro
+from redestino.pipeline import COLUMNAS_REPORTE, cargar_fichas, procesar_hoja
+
+# ==========================================
+# 🖥️ LÍNEA DE COMANDOS (PROCESO SIN INTERFAZ)
+# ==========================================
+# python -m redestino match --planta planta.xlsx --fichas fichas.xlsx --sheet Hojuela \
+#     --from 2024-01-01 --to 2024-01-31 -o resultados.csv
+#
+# Con --todas se procesan todas las hojas del libro en procesos paralelos y se escribe
+# un solo reporte consolidado (columna 'hoja').
+#
+# Misma carga, mapeo, imputación y compatibilidad que appV3. Los resultados se escriben
+# tanda por tanda (una fila por lote y candidato), así la memoria no crece con la
+# cantidad de lotes procesados.
+
+FORMATOS = ['csv', 'jsonl', 'parquet']
+
+
+# --- ESCRITORES POR FORMATO ---
+class _EscritorCsv:
+    def __init__(self, salida):
+        self._fh = sys.stdout if salida == '-' else open(salida, 'w', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(self._fh, fieldnames=COLUMNAS_REPORTE)
+        self._csv.writeheader()
+
+    def escribir(self, filas):
+        self._csv.writerows(filas)
+
+    def cerrar(self):
+        if self._fh is not sys.stdout: self._fh.close()
+
+
+class _EscritorJsonl:
+    def __init__(self, salida):
+        self._fh = sys.stdout if salida == '-' else open(salida, 'w', encoding='utf-8')
+
+    def escribir(self, filas):
+        for fila in filas:
+            self._fh.write(json.dumps(fila, ensure_ascii=False, default=str) + '\n')
+
+    def cerrar(self):
+        if self._fh is not sys.stdout: self._fh.close()
+
+
+class _EscritorParquet:
+    # Cada tanda queda como un row group: nunca se arma la tabla completa en memoria
+    def __init__(self, salida):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tipos = {'gf': pa.bool_(), 'n_compatibles': pa.int64(), 'rank': pa.int64(), 'score': pa.float64(), 'txt': pa.int64()}
+        self._pa = pa
+        self._esquema = pa.schema([(c, tipos.get(c, pa.string())) for c in COLUMNAS_REPORTE])
+        self._pq = pq.ParquetWriter(salida, self._esquema)
+
+    def escribir(self, filas):
+        if filas:
+            self._pq.write_table(self._pa.Table.from_pylist(filas, schema=self._esquema))
+
+    def cerrar(self):
+        self._pq.close()
+
+
+ESCRITORES = {'csv': _EscritorCsv, 'jsonl': _EscritorJsonl, 'parquet': _EscritorParquet}
+
+
+def _formato_de(args):
+    if args.formato: return args.formato
+    for formato in FORMATOS:
+        if args.salida.lower().endswith('.' + formato): return formato
+    return 'csv'
+
+
+def _fecha(texto):
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida '{texto}' (use AAAA-MM-DD)")
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m redestino', description="Redestinación de lotes retenidos sin interfaz.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    match = sub.add_parser('match', help="Busca fichas compatibles para los lotes retenidos de una hoja de planta.")
+    match.add_argument('--planta', required=True, help="Excel de planta (control).")
+    match.add_argument('--fichas', required=True, help="Fichas técnicas (Excel o CSV).")
+    match.add_argument('--sheet', '--hoja', dest='hoja', help="Hoja de planta (por defecto la primera).")
+    match.add_argument('--todas', action='store_true', help="Procesar todas las hojas en paralelo (reporte consolidado).")
+    match.add_argument('--procesos', type=int, help="Procesos para --todas (por defecto uno por núcleo).")
+    match.add_argument('--from', '--desde', dest='desde', type=_fecha, help="Fecha inicial (AAAA-MM-DD).")
+    match.add_argument('--to', '--hasta', dest='hasta', type=_fecha, help="Fecha final (AAAA-MM-DD).")
+    match.add_argument('-o', '--salida', default='-', help="Archivo de salida ('-' = salida estándar, CSV/JSONL).")
+    match.add_argument('--formato', choices=FORMATOS, help="Formato de salida (por defecto según la extensión).")
+    match.add_argument('--top-k', type=int, default=10, help="Candidatos por lote (defecto 10).")
+    match.add_argument('--estrategia', choices=list(ESTRATEGIAS_IMPUTACION), default='media', help="Imputación de vacíos.")
+    match.add_argument('--solo-retenidos', action='store_true', help="Cargar solo filas retenidas.")
+    match.add_argument('--lectura-rapida', action='store_true', help="Parsear solo la hoja pedida (libros muy grandes).")
+    match.add_argument('--liviano', action='store_true', help="Menos memoria: mediciones en float32 y metadatos como categorías.")
+    match.add_argument('--tanda', type=int, default=5000, help="Lotes evaluados por tanda (defecto 5000).")
+    return parser
+
+
+def comando_match(args):
+    formato = _formato_de(args)
+    if formato == 'parquet' and args.salida == '-':
+        print("❌ Parquet necesita un archivo de salida (-o)", file=sys.stderr)
+        return 2
+
+    inicio = time.perf_counter()
+    indice, error = cargar_fichas(args.fichas)
+    if error:
+        print(f"❌ {error}", file=sys.stderr)
+        return 1
+
+    rango = None
+    if args.desde or args.hasta:
+        rango = (args.desde or date.min, args.hasta or date.max)
+    opciones = dict(rango=rango, estrategia=args.estrategia, modo='hoja' if args.lectura_rapida else 'libro',
+                    solo_retenidos=args.solo_retenidos, top_k=args.top_k, tamano_tanda=args.tanda, liviano=args.liviano)
+
+    escritor = ESCRITORES[formato](args.salida)
+    n_lotes = n_filas = 0
+    try:
+        if args.todas:
+            # Cada hoja llega completa desde su proceso; se escribe en el orden del libro
+            for hoja, filas, error, segundos in procesar_libro(args.planta, indice, procesos=args.procesos, **opciones):
+                if error:
+                    print(f"⚠️ {error} (omitida)", file=sys.stderr)
+                    continue
+                escritor.escribir(filas)
+                n_filas += len(filas)
+                lotes_hoja = sum(1 for f in filas if f['rank'] in (None, 1))
+                n_lotes += lotes_hoja
+                print(f"   Hoja '{hoja}': {lotes_hoja} lotes en {segundos:.2f} s", file=sys.stderr)
+            hoja = 'todas'
+        else:
+            hoja = args.hoja if args.hoja is not None else listar_hojas(args.planta)[0]
+            for filas in procesar_hoja(args.planta, indice, hoja, **opciones):
+                escritor.escribir(filas)
+                n_filas += len(filas)
+                # Cada lote aporta exactamente una fila con rank 1 (o vacío si no tuvo candidatos)
+                n_lotes += sum(1 for f in filas if f['rank'] in (None, 1))
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        escritor.cerrar()
+
+    segundos = time.perf_counter() - inicio
+    print(f"✅ Hoja '{hoja}': {n_lotes} lotes, {n_filas} filas en {segundos:.2f} s "
+          f"({n_lotes / segundos if segundos else 0:.0f} lotes/s)", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    if args.comando == 'match':
+        return comando_match(args)
+    return 2
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from redestino.config import DIR_CACHE
+from redestino.difuso import IndiceDifuso
+from redestino.texto import normalizar_texto
+
+# ==========================================
+# 🧭 RESOLUCIÓN DE COLUMNAS DE PLANTA
+# ==========================================
+MAPEO_PARAMETROS = {
+    'hojuelas quemadas': ['quemadas', "quemada"],
+    'hojuelas gelatinizadas': ['gelatinas', 'gelatina', 'gelatinizadas'],
+    'materias extrañas': ['mat extraña', 'materia extraña', 'impurezas'],
+    'materia extraña': ['mat extraña', 'materia extraña', 'impurezas'],
+    'granos dañados': ['dañados', 'grano dañado'],
+    'densidad aparente': ['densidad', 'peso hectolitrico', 'peso especifico'],
+    'peroxidos': ['ind perioxido', 'peroxido', 'indice de peroxido'],
+    'acidez': ['acidez', 'indice de acidez']
+}
+
+# Subir si cambian las estrategias de resolución (invalida el caché en disco)
+VERSION_RESOLUTOR = 1
+ARCHIVO_CACHE_MAPEO = os.path.join(DIR_CACHE, 'mapeo_columnas.json')
+MAX_FIRMAS_CACHE = 50
+
+
+def encontrar_columna_opt(cols_norm_dict, keywords):
+    for key in keywords:
+        key_norm = normalizar_texto(key)
+        for col_norm, col_real in cols_norm_dict.items():
+            if key_norm in col_norm: return col_real
+    return None
+
+def detectar_metadatos(columnas_planta):
+    """Columnas de metadatos de una hoja de planta (None si no está): estado, lote, folio..."""
+    cols_planta_norm = {normalizar_texto(c): c for c in columnas_planta}
+    meta = {
+        'status': encontrar_columna_opt(cols_planta_norm, ['estado', 'status']),
+        'lote': encontrar_columna_opt(cols_planta_norm, ['lote', 'batch', 'n° lote']),
+        'folio': encontrar_columna_opt(cols_planta_norm, ['folio', 'id muestra']),
+        'cond': encontrar_columna_opt(cols_planta_norm, ['condición', 'condicion', 'gf']),
+        'tipo': encontrar_columna_opt(cols_planta_norm, ['tipo de producto', 'variedad']),
+        'cli_orig': encontrar_columna_opt(cols_planta_norm, ['cliente', 'customer']),
+        'motivo': encontrar_columna_opt(cols_planta_norm, ['motivo', 'razon']),
+        'fecha': encontrar_columna_opt(cols_planta_norm, ['fecha etiqueta', 'fecha producción', 'date']),
+    }
+    meta['agrupacion'] = meta['lote'] if meta['lote'] else meta['folio']
+    return meta
+
+def es_match_granulometria(header_ficha_norm, header_planta_norm):
+    nums_f = re.search(r'\d+', header_ficha_norm)
+    nums_p = re.search(r'\d+', header_planta_norm)
+
+    if not nums_f or not nums_p: return False
+    if nums_f.group() != nums_p.group(): return False
+
+    vocab_bajo = {'a traves', 'bajo', 'pasa', 'menor', '<', 'fondo', 'base', 'minus'}
+    vocab_sobre = {'retencion', 'retenido', 'sobre', 'arriba', 'mayor', '>', 'encima', 'ret'}
+
+    dir_f = 'bajo' if any(k in header_ficha_norm for k in vocab_bajo) else ('sobre' if any(k in header_ficha_norm for k in vocab_sobre) else 'u')
+    dir_p = 'bajo' if any(k in header_planta_norm for k in vocab_bajo) else ('sobre' if any(k in header_planta_norm for k in vocab_sobre) else 'u')
+
+    return dir_f != 'u' and dir_p != 'u' and dir_f == dir_p
+
+
+def resolver_columna(p_norm, tipo_param, cols_planta_norm, indice_difuso=None):
+    """Busca la columna de planta para un parámetro normalizado (5 estrategias en cascada).
+
+    `indice_difuso` permite reutilizar el índice de la estrategia 5 entre varios parámetros.
+    """
+    col_match = None
+
+    # 1. Exacta
+    if p_norm in cols_planta_norm:
+        col_match = cols_planta_norm[p_norm]
+
+    # 2. Diccionario
+    if not col_match:
+        for key, aliases in MAPEO_PARAMETROS.items():
+            if key in p_norm:
+                for alias in aliases:
+                    alias_norm = normalizar_texto(alias)
+                    matches = [v for k,v in cols_planta_norm.items() if alias_norm in k]
+                    if matches:
+                        col_match = matches[0]
+                        break
+            if col_match: break
+
+    # 3. Espesor
+    if not col_match and tipo_param == 'espesor':
+        matches = [v for k,v in cols_planta_norm.items() if 'promedio' in k and 'espesor' in k]
+        if matches: col_match = matches[0]
+
+    # 4. Granulometría
+    if not col_match and tipo_param == 'malla':
+        for k, v in cols_planta_norm.items():
+            if es_match_granulometria(p_norm, k):
+                col_match = v
+                break
+
+    # 5. Difusa (ratio de SequenceMatcher > 0.8, vía índice de n-gramas)
+    if not col_match and p_norm != 'humedad':
+        if indice_difuso is None:
+            indice_difuso = IndiceDifuso(cols_planta_norm)
+        col_match = indice_difuso.mejor(p_norm, 0.8)
+
+    return col_match
+
+
+# --- MAPEO DEDUPLICADO Y PERSISTENTE ---
+# firma de cabeceras -> {nombre_norm: posición de la columna en la hoja (o None)}, solo las
+# MAX_FIRMAS_CACHE más recientes. Las sesiones lo comparten desde varios hilos: se consulta y
+# actualiza bajo el lock, y un mapeo guardado no se modifica (se reemplaza por una copia).
+_memo_mapeos = OrderedDict()
+_lock_mapeos = threading.Lock()
+
+
+def firma_cabeceras(columnas):
+    """Firma estable de las cabeceras de planta (orden incluido) y de las reglas de mapeo."""
+    base = repr([VERSION_RESOLUTOR, MAPEO_PARAMETROS, [repr(c) for c in columnas]])
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def _leer_cache_disco():
+    try:
+        with open(ARCHIVO_CACHE_MAPEO, encoding='utf-8') as fh:
+            datos = json.load(fh)
+        return datos if isinstance(datos, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_cache_disco(firma, posiciones):
+    datos = _leer_cache_disco()
+    datos.pop(firma, None)
+    datos[firma] = posiciones
+    # Se conservan solo las firmas más recientes
+    for vieja in list(datos)[:-MAX_FIRMAS_CACHE]:
+        del datos[vieja]
+    try:
+        os.makedirs(DIR_CACHE, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=DIR_CACHE, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(datos, fh, ensure_ascii=False)
+        os.replace(tmp, ARCHIVO_CACHE_MAPEO)
+    except OSError:
+        pass
+
+
+def resolver_mapeo(nombres_norm, tipos_param, columnas):
+    """Resuelve cada `nombre_norm` único una sola vez por juego de cabeceras.
+
+    `nombres_norm` y `tipos_param` son paralelos (nombres internados del índice de fichas).
+    Devuelve {nombre_norm: columna real o None}. Los resultados se memorizan por firma de
+    cabeceras en memoria y en un archivo local, así que una sesión posterior con el
+    mismo formato de planta no vuelve a resolver nada.
+    """
+    columnas = list(columnas)
+    firma = firma_cabeceras(columnas)
+    with _lock_mapeos:
+        posiciones = _memo_mapeos.get(firma)
+        if posiciones is not None:
+            _memo_mapeos.move_to_end(firma)
+    nueva = posiciones is None
+    if nueva:
+        posiciones = _leer_cache_disco().get(firma, {})
+
+    pendientes = [(n, t) for n, t in zip(nombres_norm, tipos_param) if n not in posiciones]
+    if pendientes:
+        posiciones = dict(posiciones)
+        pos_columna = {c: j for j, c in enumerate(columnas)}
+        cols_planta_norm = {normalizar_texto(c): c for c in columnas}
+        indice_difuso = IndiceDifuso(cols_planta_norm)
+        for p_norm, tipo_param in pendientes:
+            col = resolver_columna(p_norm, tipo_param, cols_planta_norm, indice_difuso)
+            posiciones[p_norm] = pos_columna[col] if col is not None else None
+    if nueva or pendientes:
+        with _lock_mapeos:
+            _memo_mapeos[firma] = posiciones
+            _memo_mapeos.move_to_end(firma)
+            while len(_memo_mapeos) > MAX_FIRMAS_CACHE:
+                _memo_mapeos.popitem(last=False)
+            if pendientes:
+                _guardar_cache_disco(firma, posiciones)
+
+    return {n: (columnas[posiciones[n]] if posiciones[n] is not None else None) for n in nombres_norm}
@@ -0,0 +1,7 @@
+import os
+
+# Carpeta local para cachés persistentes (mapeos, lecturas de planta, resultados)
+DIR_CACHE = os.environ.get('REDESTINO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'redestino'))
+
+# Tabla de sinónimos de tipos de producto en JSON (opcional; por defecto la de tipos.py)
+ARCHIVO_SINONIMOS = os.environ.get('REDESTINO_SINONIMOS')
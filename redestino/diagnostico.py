@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ==========================================
+# 🩺 DIAGNÓSTICO POR ETAPA
+# ==========================================
+# Tiempos, conteos y aciertos de caché de UNA corrida del script. Streamlit ejecuta
+# cada sesión en su propio hilo (y las funciones en caché corren en ese mismo hilo),
+# así que el diagnóstico activo es local al hilo.
+
+_local = threading.local()
+
+
+def iniciar():
+    """Nuevo diagnóstico para la corrida actual del hilo."""
+    _local.diag = Diagnostico()
+    return _local.diag
+
+
+def actual():
+    return getattr(_local, 'diag', None)
+
+
+def memoria_pico_mb():
+    """Pico de memoria residente del proceso (MB) desde que arrancó, o None si no se puede medir.
+
+    En un servidor que vive días es el de la corrida más pesada, no el de la actual.
+    """
+    if resource is None: return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB; macOS, bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def memoria_actual_mb():
+    """Memoria residente actual del proceso (MB), o None fuera de Linux."""
+    try:
+        with open('/proc/self/statm') as fh:
+            paginas = int(fh.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class Diagnostico:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        # La memoria de la corrida se mide como crecimiento del residente desde aquí
+        self.memoria_inicio = memoria_actual_mb()
+        self.etapas = {}
+        self.cache = {}
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Mide el tiempo de un bloque; el dict entregado recibe los conteos de la etapa."""
+        datos = self.etapas.setdefault(nombre, {'segundos': 0.0, 'veces': 0})
+        conteos = {}
+        inicio = time.perf_counter()
+        try:
+            yield conteos
+        finally:
+            datos['segundos'] += time.perf_counter() - inicio
+            datos['veces'] += 1
+            datos.update(conteos)
+
+    def llamada_cache(self, funcion):
+        self.cache.setdefault(funcion, {'llamadas': 0, 'fallos': 0})['llamadas'] += 1
+
+    def fallo_cache(self, funcion):
+        self.cache.setdefault(funcion, {'llamadas': 0, 'fallos': 0})['fallos'] += 1
+
+    def como_dict(self):
+        memoria = memoria_actual_mb()
+        return {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'segundos_total': time.perf_counter() - self.inicio,
+            'memoria_corrida_mb': memoria - self.memoria_inicio if memoria is not None and self.memoria_inicio is not None else None,
+            'memoria_pico_proceso_mb': memoria_pico_mb(),
+            'etapas': self.etapas,
+            'cache': {f: dict(d, aciertos=d['llamadas'] - d['fallos']) for f, d in self.cache.items()},
+        }
+
+    def como_json(self):
+        return json.dumps(self.como_dict(), indent=2, ensure_ascii=False, default=str)
@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+# ==========================================
+# 🔎 COINCIDENCIA DIFUSA INDEXADA DE CABECERAS
+# ==========================================
+# Equivale a recorrer todas las cabeceras con SequenceMatcher(None, p_norm, k).ratio()
+# y quedarse con la primera de mayor ratio si supera el umbral, pero sin calcular el
+# ratio exacto de cabeceras que no pueden superarlo:
+#   1. índice invertido de bigramas: sin bigramas en común los bloques coincidentes son
+#      de largo 1 y separados, así que M <= (la + lb + 1) / 3 y el ratio no pasa de ~0.67
+#      (salvo textos muy cortos, que se revisan aparte)
+#   2. cotas baratas: largo (real_quick_ratio) y multiconjunto de caracteres (quick_ratio)
+#   3. ratio exacto solo para los candidatos ordenados por cota, cortando en cuanto
+#      la cota cae bajo el mejor ratio encontrado
+
+N_GRAMA = 2
+
+
+def _ngramas(texto):
+    return {texto[i:i + N_GRAMA] for i in range(len(texto) - N_GRAMA + 1)}
+
+
+class IndiceDifuso:
+    def __init__(self, cols_planta_norm):
+        self.claves = list(cols_planta_norm.keys())
+        self.valores = list(cols_planta_norm.values())
+        self.largos = [len(k) for k in self.claves]
+        self.conteos = [Counter(k) for k in self.claves]
+        self.por_largo = sorted((l, j) for j, l in enumerate(self.largos))
+        self.invertido = defaultdict(list)
+        for j, k in enumerate(self.claves):
+            for g in _ngramas(k):
+                self.invertido[g].append(j)
+        # Un SequenceMatcher por cabecera (seq2 fija): el análisis de b se reutiliza entre consultas
+        self._matchers = {}
+
+    def _ratio(self, p_norm, j):
+        sm = self._matchers.get(j)
+        if sm is None:
+            sm = self._matchers[j] = SequenceMatcher(None, '', self.claves[j])
+        sm.set_seq1(p_norm)
+        return sm.ratio()
+
+    def candidatos(self, p_norm, umbral):
+        """(cota superior del ratio, posición) de las cabeceras que podrían superar `umbral`."""
+        la = len(p_norm)
+        posibles = set()
+        for g in _ngramas(p_norm):
+            posibles.update(self.invertido.get(g, ()))
+        # Sin bigramas en común: ratio <= 2 (L + 1) / 3L, solo alcanza el umbral si L es chico
+        if umbral * 3 <= 2:
+            posibles.update(range(len(self.claves)))
+        else:
+            limite = 2 / (3 * umbral - 2)
+            for l, j in self.por_largo:
+                if la + l >= limite: break
+                posibles.add(j)
+
+        conteo_p = None
+        salida = []
+        for j in posibles:
+            total = la + self.largos[j]
+            if total == 0:
+                salida.append((1.0, j))
+                continue
+            if 2.0 * min(la, self.largos[j]) / total <= umbral: continue
+            if conteo_p is None: conteo_p = Counter(p_norm)
+            cota = 2.0 * sum((conteo_p & self.conteos[j]).values()) / total
+            if cota > umbral:
+                salida.append((cota, j))
+        return salida
+
+    def mejor(self, p_norm, umbral=0.8):
+        """Columna real con mayor ratio (> umbral) o None; en empate gana la primera cabecera."""
+        best_r, best_j = umbral, None
+        for cota, j in sorted(self.candidatos(p_norm, umbral), key=lambda t: (-t[0], t[1])):
+            if cota < best_r: break
+            r = self._ratio(p_norm, j)
+            if r > best_r or (best_j is not None and r == best_r and j < best_j):
+                best_r, best_j = r, j
+        return self.valores[best_j] if best_j is not None else None
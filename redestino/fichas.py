@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+
+from redestino.texto import normalizar_texto, detectar_familia_hoja, es_texto_gf
+
+# ==========================================
+# 📚 ÍNDICE COMPILADO DE FICHAS TÉCNICAS
+# ==========================================
+# Representación columnar (struct-of-arrays) de las fichas:
+#   - atributos por ficha en arreglos de largo n_fichas
+#   - parámetros aplanados y contiguos por ficha; los de la ficha f están en
+#     param_offsets[f]:param_offsets[f + 1]
+#   - nombres normalizados internados: cada parámetro guarda un id en `nombres_norm`
+#   - `elegibles[(familia_hoja, lote_gf)]`: posiciones de fichas candidatas
+# Los límites se guardan en float64 para comparar exactamente igual que antes.
+
+MARCAS_FICHA_PRUEBA = ["_Cliente de PruebaX", "NO BORRAR"]
+
+# Valores posibles de detectar_familia_hoja (familia de la hoja de planta)
+FAMILIAS = ['groat', 'harina', 'pillow', 'hojuela', 'otros']
+
+
+def _tipo_param(p_norm):
+    if 'espesor' in p_norm: return 'espesor'
+    if any(x in p_norm for x in ['malla', 'ret', 'bajo', 'a traves']): return 'malla'
+    return 'otro'
+
+
+def _familia_ficha(familia_txt, prod_norm):
+    fam_norm = detectar_familia_hoja(familia_txt)
+    if 'harina' in prod_norm: fam_norm = 'harina'
+    elif 'avena pelada' in prod_norm: fam_norm = 'groat'
+    elif 'pillow' in prod_norm: fam_norm = 'pillow'
+    elif 'hojuela' in prod_norm or 'laminada' in prod_norm: fam_norm = 'hojuela'
+    return fam_norm
+
+
+def ficha_elegible(fam_lote, es_lote_gf, familia_ficha, es_gf_ficha):
+    """Reglas de familia / sin gluten entre la hoja del lote y una ficha."""
+    if es_lote_gf:
+        if not es_gf_ficha: return False
+    else:
+        if fam_lote in ['harina', 'hojuela', 'pillow'] and es_gf_ficha: return False
+
+    if fam_lote != 'otros':
+        if fam_lote == 'hojuela' and familia_ficha == 'harina': return False
+        if fam_lote == 'harina' and familia_ficha == 'hojuela': return False
+        if familia_ficha != fam_lote and familia_ficha != 'otros':
+            if not (fam_lote in ['hojuela', 'pillow'] and familia_ficha in ['hojuela', 'pillow']):
+                return False
+    return True
+
+
+def indice_elegibilidad(familia_norm, es_gf):
+    """Fichas candidatas precalculadas para cada combinación (familia de hoja, lote GF).
+
+    Las reglas solo dependen de (familia, es_gf) de la ficha, así que se evalúan una
+    vez por combinación distinta y se expanden a posiciones de ficha.
+    """
+    combos = {}
+    combo_de_ficha = np.array(
+        [combos.setdefault((fam, bool(gf)), len(combos)) for fam, gf in zip(familia_norm, es_gf)],
+        dtype=np.int64
+    )
+    elegibles = {}
+    for fam_lote in FAMILIAS:
+        for es_lote_gf in (False, True):
+            ok = np.array([ficha_elegible(fam_lote, es_lote_gf, fam, gf) for fam, gf in combos], dtype=bool)
+            elegibles[(fam_lote, es_lote_gf)] = np.flatnonzero(ok[combo_de_ficha]) if combos else combo_de_ficha
+    return elegibles
+
+
+def detectar_columnas_fichas(columnas):
+    cols_map = {normalizar_texto(c): c for c in columnas}
+
+    def get_col(keywords):
+        for k in keywords:
+            kn = normalizar_texto(k)
+            for cn, cr in cols_map.items():
+                if kn in cn: return cr
+        return None
+
+    return {
+        'cod': get_col(['codigo ft', 'cod']),
+        'cli': get_col(['cliente']),
+        'fam': get_col(['familia', 'family']),
+        'prod': get_col(['producto', 'descripción']),
+        'tipo': get_col(['tipo']),
+        'param': get_col(['analisis', 'parametro']),
+        'min': get_col(['min', 'mínimo']),
+        'max': get_col(['max', 'máximo']),
+    }
+
+
+def compilar_fichas(df):
+    """Compila el DataFrame crudo de fichas en el índice columnar.
+
+    Devuelve (indice, error). Reemplaza el `groupby` + `iterrows` por operaciones
+    agrupadas: el texto se normaliza una vez por valor único y los parámetros se
+    reordenan con un único argsort estable.
+    """
+    c = detectar_columnas_fichas(df.columns)
+    if not all(c[k] for k in ['cod', 'cli', 'prod', 'tipo', 'param', 'min', 'max']):
+        return None, "Faltan columnas clave en Fichas"
+
+    # Grupo por Codigo FT (mismo orden que groupby: claves ordenadas, NaN fuera)
+    grupo, codigos = pd.factorize(df[c['cod']], sort=True)
+    _, primera_fila = np.unique(grupo, return_index=True)
+    if len(grupo) and grupo.min() < 0:
+        primera_fila = primera_fila[1:]
+    primeras = df.iloc[primera_fila]
+
+    clientes = primeras[c['cli']].astype(object).map(str).to_numpy()
+    familias_txt = primeras[c['fam']].astype(object).map(str).to_numpy() if c['fam'] else np.full(len(primeras), "")
+    productos = primeras[c['prod']].astype(object).map(str).to_numpy()
+
+    es_prueba = np.array([any(m in cli for m in MARCAS_FICHA_PRUEBA) for cli in clientes], dtype=bool)
+
+    # Parámetros de tipo 'analisis' en el orden original dentro de cada grupo
+    es_analisis = (df[c['tipo']].astype(object).map(str).str.lower().str.strip() == 'analisis').to_numpy()
+    filas = np.flatnonzero(es_analisis & (grupo >= 0))
+    filas = filas[~es_prueba[grupo[filas]]]
+    filas = filas[np.argsort(grupo[filas], kind='stable')]
+    ficha_de_param = grupo[filas]
+
+    # Fichas con al menos un parámetro (las demás se descartan, igual que antes)
+    n_params = np.bincount(ficha_de_param, minlength=len(codigos))
+    activas = np.flatnonzero(n_params)
+    param_offsets = np.concatenate(([0], np.cumsum(n_params[activas]))).astype(np.int64)
+
+    nombres = df[c['param']].to_numpy(dtype=object)[filas]
+    # Nombres internados: se normaliza una vez por nombre único
+    id_crudo, nombres_unicos = pd.factorize(pd.Series(nombres, dtype=object), use_na_sentinel=False)
+    norm_unicos = [normalizar_texto(n) for n in nombres_unicos]
+    id_norm, nombres_norm = pd.factorize(pd.Series(norm_unicos, dtype=object))
+    param_nombre_id = id_norm[id_crudo].astype(np.int32)
+
+    min_val = pd.to_numeric(df[c['min']], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    max_val = pd.to_numeric(df[c['max']], errors='coerce').fillna(float('inf')).to_numpy(dtype=np.float64)
+
+    prod_norm = np.array([normalizar_texto(p) for p in productos[activas]], dtype=object)
+    fam_txt = familias_txt[activas]
+    familia_norm = np.array([_familia_ficha(f, p) for f, p in zip(fam_txt, prod_norm)], dtype=object)
+    es_gf = np.array([es_texto_gf(f) or es_texto_gf(p) for f, p in zip(fam_txt, productos[activas])], dtype=bool)
+    indice = {
+        'codigos': list(codigos[activas]),
+        'cliente': clientes[activas],
+        'producto': productos[activas],
+        'producto_norm': prod_norm,
+        'familia_norm': familia_norm,
+        'es_gf': es_gf,
+        'param_offsets': param_offsets,
+        'param_min': min_val[filas],
+        'param_max': max_val[filas],
+        'param_nombre': nombres,
+        'param_nombre_id': param_nombre_id,
+        'nombres_norm': [str(n) for n in nombres_norm],
+        'tipo_param_nombre': np.array([_tipo_param(str(n)) for n in nombres_norm], dtype=object),
+        'elegibles': indice_elegibilidad(familia_norm, es_gf),
+    }
+    return indice, None
+
+
+def fichas_como_dict(indice):
+    """Vista dict-of-dicts (formato histórico de `db_fichas`) a partir del índice."""
+    db_fichas = {}
+    offsets = indice['param_offsets']
+    mins = indice['param_min'].tolist()
+    maxs = indice['param_max'].tolist()
+    for f, cod in enumerate(indice['codigos']):
+        params = []
+        for i in range(offsets[f], offsets[f + 1]):
+            nid = indice['param_nombre_id'][i]
+            params.append({
+                'nombre': indice['param_nombre'][i],
+                'nombre_norm': indice['nombres_norm'][nid],
+                'min': mins[i],
+                'max': maxs[i],
+                'tipo_param': indice['tipo_param_nombre'][nid]
+            })
+        db_fichas[cod] = {
+            'cliente': indice['cliente'][f],
+            'familia_norm': indice['familia_norm'][f],
+            'producto': indice['producto'][f],
+            'producto_norm': indice['producto_norm'][f],
+            'es_gf': bool(indice['es_gf'][f]),
+            'params': params
+        }
+    return db_fichas
@@ -0,0 +1,268 @@
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+from redestino.columnas import detectar_metadatos
+from redestino.config import DIR_CACHE
+from redestino.ingesta import (escribir_parquet, etiquetas_parquet, hash_contenido, leer_bytes, leer_hoja, leer_parquet,
+                               listar_hojas as hojas_libro)
+
+# ==========================================
+# 🗃️ HISTORIAL DE LOTES PARTICIONADO POR FECHA
+# ==========================================
+# La historia de planta viene repartida en libros mensuales. Cada libro se ingiere una
+# vez (por nombre + hash de contenido) y sus filas se reparten, hoja por hoja, en
+# particiones mensuales en Parquet bajo DIR_CACHE/historial/, ordenadas por fecha:
+#
+#   manifiesto.json                    libros ingeridos y, por hoja, sus particiones
+#   <hoja>/2024-05.parquet             filas de mayo de 2024 de todos los libros
+#   <hoja>/sin_fecha.parquet           filas sin fecha legible
+#
+# El manifiesto guarda el rango [desde, hasta] de cada partición: un rango de fechas
+# se resuelve con dos búsquedas binarias sobre esos bordes y, dentro de cada partición,
+# otras dos sobre la columna de fecha ordenada. Así 30 días sobre dos años de historia
+# leen solo una o dos particiones. Volver a subir un libro con el mismo nombre y otro
+# contenido (el del mes en curso, que crece cada día) reemplaza sus filas.
+
+DIR_HISTORIAL = os.path.join(DIR_CACHE, 'historial')
+VERSION_FORMATO = 1
+
+# Columnas internas de cada partición: libro de origen y fecha ya convertida
+COL_LIBRO = '__libro__'
+COL_FECHA = '__fecha__'
+SIN_FECHA = 'sin_fecha'
+
+# Las escrituras (ingesta) van de a una; las lecturas no se bloquean
+_lock = threading.Lock()
+
+
+def limites_rango(rango):
+    """(desde, hasta exclusivo) en Timestamp de un rango de fechas (desde, hasta) inclusivo."""
+    return pd.Timestamp(rango[0]), pd.Timestamp(rango[1]) + pd.Timedelta(days=1)
+
+
+# --- MANIFIESTO ---
+def _ruta_manifiesto():
+    return os.path.join(DIR_HISTORIAL, 'manifiesto.json')
+
+
+def _manifiesto():
+    try:
+        with open(_ruta_manifiesto(), encoding='utf-8') as fh:
+            manifiesto = json.load(fh)
+        if manifiesto.get('version') == VERSION_FORMATO:
+            return manifiesto
+    except (OSError, ValueError):
+        pass
+    return {'version': VERSION_FORMATO, 'id': uuid.uuid4().hex, 'cambios': 0, 'libros': {}, 'hojas': {}}
+
+
+def _guardar_manifiesto(manifiesto):
+    os.makedirs(DIR_HISTORIAL, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=DIR_HISTORIAL, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        json.dump(manifiesto, fh, ensure_ascii=False)
+    os.replace(tmp, _ruta_manifiesto())
+
+
+def _ruta_particion(info, clave):
+    return os.path.join(DIR_HISTORIAL, info['dir'], f"{clave}.parquet")
+
+
+# --- INGESTA ---
+def _particionar(df):
+    """{clave de partición: filas} por mes de la fecha (las filas sin fecha aparte)."""
+    meses = df[COL_FECHA].dt.to_period('M')
+    return {SIN_FECHA if pd.isna(mes) else str(mes): df.iloc[np.sort(pos)]
+            for mes, pos in df.groupby(meses, sort=False, dropna=False).indices.items()}
+
+
+def _reescribir(info, clave, nombre, nuevas):
+    """Partición `clave` sin las filas anteriores del libro `nombre` y con las `nuevas`."""
+    ruta = _ruta_particion(info, clave)
+    partes = []
+    previa = info['particiones'].get(clave)
+    if previa:
+        df = leer_parquet(ruta)
+        partes.append(df[df[COL_LIBRO] != nombre] if nombre in previa['libros'] else df)
+    if nuevas is not None:
+        partes.append(nuevas)
+    df = pd.concat(partes, ignore_index=True) if partes else None
+
+    if df is None or not len(df):
+        info['particiones'].pop(clave, None)
+        if os.path.exists(ruta): os.remove(ruta)
+        return
+    if clave != SIN_FECHA:
+        # Orden estable: a igual fecha se mantiene el orden de llegada
+        df = df.sort_values(COL_FECHA, kind='mergesort', ignore_index=True)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    escribir_parquet(ruta, df)
+    fechas = df[COL_FECHA]
+    info['particiones'][clave] = {
+        'desde': None if clave == SIN_FECHA else fechas.iloc[0].isoformat(),
+        'hasta': None if clave == SIN_FECHA else fechas.iloc[-1].isoformat(),
+        'filas': len(df),
+        'libros': sorted(set(df[COL_LIBRO])),
+    }
+
+
+def ingresar_libro(file, header=0, nombre=None):
+    """Agrega (o reemplaza, si cambió) un libro de planta al historial.
+
+    Devuelve {'libro', 'estado': 'nuevo' | 'reemplazado' | 'sin_cambios', 'filas'}.
+    """
+    datos = leer_bytes(file)
+    nombre = nombre or os.path.basename(getattr(file, 'name', str(file)))
+    huella = hash_contenido(datos)
+    with _lock:
+        manifiesto = _manifiesto()
+        previo = manifiesto['libros'].get(nombre)
+        if previo and previo['hash'] == huella:
+            return {'libro': nombre, 'estado': 'sin_cambios', 'filas': previo['filas']}
+
+        libro = io.BytesIO(datos)
+        nuevas, filas = {}, 0
+        for hoja in hojas_libro(libro):
+            # Las hojas nuevas se registran en el orden del libro
+            manifiesto['hojas'].setdefault(hoja, {
+                'dir': 'h_' + hashlib.blake2b(hoja.encode('utf-8'), digest_size=8).hexdigest(), 'particiones': {}})
+            df = leer_hoja(libro, hoja, header=header)
+            col_fecha = detectar_metadatos(df.columns)['fecha']
+            df = df.copy()
+            df[COL_LIBRO] = nombre
+            df[COL_FECHA] = pd.to_datetime(df[col_fecha], errors='coerce') if col_fecha else pd.NaT
+            filas += len(df)
+            for clave, grupo in _particionar(df).items():
+                nuevas[(hoja, clave)] = grupo
+
+        # Particiones con filas nuevas o con filas de la versión anterior del libro
+        afectadas = set(nuevas)
+        if previo:
+            afectadas |= {(hoja, clave) for hoja, info in manifiesto['hojas'].items()
+                          for clave, p in info['particiones'].items() if nombre in p['libros']}
+        for hoja, clave in sorted(afectadas):
+            _reescribir(manifiesto['hojas'][hoja], clave, nombre, nuevas.get((hoja, clave)))
+        manifiesto['hojas'] = {h: info for h, info in manifiesto['hojas'].items() if info['particiones']}
+
+        manifiesto['libros'][nombre] = {'hash': huella, 'filas': filas,
+                                        'ingresado': datetime.datetime.now().isoformat(timespec='seconds')}
+        manifiesto['cambios'] += 1
+        _guardar_manifiesto(manifiesto)
+    return {'libro': nombre, 'estado': 'reemplazado' if previo else 'nuevo', 'filas': filas}
+
+
+def quitar_libro(nombre):
+    """Saca del historial las filas del libro `nombre`."""
+    with _lock:
+        manifiesto = _manifiesto()
+        if manifiesto['libros'].pop(nombre, None) is None:
+            return False
+        for info in manifiesto['hojas'].values():
+            for clave in [c for c, p in info['particiones'].items() if nombre in p['libros']]:
+                _reescribir(info, clave, nombre, None)
+        manifiesto['hojas'] = {h: info for h, info in manifiesto['hojas'].items() if info['particiones']}
+        manifiesto['cambios'] += 1
+        _guardar_manifiesto(manifiesto)
+    return True
+
+
+# --- CONSULTA ---
+def identificador():
+    """Id del historial en disco (cambia si se borra y se vuelve a crear)."""
+    return _manifiesto()['id']
+
+
+def version():
+    """Texto que cambia con cada ingesta (para claves de caché)."""
+    manifiesto = _manifiesto()
+    return f"historial:{manifiesto['id']}:{manifiesto['cambios']}"
+
+
+def resumen():
+    """{'libros', 'hojas', 'filas', 'desde', 'hasta'} del historial."""
+    manifiesto = _manifiesto()
+    particiones = [p for info in manifiesto['hojas'].values() for p in info['particiones'].values()]
+    fechadas = [p for p in particiones if p['desde']]
+    return {
+        'libros': len(manifiesto['libros']),
+        'hojas': len(manifiesto['hojas']),
+        'filas': sum(p['filas'] for p in particiones),
+        'desde': min((p['desde'] for p in fechadas), default=None),
+        'hasta': max((p['hasta'] for p in fechadas), default=None),
+    }
+
+
+def listar_hojas():
+    return list(_manifiesto()['hojas'])
+
+
+def _info_hoja(manifiesto, hoja):
+    info = manifiesto['hojas'].get(str(hoja))
+    if info is None:
+        raise ValueError(f"La hoja '{hoja}' no está en el historial")
+    return info
+
+
+def cabecera(hoja):
+    """Columnas de la hoja en todos los libros (orden de primera aparición), sin leer datos."""
+    info = _info_hoja(_manifiesto(), hoja)
+    etiquetas = {}
+    for clave in sorted(info['particiones']):
+        etiquetas.update(dict.fromkeys(etiquetas_parquet(_ruta_particion(info, clave)) or []))
+    return [c for c in etiquetas if c not in (COL_LIBRO, COL_FECHA)]
+
+
+def particiones_rango(hoja, rango=None):
+    """Claves de las particiones que toca el rango (todas, incluida la sin fecha, si es None)."""
+    info = _info_hoja(_manifiesto(), hoja)
+    fechadas = sorted(c for c in info['particiones'] if c != SIN_FECHA)
+    if rango is None:
+        return fechadas + ([SIN_FECHA] if SIN_FECHA in info['particiones'] else [])
+    desde, hasta = limites_rango(rango)
+    # Particiones ordenadas y sin solaparse: la primera que termina en o después de `desde`
+    # y la primera que empieza en o después de `hasta`
+    hastas = [pd.Timestamp(info['particiones'][c]['hasta']) for c in fechadas]
+    desdes = [pd.Timestamp(info['particiones'][c]['desde']) for c in fechadas]
+    return fechadas[bisect_left(hastas, desde):bisect_left(desdes, hasta)]
+
+
+def leer_rango(hoja, rango=None, columnas=None, filtro=None):
+    """Filas de la hoja en el rango de fechas (inclusivo), de todos los libros ingeridos.
+
+    Como `leer_hoja`: `columnas` proyecta y `filtro` = (etiqueta, función serie -> máscara)
+    deja parte de las filas con su posición (dentro del rango) como índice. Sin `rango`
+    se leen todas las filas, también las sin fecha.
+    """
+    info = _info_hoja(_manifiesto(), hoja)
+    orden = cabecera(hoja)
+    if columnas is not None:
+        pedidas = set(columnas)
+        orden = [c for c in orden if c in pedidas]
+    lectura = None if columnas is None else orden + [COL_FECHA] + ([filtro[0]] if filtro else [])
+
+    partes = []
+    for clave in particiones_rango(hoja, rango):
+        df = leer_parquet(_ruta_particion(info, clave), lectura)
+        if rango is not None:
+            desde, hasta = limites_rango(rango)
+            fechas = df[COL_FECHA].to_numpy()
+            df = df.iloc[np.searchsorted(fechas, np.datetime64(desde)):np.searchsorted(fechas, np.datetime64(hasta))]
+        partes.append(df)
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=orden)
+
+    if filtro is not None:
+        filas = np.flatnonzero(np.asarray(filtro[1](df[filtro[0]]), dtype=bool))
+        df = df.iloc[filas]
+        df.index = filas
+    # Columnas que faltan en las particiones leídas (libros con otra cabecera) quedan vacías
+    return df.reindex(columns=orden)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 🩹 IMPUTACIÓN DE DATOS POR COLUMNA
+# ==========================================
+# Prioridad: 1) estadístico del LOTE, 2) (según estrategia) ventana de fechas,
+# 3) estadístico GLOBAL de la hoja filtrada. Todo con agregaciones nativas de
+# pandas (sin lambdas por grupo) y solo sobre las columnas que se usan.
+
+
+class MascaraImputados:
+    """Celdas imputadas guardadas como bitmap por columna (1 bit por fila)."""
+
+    def __init__(self, n_filas, bits):
+        self.n_filas = n_filas
+        self._bits = bits
+
+    @classmethod
+    def desde_nulos(cls, df):
+        nulos = df.isna().to_numpy()
+        bits = {col: np.packbits(nulos[:, j]) for j, col in enumerate(df.columns) if nulos[:, j].any()}
+        return cls(len(df), bits)
+
+    def __contains__(self, col):
+        return col in self._bits
+
+    def columna(self, col):
+        if col not in self._bits:
+            return np.zeros(self.n_filas, dtype=bool)
+        return np.unpackbits(self._bits[col], count=self.n_filas).astype(bool)
+
+    def valor(self, pos, col):
+        bits = self._bits.get(col)
+        if bits is None: return False
+        return bool(bits[pos >> 3] & (0x80 >> (pos & 7)))
+
+    def subconjunto(self, posiciones):
+        """Máscara restringida a las filas `posiciones` (p. ej. solo los retenidos)."""
+        bits = {}
+        for col in self._bits:
+            sub = self.columna(col)[posiciones]
+            if sub.any(): bits[col] = np.packbits(sub)
+        return MascaraImputados(len(posiciones), bits)
+
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for b in self._bits.values())
+
+
+# --- ESTRATEGIAS ---
+# Cada estrategia devuelve (rellenos en orden de prioridad, relleno global). Todos se
+# calculan sobre los datos originales, antes de rellenar nada.
+
+def _por_lote(df, columnas, col_agrupacion, agregacion):
+    if not col_agrupacion: return []
+    return [df.groupby(col_agrupacion, sort=False)[columnas].transform(agregacion)]
+
+def _estrategia_media(df, columnas, col_agrupacion, col_fecha=None, ventana_dias=None):
+    return _por_lote(df, columnas, col_agrupacion, 'mean'), df[columnas].mean()
+
+def _estrategia_mediana(df, columnas, col_agrupacion, col_fecha=None, ventana_dias=None):
+    return _por_lote(df, columnas, col_agrupacion, 'median'), df[columnas].median()
+
+def _estrategia_ventana_fecha(df, columnas, col_agrupacion, col_fecha=None, ventana_dias=7):
+    """Lote -> promedio de los últimos `ventana_dias` días (por fecha de la fila) -> global."""
+    rellenos = _por_lote(df, columnas, col_agrupacion, 'mean')
+    if col_fecha:
+        fechas = pd.to_datetime(df[col_fecha], errors='coerce')
+        con_fecha = fechas.notna().to_numpy()
+        orden = fechas[con_fecha].sort_values(kind='stable').index
+        valores = df.loc[orden, columnas].set_axis(fechas[orden].to_numpy())
+        ventana = valores.rolling(f"{int(ventana_dias)}D", min_periods=1).mean()
+        rellenos.append(ventana.set_axis(orden).reindex(df.index))
+    return rellenos, df[columnas].mean()
+
+ESTRATEGIAS_IMPUTACION = {
+    'media': _estrategia_media,
+    'mediana': _estrategia_mediana,
+    'ventana_fecha': _estrategia_ventana_fecha,
+}
+
+
+def convertir_numericas(df, columnas, dtype_decimal=None):
+    """Fuerza a número las columnas indicadas (texto inválido -> NaN).
+
+    Con `dtype_decimal` (p. ej. np.float32) las columnas decimales quedan en ese tipo;
+    las enteras no se tocan.
+    """
+    for col in columnas:
+        if df[col].dtype.kind not in 'iufb':
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        if dtype_decimal is not None and df[col].dtype.kind == 'f' and df[col].dtype != dtype_decimal:
+            df[col] = df[col].astype(dtype_decimal)
+
+
+def imputar(df, columnas, col_agrupacion=None, estrategia='media', col_fecha=None, ventana_dias=7):
+    """Rellena los NaN de las `columnas` numéricas de `df` (in place).
+
+    Devuelve la `MascaraImputados` con las celdas que estaban vacías. Las filas sin
+    lote conservan sus propios valores y solo se rellenan sus vacíos.
+    """
+    columnas = [c for c in columnas if df[c].dtype.kind in 'iuf']
+    valores = df[columnas]
+    mascara = MascaraImputados.desde_nulos(valores)
+    cols_nan = [c for c in columnas if c in mascara]
+    if not cols_nan:
+        return mascara
+
+    rellenos, relleno_global = ESTRATEGIAS_IMPUTACION[estrategia](
+        df, cols_nan, col_agrupacion, col_fecha=col_fecha, ventana_dias=ventana_dias
+    )
+    valores = df[cols_nan]
+    for relleno in rellenos:
+        valores = valores.fillna(relleno)
+    df[cols_nan] = valores.fillna(relleno_global)
+    return mascara
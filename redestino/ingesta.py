@@ -0,0 +1,353 @@
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from redestino.config import DIR_CACHE
+
+# ==========================================
+# 📥 INGESTA DE LIBROS EXCEL CON CACHÉ COLUMNAR
+# ==========================================
+# Cada libro se identifica por el hash de su contenido. Al parsearlo se guarda cada
+# hoja en Parquet bajo DIR_CACHE/libros/<hash>/, junto a un manifiesto con los nombres
+# de hoja. Cambiar de hoja, reiniciar el servidor o volver a subir el mismo archivo
+# lee el Parquet en vez de volver a parsear el XLSX.
+#
+# Modos de lectura:
+#   - 'libro': parsea todas las hojas de una vez (lo normal: se cambia de hoja seguido)
+#   - 'hoja':  parsea solo la hoja pedida con el lector de solo lectura más rápido
+#              disponible (calamine si está instalado); pensado para libros muy grandes
+
+DIR_LIBROS = os.path.join(DIR_CACHE, 'libros')
+MAX_LIBROS_CACHE = 20
+VERSION_FORMATO = 1
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow se parsea siempre (sin caché en disco)
+    pa = None
+    pq = None
+
+try:
+    import python_calamine  # noqa: F401
+    MOTOR_RAPIDO = 'calamine'
+except ImportError:
+    MOTOR_RAPIDO = None
+
+# Tipos de celda para columnas 'object' con valores mezclados (texto + números + fechas)
+_T_NULO, _T_STR, _T_INT, _T_FLOAT, _T_BOOL, _T_FECHA, _T_HORA, _T_DURACION, _T_FECHA_PY = range(9)
+
+
+def leer_bytes(file):
+    """Contenido completo de un archivo subido (UploadedFile/BytesIO) o de una ruta."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as fh:
+            return fh.read()
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    file.seek(0)
+    datos = file.read()
+    file.seek(0)
+    return datos
+
+
+def hash_contenido(datos):
+    return hashlib.blake2b(datos, digest_size=20).hexdigest()
+
+
+# --- CODIFICACIÓN DE ETIQUETAS Y CELDAS ---
+def _codificar_valor(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NaT:
+        return _T_NULO, None
+    if isinstance(v, str): return _T_STR, v
+    if isinstance(v, (bool, np.bool_)): return _T_BOOL, str(bool(v))
+    if isinstance(v, (int, np.integer)): return _T_INT, str(int(v))
+    if isinstance(v, (float, np.floating)): return _T_FLOAT, repr(float(v))
+    if isinstance(v, pd.Timestamp): return _T_FECHA, v.isoformat()
+    if isinstance(v, datetime.datetime): return _T_FECHA_PY, v.isoformat()
+    if isinstance(v, datetime.time): return _T_HORA, v.isoformat()
+    if isinstance(v, (datetime.timedelta, np.timedelta64)): return _T_DURACION, str(pd.Timedelta(v).value)
+    raise TypeError(type(v))
+
+
+def _decodificar_valor(t, s):
+    if t == _T_NULO: return np.nan
+    if t == _T_STR: return s
+    if t == _T_BOOL: return s == 'True'
+    if t == _T_INT: return int(s)
+    if t == _T_FLOAT: return float(s)
+    if t == _T_FECHA: return pd.Timestamp(s)
+    if t == _T_FECHA_PY: return datetime.datetime.fromisoformat(s)
+    if t == _T_HORA: return datetime.time.fromisoformat(s)
+    return pd.Timedelta(int(s))
+
+
+def _a_tabla(df):
+    """DataFrame -> tabla Arrow. Las columnas 'object' mezcladas se guardan como texto +
+    código de tipo por celda, para reconstruir exactamente los mismos valores."""
+    columnas, mixtas, arrays, nombres = [], [], [], []
+    for j, col in enumerate(df.columns):
+        columnas.append(_codificar_valor(col))
+        serie = df.iloc[:, j]
+        if serie.dtype == object and not all(isinstance(v, str) for v in serie.dropna()):
+            codigos = [_codificar_valor(v) for v in serie]
+            arrays.append(pa.array([c[1] for c in codigos], type=pa.string()))
+            arrays.append(pa.array([c[0] for c in codigos], type=pa.int8()))
+            nombres += [f"c{j}", f"t{j}"]
+            mixtas.append(j)
+        else:
+            arrays.append(pa.Array.from_pandas(serie))
+            nombres.append(f"c{j}")
+    meta = {'version': VERSION_FORMATO, 'columnas': columnas, 'mixtas': mixtas}
+    tabla = pa.Table.from_arrays(arrays, names=nombres)
+    return tabla.replace_schema_metadata({'redestino': json.dumps(meta)})
+
+
+def _meta_tabla(schema):
+    return json.loads(schema.metadata[b'redestino'])
+
+
+def _columnas_fisicas(meta, posiciones):
+    """Columnas Parquet que hay que leer para las posiciones pedidas."""
+    mixtas = set(meta['mixtas'])
+    fisicas = []
+    for j in posiciones:
+        fisicas.append(f"c{j}")
+        if j in mixtas: fisicas.append(f"t{j}")
+    return fisicas
+
+
+def _de_tabla(tabla, meta, posiciones):
+    etiquetas = [_decodificar_valor(t, s) for t, s in meta['columnas']]
+    mixtas = set(meta['mixtas'])
+    datos = {}
+    for k, j in enumerate(posiciones):
+        if j in mixtas:
+            textos = tabla.column(f"c{j}").to_pylist()
+            tipos = tabla.column(f"t{j}").to_pylist()
+            datos[k] = pd.Series([_decodificar_valor(t, s) for t, s in zip(tipos, textos)], dtype=object)
+        else:
+            serie = tabla.column(f"c{j}").to_pandas()
+            if serie.dtype == object:
+                serie = serie.where(serie.notna(), np.nan)
+            datos[k] = serie
+    df = pd.DataFrame(datos, index=pd.RangeIndex(tabla.num_rows))
+    df.columns = [etiquetas[j] for j in posiciones]
+    return df
+
+
+# --- CACHÉ EN DISCO ---
+def _dir_libro(clave):
+    return os.path.join(DIR_LIBROS, clave)
+
+
+def _ruta_hoja(clave, pos_hoja, header, motor):
+    # El motor va en el nombre: otro lector puede tipar distinto algunas celdas
+    return os.path.join(_dir_libro(clave), f"h{pos_hoja}_{header}_{motor or 'defecto'}.parquet")
+
+
+def _leer_manifiesto(clave):
+    try:
+        with open(os.path.join(_dir_libro(clave), 'manifiesto.json'), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_atomico(ruta, escribir):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+    os.close(fd)
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    except Exception:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+
+def _guardar_hoja(ruta, df):
+    if pq is None: return
+    try:
+        tabla = _a_tabla(df)
+        _escribir_atomico(ruta, lambda tmp: pq.write_table(tabla, tmp))
+    except (OSError, TypeError, pa.ArrowException):
+        pass  # la hoja se vuelve a parsear la próxima vez
+
+
+def _registrar_libro(clave, hojas):
+    try:
+        os.makedirs(_dir_libro(clave), exist_ok=True)
+        if _leer_manifiesto(clave) is None:
+            def escribir(tmp):
+                with open(tmp, 'w', encoding='utf-8') as fh:
+                    json.dump({'version': VERSION_FORMATO, 'hojas': hojas}, fh, ensure_ascii=False)
+            _escribir_atomico(os.path.join(_dir_libro(clave), 'manifiesto.json'), escribir)
+        _podar_cache()
+    except OSError:
+        pass
+
+
+def escribir_parquet(ruta, df):
+    """Guarda un DataFrame con la misma codificación exacta de la caché (escritura atómica)."""
+    if pq is None:
+        raise RuntimeError("Se necesita pyarrow para guardar en Parquet")
+    tabla = _a_tabla(df)
+    _escribir_atomico(ruta, lambda tmp: pq.write_table(tabla, tmp))
+
+
+def leer_parquet(ruta, columnas=None):
+    """Lee un archivo de `escribir_parquet`; con `columnas` solo las que existan en él."""
+    meta = _meta_tabla(pq.read_schema(ruta))
+    etiquetas = [_decodificar_valor(t, s) for t, s in meta['columnas']]
+    posiciones = list(range(len(etiquetas)))
+    if columnas is not None:
+        pedidas = set(columnas)
+        posiciones = [j for j, c in enumerate(etiquetas) if c in pedidas]
+    return _de_tabla(pq.read_table(ruta, columns=_columnas_fisicas(meta, posiciones)), meta, posiciones)
+
+
+def etiquetas_parquet(ruta):
+    """Etiquetas de columna de un archivo de `escribir_parquet` (solo lee el esquema)."""
+    return _etiquetas_cache(ruta)
+
+
+def _podar_cache():
+    """Deja solo los MAX_LIBROS_CACHE libros usados más recientemente."""
+    libros = [os.path.join(DIR_LIBROS, d) for d in os.listdir(DIR_LIBROS)]
+    libros.sort(key=os.path.getmtime, reverse=True)
+    for viejo in libros[MAX_LIBROS_CACHE:]:
+        shutil.rmtree(viejo, ignore_errors=True)
+
+
+def _tocar(clave):
+    try:
+        os.utime(_dir_libro(clave))
+    except OSError:
+        pass
+
+
+# --- API ---
+def _hojas_de(datos, clave):
+    manifiesto = _leer_manifiesto(clave)
+    if manifiesto and manifiesto.get('version') == VERSION_FORMATO:
+        return manifiesto['hojas']
+    hojas = [str(h) for h in pd.ExcelFile(io.BytesIO(datos)).sheet_names]
+    _registrar_libro(clave, hojas)
+    return hojas
+
+
+def listar_hojas(file):
+    """Nombres de hoja del libro (del manifiesto si ya fue ingerido)."""
+    datos = leer_bytes(file)
+    return _hojas_de(datos, hash_contenido(datos))
+
+
+def _etiquetas_cache(ruta):
+    if pq is None or not os.path.exists(ruta): return None
+    try:
+        return [_decodificar_valor(t, s) for t, s in _meta_tabla(pq.read_schema(ruta))['columnas']]
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+
+
+def _ubicar(file, hoja, header, modo):
+    datos = leer_bytes(file)
+    clave = hash_contenido(datos)
+    hojas = _hojas_de(datos, clave)
+    if isinstance(hoja, int):
+        if not -len(hojas) <= hoja < len(hojas):
+            raise ValueError(f"Hoja número {hoja} inválida: el libro tiene {len(hojas)} ({', '.join(hojas)})")
+        pos_hoja = hoja % len(hojas)
+    elif str(hoja) in hojas:
+        pos_hoja = hojas.index(str(hoja))
+    else:
+        raise ValueError(f"No existe la hoja '{hoja}'. Hojas disponibles: {', '.join(hojas)}")
+    motor = MOTOR_RAPIDO if modo == 'hoja' else None
+    return datos, clave, pos_hoja, motor, _ruta_hoja(clave, pos_hoja, header, motor)
+
+
+def leer_cabecera(file, hoja=0, header=0, modo='libro'):
+    """Etiquetas de columna de una hoja, sin cargar sus datos si se puede evitar.
+
+    Si la hoja ya está en caché se leen del esquema Parquet. En modo 'libro' se ingiere
+    el libro completo (se necesitará enseguida); en modo 'hoja' solo se sondea la fila
+    de cabecera.
+    """
+    datos, clave, pos_hoja, motor, ruta = _ubicar(file, hoja, header, modo)
+    etiquetas = _etiquetas_cache(ruta)
+    if etiquetas is not None:
+        return etiquetas
+    if modo == 'libro':
+        return list(leer_hoja(file, hoja, header, modo).columns)
+    return list(pd.read_excel(io.BytesIO(datos), sheet_name=pos_hoja, header=header, nrows=0, engine=motor).columns)
+
+
+def _filtrar_filas(df, filtro):
+    # Se conserva la posición original de cada fila como índice
+    columna, funcion = filtro
+    filas = np.flatnonzero(np.asarray(funcion(df[columna]), dtype=bool))
+    df = df.iloc[filas]
+    df.index = filas
+    return df
+
+
+def leer_hoja(file, hoja=0, header=0, modo='libro', columnas=None, filtro=None):
+    """Lee una hoja (nombre o posición) pasando por la caché columnar.
+
+    `columnas`: etiquetas a cargar (proyección); desde Parquet solo se leen esas columnas.
+    `filtro`: (etiqueta, función serie -> máscara) para quedarse con parte de las filas;
+    el índice resultante mantiene la posición original de cada fila.
+    """
+    datos, clave, pos_hoja, motor, ruta = _ubicar(file, hoja, header, modo)
+
+    etiquetas = _etiquetas_cache(ruta)
+    if etiquetas is not None:
+        try:
+            meta = _meta_tabla(pq.read_schema(ruta))
+            posiciones = list(range(len(etiquetas)))
+            if columnas is not None:
+                pedidas = set(columnas)
+                posiciones = [j for j, c in enumerate(etiquetas) if c in pedidas]
+            tabla = pq.read_table(ruta, columns=_columnas_fisicas(meta, posiciones))
+            filas = None
+            if filtro is not None:
+                j = etiquetas.index(filtro[0])
+                serie = _de_tabla(pq.read_table(ruta, columns=_columnas_fisicas(meta, [j])), meta, [j]).iloc[:, 0]
+                filas = np.flatnonzero(np.asarray(filtro[1](serie), dtype=bool))
+                tabla = tabla.take(pa.array(filas))
+            df = _de_tabla(tabla, meta, posiciones)
+            if filas is not None:
+                df.index = filas
+            _tocar(clave)
+            return df
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            pass
+
+    if modo == 'hoja' and columnas is not None:
+        # Proyección directa sobre el XLSX; una lectura parcial no se guarda en caché
+        pedidas = set(columnas)
+        if filtro is not None: pedidas.add(filtro[0])
+        df = pd.read_excel(io.BytesIO(datos), sheet_name=pos_hoja, header=header, engine=motor,
+                           usecols=lambda c: c in pedidas)
+    elif modo == 'hoja':
+        df = pd.read_excel(io.BytesIO(datos), sheet_name=pos_hoja, header=header, engine=motor)
+        _guardar_hoja(ruta, df)
+    else:
+        libro = pd.read_excel(io.BytesIO(datos), sheet_name=None, header=header)
+        for pos, df_hoja in enumerate(libro.values()):
+            _guardar_hoja(_ruta_hoja(clave, pos, header, motor), df_hoja)
+        df = list(libro.values())[pos_hoja]
+
+    if filtro is not None:
+        df = _filtrar_filas(df, filtro)
+    if columnas is not None:
+        pedidas = set(columnas)
+        df = df[[c for c in df.columns if c in pedidas]]
+    return df
@@ -0,0 +1,110 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+import numpy as np
+
+# ==========================================
+# 📏 ÍNDICE DE INTERVALOS POR (PRODUCTO, ANÁLISIS)
+# ==========================================
+# "¿Qué clientes aceptan el valor v?" es una consulta de apuñalamiento: las filas cuyo
+# rango [Minimo, Maximo] contiene v. Se arma un árbol de intervalos centrado por cada
+# (Producto, Analisis) una sola vez por archivo y cada consulta cuesta O(log n + k)
+# en vez de recorrer todas las filas del producto.
+#
+# Mismo criterio que el filtro original: Minimo vacío = 0 y Maximo vacío = 999999.
+
+MINIMO_VACIO = 0
+MAXIMO_VACIO = 999999
+
+
+def _construir(intervalos):
+    """Árbol centrado a partir de [(lo, hi, fila)]. Cada nodo guarda los intervalos que
+    contienen su centro, ordenados por lo (ascendente) y por hi (ascendente)."""
+    if not intervalos: return None
+    puntos = sorted(p for lo, hi, _ in intervalos for p in (lo, hi))
+    centro = puntos[len(puntos) // 2]
+    izq, der, aqui = [], [], []
+    for it in intervalos:
+        if it[1] < centro: izq.append(it)
+        elif it[0] > centro: der.append(it)
+        else: aqui.append(it)
+    por_lo = sorted(aqui, key=lambda it: it[0])
+    por_hi = sorted(aqui, key=lambda it: it[1])
+    return {
+        'centro': centro,
+        'los': [it[0] for it in por_lo], 'filas_lo': [it[2] for it in por_lo],
+        'his': [it[1] for it in por_hi], 'filas_hi': [it[2] for it in por_hi],
+        'izq': _construir(izq), 'der': _construir(der),
+    }
+
+
+def _apunalar(nodo, v):
+    """Filas cuyo intervalo contiene v (sin orden)."""
+    filas = []
+    while nodo is not None:
+        if v < nodo['centro']:
+            # Contienen el centro (hi >= centro > v): basta con lo <= v
+            filas.extend(nodo['filas_lo'][:bisect_right(nodo['los'], v)])
+            nodo = nodo['izq']
+        elif v > nodo['centro']:
+            filas.extend(nodo['filas_hi'][bisect_left(nodo['his'], v):])
+            nodo = nodo['der']
+        else:
+            filas.extend(nodo['filas_lo'])
+            break
+    return filas
+
+
+class IndiceIntervalos:
+    """Índice de fichas en formato largo (Producto, Analisis, Cliente, Minimo_num, Maximo_num).
+
+    Las consultas devuelven posiciones de fila de `df` (para usar con `iloc`).
+    """
+
+    def __init__(self, df):
+        lo = df['Minimo_num'].fillna(MINIMO_VACIO).to_numpy(dtype=np.float64)
+        hi = df['Maximo_num'].fillna(MAXIMO_VACIO).to_numpy(dtype=np.float64)
+        clientes = df['Cliente'].to_numpy()
+        self.grupos = {}
+        self.clientes_producto = {}
+        for (producto, analisis), pos in df.groupby(['Producto', 'Analisis'], sort=False).indices.items():
+            # Rangos invertidos (lo > hi) no aceptan ningún valor: no entran al árbol
+            intervalos = [(lo[p], hi[p], int(p)) for p in pos if lo[p] <= hi[p]]
+            self.grupos[(producto, analisis)] = {
+                'arbol': _construir(intervalos),
+                'filas_cliente': Counter(clientes[pos]),
+            }
+        for producto, pos in df.groupby('Producto', sort=False).indices.items():
+            # Orden de aparición, como Series.unique()
+            self.clientes_producto[producto] = list(dict.fromkeys(clientes[np.sort(pos)]))
+        self._clientes = clientes
+
+    def filas(self, producto, analisis, valor):
+        """Posiciones (ordenadas) de las filas de (producto, analisis) que aceptan `valor`."""
+        grupo = self.grupos.get((producto, analisis))
+        if grupo is None: return np.empty(0, dtype=np.int64)
+        return np.sort(np.array(_apunalar(grupo['arbol'], valor), dtype=np.int64))
+
+    def _aceptan(self, producto, analisis, valor):
+        """Clientes con exigencia para el análisis que lo aceptan en TODAS sus filas."""
+        grupo = self.grupos.get((producto, analisis))
+        if grupo is None: return set(), set()
+        aceptadas = Counter(self._clientes[self.filas(producto, analisis, valor)])
+        total = grupo['filas_cliente']
+        return {c for c, n in aceptadas.items() if n == total[c]}, set(total)
+
+    def clientes_compatibles(self, producto, valores, sin_exigencia_acepta=False):
+        """Clientes cuya ficha completa acepta el lote {analisis: valor}.
+
+        Por defecto se exige que el cliente tenga especificación en cada análisis
+        consultado; con `sin_exigencia_acepta` un análisis sin exigencia no lo descarta.
+        """
+        candidatos = self.clientes_producto.get(producto, [])
+        resultado = set(candidatos)
+        for analisis, valor in valores.items():
+            aceptan, con_exigencia = self._aceptan(producto, analisis, valor)
+            if sin_exigencia_acepta:
+                aceptan |= resultado - con_exigencia
+            resultado &= aceptan
+            if not resultado: break
+        return [c for c in candidatos if c in resultado]
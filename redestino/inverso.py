@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from redestino.motor import compilar_params, construir_matriz_lotes
+from redestino.pipeline import condicion_gf
+from redestino.texto import detectar_familia_hoja, normalizar_serie
+from redestino.tipos import clasificador
+
+# ==========================================
+# 🔁 BÚSQUEDA INVERSA: LOTES QUE CUMPLEN UNA FICHA
+# ==========================================
+# Para cada columna de planta mapeada se guardan los lotes con valor válido ordenados
+# por valor y el rango (posición en ese orden) de cada lote. Un parámetro [min, max] es
+# entonces un tramo [i0, i1) del orden (dos búsquedas binarias), y la intersección se
+# hace partiendo del tramo más chico y filtrando por rango con los demás parámetros.
+# Mismo criterio que el motor: todos los parámetros mapeados cumplen, hay al menos uno
+# y la ficha es elegible para la hoja y la condición GF del lote. No hace falta la
+# evaluación lotes x fichas: del lote solo se usan su condición GF y su tipo de producto.
+
+
+def construir_indice_lotes(df_retenidos, indice_fichas, seleccion, hoja):
+    """Índice ordenado por columna mapeada sobre los lotes retenidos de una hoja."""
+    meta = seleccion['meta']
+    params = compilar_params(indice_fichas, seleccion['mapa_nombres'])
+    float32 = any(df_retenidos[c].dtype == np.float32 for c in params['columnas'])
+    valores, validos = construir_matriz_lotes(df_retenidos, params['columnas'], np.float32 if float32 else np.float64)
+
+    ordenados, rangos = [], []
+    for j in range(len(params['columnas'])):
+        filas = np.flatnonzero(validos[:, j])
+        orden = filas[np.argsort(valores[filas, j], kind='stable')]
+        rango = np.full(len(df_retenidos), -1, dtype=np.int64)
+        rango[orden] = np.arange(len(orden))
+        ordenados.append((valores[orden, j], orden))
+        rangos.append(rango)
+
+    # Los parámetros están contiguos por ficha: inicio de cada ficha en los arreglos
+    inicios = np.searchsorted(params['ficha_idx'], np.arange(len(params['codigos']) + 1))
+    return {'params': params, 'valores': valores, 'ordenados': ordenados, 'rangos': rangos, 'inicios': inicios,
+            'es_gf_lotes': condicion_gf(df_retenidos, meta, hoja),
+            'tipos_esp_norm': normalizar_serie(df_retenidos[meta['tipo']]).to_numpy() if meta['tipo'] else None}
+
+
+def lotes_para_ficha(indice_lotes, indice_fichas, ficha, hoja):
+    """Lotes retenidos compatibles con la ficha (posición en `indice_fichas`), ordenados.
+
+    Devuelve una lista de (posición del lote, txt, holgura) por (txt, holgura) descendente;
+    `holgura` es la menor distancia relativa del valor a un límite de su rango (0 = en el
+    borde, 0.5 = al centro; los límites abiertos no restringen).
+    """
+    params = indice_lotes['params']
+    ini, fin = indice_lotes['inicios'][ficha], indice_lotes['inicios'][ficha + 1]
+    cols = params['col_idx'][ini:fin]
+    mapeados = cols >= 0
+    if not mapeados.any():
+        return []
+    cols = cols[mapeados]
+    dtype = indice_lotes['valores'].dtype
+    mins = params['min'][ini:fin][mapeados].astype(dtype, copy=False)
+    maxs = params['max'][ini:fin][mapeados].astype(dtype, copy=False)
+
+    # Tramo de cada parámetro en el orden de su columna
+    tramos = []
+    for j, lo, hi in zip(cols, mins, maxs):
+        orden_valores = indice_lotes['ordenados'][j][0]
+        tramos.append((j, np.searchsorted(orden_valores, lo, 'left'), np.searchsorted(orden_valores, hi, 'right')))
+    tramos.sort(key=lambda t: t[2] - t[1])
+
+    j, i0, i1 = tramos[0]
+    candidatos = indice_lotes['ordenados'][j][1][i0:i1]
+    for j, i0, i1 in tramos[1:]:
+        if not len(candidatos): break
+        r = indice_lotes['rangos'][j][candidatos]
+        candidatos = candidatos[(r >= i0) & (r < i1)]
+
+    # Elegibilidad por condición GF del lote (la familia es la de la hoja)
+    fam_lote = detectar_familia_hoja(hoja)
+    elegible = np.array([ficha in indice_fichas['elegibles'][(fam_lote, gf)] for gf in (False, True)])
+    candidatos = np.sort(candidatos[elegible[indice_lotes['es_gf_lotes'][candidatos].astype(np.int64)]])
+    if not len(candidatos):
+        return []
+
+    tipos = indice_lotes['tipos_esp_norm']
+    txt = np.zeros(len(candidatos), dtype=np.int64)
+    if tipos is not None:
+        # Txt por tipo distinto de los candidatos contra el producto de la ficha
+        codigos, distintos = pd.factorize(pd.Series(tipos[candidatos], dtype=object), use_na_sentinel=False)
+        txt = 2 * clasificador().tabla_txt(distintos, [indice_fichas['producto_norm'][ficha]])[codigos, 0].astype(np.int64)
+
+    v = indice_lotes['valores'][np.ix_(candidatos, cols)].astype(np.float64)
+    lo, hi = mins.astype(np.float64), maxs.astype(np.float64)
+    ancho = hi - lo
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relativa = np.minimum(v - lo, hi - v) / ancho
+    # Límites abiertos (inf) o rangos de un punto: ese parámetro no limita la holgura
+    relativa = np.where(np.isfinite(ancho) & (ancho > 0), relativa, 0.5)
+    holgura = relativa.min(axis=1)
+
+    orden = np.lexsort((candidatos, -holgura, -txt))
+    return [(int(candidatos[k]), int(txt[k]), float(holgura[k])) for k in orden]
@@ -0,0 +1,125 @@
+import numpy as np
+
+# ==========================================
+# ⚙️ MOTOR VECTORIZADO LOTES × FICHAS
+# ==========================================
+
+def _columna_numerica(serie):
+    """Convierte una columna a float64 + máscara de valores numéricos válidos.
+
+    Replica el criterio del bucle original: un valor cuenta si es int/float/np.number
+    y no es NaN. Fechas y textos quedan como inválidos (⚠️).
+    """
+    kind = serie.dtype.kind
+    if kind in 'iufb':
+        vals = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    elif kind == 'O':
+        vals = np.fromiter(
+            (float(v) if isinstance(v, (int, float, np.number)) else np.nan for v in serie.to_numpy()),
+            dtype=np.float64, count=len(serie)
+        )
+    else:
+        vals = np.full(len(serie), np.nan)
+    return vals, ~np.isnan(vals)
+
+
+def construir_matriz_lotes(df, columnas, dtype=np.float64):
+    """Apila las columnas mapeadas de los lotes en una matriz (lotes × columnas)."""
+    valores = np.full((len(df), len(columnas)), np.nan, dtype=dtype)
+    validos = np.zeros((len(df), len(columnas)), dtype=bool)
+    for j, col in enumerate(columnas):
+        valores[:, j], validos[:, j] = _columna_numerica(df[col])
+    return valores, validos
+
+
+def compilar_params(indice, mapa_nombres):
+    """Arma los arreglos de parámetros del motor a partir del índice compilado de fichas.
+
+    `mapa_nombres` asocia cada `nombre_norm` a su columna de planta (o None). Los
+    parámetros quedan contiguos por ficha y en el mismo orden del índice, de modo que
+    los resultados se pueden indexar por posición de ficha.
+    """
+    offsets = indice['param_offsets']
+    n_fichas = len(indice['codigos'])
+    columnas = []
+    pos_columna = {}
+    col_de_nombre = np.full(len(indice['nombres_norm']), -1, dtype=np.int64)
+    for nid, p_norm in enumerate(indice['nombres_norm']):
+        col_real = mapa_nombres.get(p_norm)
+        if not col_real: continue
+        j = pos_columna.get(col_real)
+        if j is None:
+            j = pos_columna[col_real] = len(columnas)
+            columnas.append(col_real)
+        col_de_nombre[nid] = j
+    return {
+        'codigos': indice['codigos'],
+        'columnas': columnas,
+        'ficha_idx': np.repeat(np.arange(n_fichas, dtype=np.int64), np.diff(offsets)),
+        'col_idx': col_de_nombre[indice['param_nombre_id']],
+        'min': indice['param_min'],
+        'max': indice['param_max'],
+    }
+
+
+def restringir_params(params, fichas):
+    """Subconjunto de `params` con solo las fichas indicadas (posiciones, ordenadas).
+
+    Las fichas se renumeran 0..len(fichas)-1; `fichas` permite volver a la posición global.
+    """
+    fichas = np.asarray(fichas, dtype=np.int64)
+    local = np.full(len(params['codigos']), -1, dtype=np.int64)
+    local[fichas] = np.arange(len(fichas))
+    sel = local[params['ficha_idx']] >= 0
+    return {
+        'codigos': [params['codigos'][f] for f in fichas],
+        'columnas': params['columnas'],
+        'fichas': fichas,
+        'ficha_idx': local[params['ficha_idx'][sel]],
+        'col_idx': params['col_idx'][sel],
+        'min': params['min'][sel],
+        'max': params['max'][sel],
+    }
+
+
+def evaluar_compatibilidad(valores, validos, params, tamano_bloque=4096):
+    """Evalúa en bloque la compatibilidad de todos los lotes contra todas las fichas.
+
+    Devuelve `aciertos` (lotes × fichas), `encontrados` (por ficha, no depende del lote),
+    `compatible` (todos los parámetros mapeados cumplen y hay al menos uno) y
+    `score` (% de aciertos sobre encontrados).
+    """
+    n_lotes = valores.shape[0]
+    n_fichas = len(params['codigos'])
+
+    mapeados = params['col_idx'] >= 0
+    ficha_m = params['ficha_idx'][mapeados]
+    col_m = params['col_idx'][mapeados]
+    # Límites en la precisión de los valores (en float32 ambos lados se redondean igual)
+    min_m = params['min'][mapeados].astype(valores.dtype, copy=False)
+    max_m = params['max'][mapeados].astype(valores.dtype, copy=False)
+
+    encontrados = np.bincount(ficha_m, minlength=n_fichas)
+    con_params = np.flatnonzero(encontrados)
+    # Los parámetros mapeados siguen contiguos por ficha: basta con los inicios de cada tramo
+    inicios = np.concatenate(([0], np.cumsum(encontrados)[:-1]))[con_params]
+
+    aciertos = np.zeros((n_lotes, n_fichas), dtype=np.int32)
+    if len(col_m):
+        for ini in range(0, n_lotes, tamano_bloque):
+            fin = min(ini + tamano_bloque, n_lotes)
+            v = valores[ini:fin, col_m]
+            cumple = validos[ini:fin, col_m] & (v >= min_m) & (v <= max_m)
+            aciertos[ini:fin, con_params] = np.add.reduceat(cumple, inicios, axis=1, dtype=np.int32)
+
+    compatible = (aciertos == encontrados) & (encontrados > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(encontrados > 0, aciertos / np.maximum(encontrados, 1) * 100, 0.0)
+
+    return {
+        'aciertos': aciertos,
+        'encontrados': encontrados,
+        'compatible': compatible,
+        'score': score,
+    }
+
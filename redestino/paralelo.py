@@ -0,0 +1,66 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from redestino.ingesta import leer_bytes, listar_hojas
+from redestino.pipeline import cabecera_planta, procesar_hoja
+
+# ==========================================
+# 🧵 TODAS LAS HOJAS EN PARALELO
+# ==========================================
+# Cada hoja (hojuela, harina, groat, pillow, variantes GF) es un problema independiente:
+# su propia familia y marca GF. Se reparte una hoja por tarea entre procesos; el libro y
+# el índice de fichas compilado se envían una sola vez por proceso (inicializador), no
+# una vez por hoja.
+
+_estado = {}
+
+
+def _iniciar_trabajador(datos_planta, indice_fichas, opciones):
+    _estado.update(datos=datos_planta, indice=indice_fichas, opciones=opciones)
+
+
+def _procesar_una(hoja, datos_planta, indice_fichas, opciones):
+    inicio = time.perf_counter()
+    try:
+        filas = [f for tanda in procesar_hoja(io.BytesIO(datos_planta), indice_fichas, hoja, **opciones) for f in tanda]
+        return hoja, filas, None, time.perf_counter() - inicio
+    except ValueError as e:
+        return hoja, [], str(e), time.perf_counter() - inicio
+    except Exception as e:  # cualquier otra falla de una hoja no debe tumbar el libro entero
+        return hoja, [], f"Error en la hoja '{hoja}': {type(e).__name__}: {e}", time.perf_counter() - inicio
+
+
+def _procesar_en_trabajador(hoja):
+    return _procesar_una(hoja, _estado['datos'], _estado['indice'], _estado['opciones'])
+
+
+def procesar_libro(file_planta, indice_fichas, hojas=None, procesos=None, **opciones):
+    """Procesa varias hojas de planta (todas por defecto) en procesos paralelos.
+
+    `opciones` son las de `procesar_hoja` (rango, estrategia, modo, solo_retenidos, top_k...).
+    Genera (hoja, filas de reporte, error o None, segundos) en el orden de las hojas; una
+    hoja que falla (p. ej. sin columna de estado) sale con su error y sin filas.
+    """
+    datos = leer_bytes(file_planta)
+    if hojas is None:
+        hojas = listar_hojas(io.BytesIO(datos))
+    if not hojas:
+        return
+    if opciones.get('modo', 'libro') == 'libro':
+        # El libro se ingiere una vez aquí; los procesos leen cada hoja desde la caché Parquet
+        cabecera_planta(io.BytesIO(datos), hojas[0], 'libro')
+
+    procesos = min(len(hojas), procesos or os.cpu_count() or 1)
+    if procesos == 1:
+        for hoja in hojas:
+            yield _procesar_una(hoja, datos, indice_fichas, opciones)
+        return
+
+    # 'spawn': no se clona el proceso del servidor (hilos de Streamlit incluidos)
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=_iniciar_trabajador,
+                             initargs=(datos, indice_fichas, opciones)) as pool:
+        yield from pool.map(_procesar_en_trabajador, hojas)
@@ -0,0 +1,314 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from redestino.columnas import detectar_metadatos, resolver_mapeo
+from redestino import historial
+from redestino.fichas import compilar_fichas
+from redestino.imputacion import convertir_numericas, imputar
+from redestino.ingesta import leer_cabecera, leer_hoja
+from redestino.motor import compilar_params, construir_matriz_lotes, evaluar_compatibilidad, restringir_params
+from redestino.texto import normalizar_texto, normalizar_serie, contiene_normalizado, detectar_familia_hoja, es_texto_gf, es_texto_gf_serie
+from redestino.tipos import clasificador
+
+# ==========================================
+# 🛠️ ETAPAS DEL PROCESO (SIN STREAMLIT)
+# ==========================================
+# Cada etapa es una función pura de sus entradas, para que la app pueda guardar en
+# caché cada salida con la clave de lo que realmente la determina:
+#
+#   fichas      <- archivo de fichas                    (índice columnar)
+#   columnas    <- cabecera de planta + fichas          (mapeo y columnas a cargar)
+#   carga       <- archivo de planta + hoja + columnas  (DataFrame crudo)
+#   preparación <- carga + rango de fechas + imputación (retenidos ya imputados)
+#   evaluación  <- preparación + fichas                 (compatibilidad lote x ficha)
+#   candidatos  <- evaluación + K                       (top-K numérico por lote)
+#
+# Así, mover el rango de fechas reutiliza la hoja cargada y el mapeo de columnas.
+
+KEYS_TECH = ['humedad', 'espesor', 'malla', 'ret', 'bajo', 'sobre', 'densidad', 'gelatina', 'quemada', 'peroxido', 'acidez', 'materia']
+
+FILA_CABECERA_PLANTA = 1
+
+# Modo de lectura que toma los lotes del historial de libros (redestino/historial.py) en vez
+# de un archivo: `file` se ignora y la carga lee solo las particiones del rango de fechas.
+MODO_HISTORIAL = 'historial'
+
+
+def leer_fichas(file):
+    """Fichas técnicas crudas: CSV o primera hoja del Excel (por la caché columnar)."""
+    nombre = getattr(file, 'name', str(file))
+    if nombre.endswith('.csv'):
+        return pd.read_csv(file)
+    return leer_hoja(file, 0)
+
+
+def cargar_fichas(file):
+    """Fichas técnicas compiladas. Devuelve (indice, error)."""
+    return compilar_fichas(leer_fichas(file))
+
+
+def cabecera_planta(file, hoja, modo='libro'):
+    if modo == MODO_HISTORIAL:
+        return historial.cabecera(hoja)
+    return leer_cabecera(file, hoja, header=FILA_CABECERA_PLANTA, modo=modo)
+
+
+def cargar_planta(file, hoja, modo='libro', columnas=None, col_estado_retenidos=None, rango=None):
+    """Hoja de planta con solo las `columnas` pedidas (y solo retenidos si se indica la columna de estado).
+
+    `rango` solo se usa en el modo historial (se leen las particiones que toca); de un
+    libro se carga la hoja entera y el rango se aplica al preparar.
+    """
+    filtro = None
+    if col_estado_retenidos is not None:
+        filtro = (col_estado_retenidos, lambda s: contiene_normalizado(s, 'retenido'))
+    if modo == MODO_HISTORIAL:
+        return historial.leer_rango(hoja, rango, columnas, filtro)
+    return leer_hoja(file, hoja, header=FILA_CABECERA_PLANTA, modo=modo, columnas=columnas, filtro=filtro)
+
+
+def ingresar_historial(file, nombre=None):
+    """Agrega un libro de planta al historial (ver historial.ingresar_libro)."""
+    return historial.ingresar_libro(file, FILA_CABECERA_PLANTA, nombre)
+
+
+def seleccionar_columnas(indice_fichas, columnas_planta):
+    """Columnas de metadatos, mapeo de parámetros y columnas a cargar para una cabecera."""
+    meta = detectar_metadatos(columnas_planta)
+
+    # Un solo mapeo por nombre normalizado (compartido por todas las fichas), memorizado por cabeceras
+    mapa_nombres = resolver_mapeo(indice_fichas['nombres_norm'], indice_fichas['tipo_param_nombre'], columnas_planta)
+
+    # Columnas técnicas para el resumen: se normalizan una vez, no por lote
+    cols_tech = [col for col in columnas_planta if any(k in normalizar_texto(col) for k in KEYS_TECH)]
+
+    # Solo metadatos, columnas mapeadas por alguna ficha y columnas del resumen
+    cols_meta = [meta[k] for k in ('status', 'lote', 'folio', 'cond', 'tipo', 'cli_orig', 'motivo', 'fecha')]
+    necesarias = set(c for c in cols_meta if c is not None) | set(c for c in mapa_nombres.values() if c) | set(cols_tech)
+    cols_carga = tuple(c for c in columnas_planta if c in necesarias)
+
+    return {'meta': meta, 'cols_meta': cols_meta, 'mapa_nombres': mapa_nombres, 'cols_tech': cols_tech, 'cols_carga': cols_carga}
+
+
+def preparar_planta(df_planta, seleccion, rango=None, estrategia='media', liviano=False):
+    """Filtro de fechas, conversión numérica, imputación y filtro de retenidos.
+
+    `rango` es (desde, hasta) en fechas o None. Devuelve (df_retenidos, mascara_ret).
+    En modo `liviano` las mediciones quedan en float32, los metadatos de texto en
+    categorías y `df_planta` se modifica en su lugar (sin copia de la hoja entera).
+    """
+    meta = seleccion['meta']
+    c_fecha = meta['fecha']
+
+    # --- FILTRO FECHA ---
+    if c_fecha:
+        df_planta[c_fecha] = pd.to_datetime(df_planta[c_fecha], errors='coerce')
+    if c_fecha and rango is not None:
+        # Comparación directa con datetime64 (sin un objeto date por fila)
+        desde, hasta = historial.limites_rango(rango)
+        mask = (df_planta[c_fecha] >= desde) & (df_planta[c_fecha] < hasta)
+        df_planta_filtrada = df_planta[mask] if liviano else df_planta[mask].copy()
+    else:
+        df_planta_filtrada = df_planta if liviano else df_planta.copy()
+
+    # --- IMPUTACIÓN ---
+    # Solo se tocan las columnas que alguna ficha mapea o que muestra el resumen
+    cols_usadas = set(c for c in seleccion['mapa_nombres'].values() if c) | set(seleccion['cols_tech'])
+    cols_imputar = [c for c in df_planta_filtrada.columns if c in cols_usadas]
+    convertir_numericas(df_planta_filtrada, [c for c in cols_imputar if c not in seleccion['cols_meta']],
+                        np.float32 if liviano else None)
+    if liviano:
+        categorizar_metadatos(df_planta_filtrada, meta, excluir=cols_imputar)
+    mascara_imputados = imputar(df_planta_filtrada, cols_imputar, meta['agrupacion'],
+                                estrategia=estrategia, col_fecha=c_fecha)
+
+    # Filtrar Retenidos (la máscara de imputados se recorta por posición)
+    mask_ret = contiene_normalizado(df_planta_filtrada[meta['status']], 'retenido').to_numpy()
+    if mask_ret.all():
+        # Carga de solo retenidos: nada que seleccionar
+        return df_planta_filtrada, mascara_imputados
+    posiciones = np.flatnonzero(mask_ret)
+    return df_planta_filtrada.iloc[posiciones], mascara_imputados.subconjunto(posiciones)
+
+
+# Metadatos de texto muy repetidos (estado, lote, cliente, motivo, tipo de producto)
+METADATOS_CATEGORICOS = ('status', 'lote', 'cli_orig', 'motivo', 'tipo')
+
+
+def categorizar_metadatos(df, meta, excluir=()):
+    """Pasa a `category` (in place) las columnas de metadatos de texto."""
+    for k in METADATOS_CATEGORICOS:
+        col = meta[k]
+        if col and col not in excluir and df[col].dtype.kind == 'O' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+
+def memoria_mb(df, *extras):
+    """Memoria de un DataFrame (con el contenido de los textos) más arreglos/máscaras con `nbytes`."""
+    total = df.memory_usage(deep=True).sum() + sum(e.nbytes for e in extras)
+    return round(total / (1024 * 1024), 2)
+
+
+def condicion_gf(df_retenidos, meta, hoja):
+    """Condición GF por lote: la de la hoja o la de su columna de condición."""
+    es_hoja_gf = es_texto_gf(hoja)
+    if meta['cond']:
+        return es_hoja_gf | es_texto_gf_serie(df_retenidos[meta['cond']])
+    return np.full(len(df_retenidos), es_hoja_gf, dtype=bool)
+
+
+def evaluar_lotes(df_retenidos, indice_fichas, seleccion, hoja, fichas=None):
+    """Compatibilidad en bloque de los retenidos contra las fichas elegibles de la hoja.
+
+    Con `fichas` (posiciones) solo se evalúan las elegibles que estén entre ellas.
+    """
+    meta = seleccion['meta']
+    fam_lote = detectar_familia_hoja(hoja)
+
+    tipos_esp_norm = normalizar_serie(df_retenidos[meta['tipo']]).to_numpy() if meta['tipo'] else None
+
+    # La familia es fija por hoja, así que solo hay dos grupos de fichas elegibles (GF o no)
+    es_gf_lotes = condicion_gf(df_retenidos, meta, hoja)
+
+    # Cada grupo GF solo contra sus fichas elegibles
+    params_comp = compilar_params(indice_fichas, seleccion['mapa_nombres'])
+    # Modo liviano: si las mediciones vienen en float32, la matriz y la comparación también
+    float32 = any(df_retenidos[c].dtype == np.float32 for c in params_comp['columnas'])
+    valores_lotes, validos_lotes = construir_matriz_lotes(df_retenidos, params_comp['columnas'],
+                                                          np.float32 if float32 else np.float64)
+    resultados_gf = {}
+    pos_en_grupo = np.zeros(len(df_retenidos), dtype=np.int64)
+    for gf in (False, True):
+        filas_gf = np.flatnonzero(es_gf_lotes == gf)
+        if not len(filas_gf): continue
+        pos_en_grupo[filas_gf] = np.arange(len(filas_gf))
+        elegibles = indice_fichas['elegibles'][(fam_lote, gf)]
+        if fichas is not None:
+            elegibles = elegibles[np.isin(elegibles, fichas)]
+        params_gf = restringir_params(params_comp, elegibles)
+        resultados_gf[gf] = (params_gf, evaluar_compatibilidad(valores_lotes[filas_gf], validos_lotes[filas_gf], params_gf))
+
+    return {'tipos_esp_norm': tipos_esp_norm, 'es_gf_lotes': es_gf_lotes,
+            'resultados_gf': resultados_gf, 'pos_en_grupo': pos_en_grupo}
+
+
+def seleccionar_candidatos(evaluacion, indice_fichas, k=10):
+    """Top-K de fichas compatibles por lote, ordenadas por (Txt, Score, N) descendente.
+
+    Solo guarda resultados numéricos; los detalles por parámetro se arman aparte y
+    solo para el lote que se abre. Devuelve (n_compatibles por lote, top por lote),
+    donde cada top es una lista de tuplas (ficha, txt, score, aciertos, encontrados)
+    con `ficha` = posición en `indice_fichas`.
+    """
+    tipos_esp_norm = evaluacion['tipos_esp_norm']
+    es_gf_lotes = evaluacion['es_gf_lotes']
+    pos_en_grupo = evaluacion['pos_en_grupo']
+
+    # Txt de todos los pares (tipo de producto distinto, ficha) de una vez; luego se toma
+    # la fila del tipo restringida a las fichas elegibles de cada grupo GF
+    if tipos_esp_norm is not None:
+        codigos_tipo, tipos_distintos = pd.factorize(pd.Series(tipos_esp_norm, dtype=object), use_na_sentinel=False)
+    else:
+        codigos_tipo, tipos_distintos = np.zeros(len(es_gf_lotes), dtype=np.int64), ['']
+    tabla_txt = 2 * clasificador().tabla_txt(tipos_distintos, indice_fichas['producto_norm']).astype(np.int64)
+    memo_txt = {}
+    def txt_fichas(gf, codigo):
+        if (gf, codigo) not in memo_txt:
+            memo_txt[(gf, codigo)] = tabla_txt[codigo, evaluacion['resultados_gf'][gf][0]['fichas']].tolist()
+        return memo_txt[(gf, codigo)]
+
+    n_compatibles = np.zeros(len(es_gf_lotes), dtype=np.int64)
+    tops = []
+    for pos in range(len(es_gf_lotes)):
+        gf = bool(es_gf_lotes[pos])
+        params_gf, resultado = evaluacion['resultados_gf'][gf]
+        fila = pos_en_grupo[pos]
+        compatibles = np.flatnonzero(resultado['compatible'][fila])
+        n_compatibles[pos] = len(compatibles)
+        if not len(compatibles):
+            tops.append([])
+            continue
+
+        txt = txt_fichas(gf, codigos_tipo[pos])
+        score = resultado['score'][fila]
+        encontrados = resultado['encontrados']
+        # nlargest == sorted(reverse=True)[:k]: en empate se respeta el orden de las fichas
+        mejores = heapq.nlargest(k, compatibles.tolist(), key=lambda f: (txt[f], score[f], encontrados[f]))
+        tops.append([(int(params_gf['fichas'][f]), txt[f], float(score[f]),
+                      int(resultado['aciertos'][fila, f]), int(encontrados[f])) for f in mejores])
+    return n_compatibles, tops
+
+
+# --- REPORTE POR LOTE ---
+COLUMNAS_REPORTE = ['hoja', 'folio', 'lote', 'producto', 'gf', 'motivo', 'cliente_original', 'n_compatibles',
+                    'rank', 'codigo_ft', 'cliente', 'producto_ficha', 'score', 'txt', 'match']
+
+
+def filas_reporte(df_retenidos, seleccion, evaluacion, n_compatibles, tops, indice_fichas, hoja):
+    """Una fila por (lote, candidato del top-K); los lotes sin candidatos salen con rank vacío."""
+    meta = seleccion['meta']
+
+    def textos(col, defecto):
+        return [str(v) for v in df_retenidos[col].tolist()] if col else [defecto] * len(df_retenidos)
+
+    folios = textos(meta['folio'], "") if meta['folio'] else [f"{idx}" for idx in df_retenidos.index]
+    lotes = textos(meta['lote'], "N/A")
+    tipos = textos(meta['tipo'], "")
+    motivos = textos(meta['motivo'], "")
+    origenes = textos(meta['cli_orig'], "")
+
+    for pos in range(len(df_retenidos)):
+        base = {
+            'hoja': hoja, 'folio': folios[pos], 'lote': lotes[pos], 'producto': tipos[pos],
+            'gf': bool(evaluacion['es_gf_lotes'][pos]), 'motivo': motivos[pos],
+            'cliente_original': origenes[pos], 'n_compatibles': int(n_compatibles[pos]),
+        }
+        if not tops[pos]:
+            yield dict(base, rank=None, codigo_ft=None, cliente=None, producto_ficha=None, score=None, txt=None, match=None)
+        for rank, (f, txt, score, aciertos, encontrados) in enumerate(tops[pos], 1):
+            yield dict(base, rank=rank, codigo_ft=str(indice_fichas['codigos'][f]), cliente=str(indice_fichas['cliente'][f]),
+                       producto_ficha=str(indice_fichas['producto'][f]), score=score, txt=txt, match=f"{aciertos}/{encontrados}")
+
+
+def rangos_tandas(n, tamano_tanda=5000, primera_tanda=None):
+    """(inicio, fin) de cada tanda de `n` lotes; `primera_tanda` permite una primera más chica."""
+    inicio = 0
+    tamano = primera_tanda or tamano_tanda
+    while inicio < n:
+        yield inicio, min(inicio + tamano, n)
+        inicio += tamano
+        tamano = tamano_tanda
+
+
+def evaluar_por_tandas(df_retenidos, indice_fichas, seleccion, hoja, top_k=10, tamano_tanda=5000, primera_tanda=None):
+    """Compatibilidad y top-K por tandas de lotes: genera (inicio, tanda, evaluacion, n_compatibles, tops)."""
+    for inicio, fin in rangos_tandas(len(df_retenidos), tamano_tanda, primera_tanda):
+        tanda = df_retenidos.iloc[inicio:fin]
+        evaluacion = evaluar_lotes(tanda, indice_fichas, seleccion, hoja)
+        n_compatibles, tops = seleccionar_candidatos(evaluacion, indice_fichas, top_k)
+        yield inicio, tanda, evaluacion, n_compatibles, tops
+
+
+def procesar_hoja(file_planta, indice_fichas, hoja, rango=None, estrategia='media', modo='libro',
+                  solo_retenidos=False, top_k=10, tamano_tanda=5000, liviano=False):
+    """Proceso completo de una hoja sin interfaz: genera tandas (listas) de filas de reporte.
+
+    La carga e imputación usan la hoja entera; la compatibilidad se evalúa por tandas de
+    `tamano_tanda` lotes, así la matriz lote x ficha no crece con el largo de la hoja.
+    Lanza ValueError si la hoja no tiene columna de estado.
+    """
+    seleccion = seleccionar_columnas(indice_fichas, cabecera_planta(file_planta, hoja, modo))
+    meta = seleccion['meta']
+    if not meta['status']:
+        raise ValueError(f"Falta columna ESTADO en la hoja '{hoja}'")
+
+    df_planta = cargar_planta(file_planta, hoja, modo, seleccion['cols_carga'], meta['status'] if solo_retenidos else None,
+                              rango)
+    df_retenidos, _ = preparar_planta(df_planta, seleccion, rango, estrategia, liviano)
+    del df_planta
+
+    for _, tanda, evaluacion, n_compatibles, tops in evaluar_por_tandas(df_retenidos, indice_fichas, seleccion, hoja,
+                                                                        top_k, tamano_tanda):
+        yield list(filas_reporte(tanda, seleccion, evaluacion, n_compatibles, tops, indice_fichas, hoja))
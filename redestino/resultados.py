@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from redestino.config import DIR_CACHE
+from redestino.motor import compilar_params, construir_matriz_lotes
+from redestino.pipeline import condicion_gf, evaluar_lotes, seleccionar_candidatos
+from redestino.texto import normalizar_serie
+from redestino.tipos import clasificador
+
+# ==========================================
+# 💾 CACHÉ PERSISTENTE DE RESULTADOS POR LOTE (SQLite)
+# ==========================================
+# Cada día se reabre el mismo libro de planta, un poco más largo, y casi todos los lotes
+# siguen igual. Por lote se guarda la lista completa de fichas compatibles, ya ordenada,
+# una por línea (un acierto solo decodifica las K primeras), bajo:
+#   contexto   almacén de fichas + hoja + mapeo de columnas + precisión + tabla de sinónimos
+#   identidad  folio | lote (o la fila de la hoja si no hay columnas de folio ni lote)
+#   huella     valores mapeados + marcas de imputación + tipo de producto + condición GF
+#   versión    versión del almacén de fichas con que se calculó (ver almacen.py); como
+#              el almacén va en el contexto, uno recreado no reutiliza números de versión
+# Misma huella y misma versión: se reutiliza tal cual. Misma huella y versión anterior: el
+# lote se evalúa solo contra las fichas nuevas o modificadas desde esa versión y se combina
+# con lo guardado (las fichas borradas se descartan). Lo demás se calcula completo.
+# La tabla se limita a `max_entradas` lotes; se descartan los usados hace más tiempo.
+
+ARCHIVO_RESULTADOS = os.path.join(DIR_CACHE, 'resultados.sqlite')
+MAX_ENTRADAS = 200_000
+
+# Sube si cambia la forma de calcular un resultado (invalida todo lo guardado)
+ESQUEMA_RESULTADOS = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS lotes (
+    contexto TEXT NOT NULL,
+    identidad TEXT NOT NULL,
+    huella TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    n_compatibles INTEGER NOT NULL,
+    candidatos TEXT NOT NULL,
+    usado REAL NOT NULL,
+    PRIMARY KEY (contexto, identidad, huella)
+);
+CREATE INDEX IF NOT EXISTS lotes_usado ON lotes (usado);
+"""
+
+# Contadores acumulados (entre sesiones y días) para la tasa de aciertos
+CONTADORES = ('consultas', 'aciertos', 'parciales')
+
+# SQLite limita la cantidad de parámetros por sentencia
+_TAMANO_CONSULTA = 500
+
+
+@contextmanager
+def _conexion(ruta):
+    """Conexión en una transacción (commit al salir sin errores) que siempre se cierra."""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    conn = sqlite3.connect(ruta, timeout=30)
+    try:
+        conn.executescript(_ESQUEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _codificar(lista, codigos_json):
+    # Una ficha por línea, en JSON: [código, txt, score, aciertos, encontrados] (códigos ya codificados)
+    return '\n'.join(f"[{codigos_json[f]},{txt},{score!r},{aciertos},{encontrados}]"
+                     for f, txt, score, aciertos, encontrados in lista)
+
+
+def _decodificar(texto, k=None):
+    if not texto: return []
+    lineas = texto.split('\n', k)[:k] if k is not None else texto.split('\n')
+    return json.loads('[' + ','.join(lineas) + ']')
+
+
+def _orden(candidato):
+    # Mismo orden que seleccionar_candidatos: (txt, score, encontrados) descendente y, en
+    # empate, la posición de la ficha (los códigos están ordenados en el índice)
+    f, txt, score, _, encontrados = candidato
+    return -txt, -score, -encontrados, f
+
+
+class CacheResultados:
+    """Resultados por lote de una hoja contra una versión del catálogo de fichas.
+
+    `almacen`, `version` y `versiones` salen de Catalogo.sincronizar_almacen(): el
+    identificador y la versión del almacén y {codigo: versión en que cambió por última vez}
+    de cada ficha.
+    """
+
+    def __init__(self, indice_fichas, seleccion, hoja, almacen, version, versiones, ruta=None,
+                 max_entradas=MAX_ENTRADAS):
+        self.indice = indice_fichas
+        self.seleccion = seleccion
+        self.hoja = hoja
+        self.almacen = almacen
+        self.version = version
+        self.versiones = versiones
+        self.ruta = ruta or ARCHIVO_RESULTADOS
+        self.max_entradas = max_entradas
+        self.params = compilar_params(indice_fichas, seleccion['mapa_nombres'])
+        self.codigos = [str(c) for c in indice_fichas['codigos']]
+        self.posicion = {c: f for f, c in enumerate(self.codigos)}
+        self._codigos_json = [json.dumps(c, ensure_ascii=False) for c in self.codigos]
+        # Lotes de esta corrida: reutilizados, completados con las fichas cambiadas y calculados
+        self.aciertos = self.parciales = self.calculados = 0
+
+    def _contexto(self, float32):
+        mapeo = sorted((str(k), str(v)) for k, v in self.seleccion['mapa_nombres'].items() if v)
+        # La tabla de sinónimos decide el Txt: editarla invalida los resultados guardados
+        texto = json.dumps([ESQUEMA_RESULTADOS, self.almacen, self.hoja, mapeo, float32, clasificador().huella], ensure_ascii=False)
+        return hashlib.blake2b(texto.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _identidades(self, df):
+        meta = self.seleccion['meta']
+        partes = [df[c].astype(str).to_numpy() for c in (meta['folio'], meta['lote']) if c]
+        if not partes:
+            return [str(i) for i in df.index]
+        return ['|'.join(t) for t in zip(*partes)]
+
+    def _huellas(self, df, mascara, es_gf, float32):
+        # Columnas por nombre (no en el orden del índice, que cambia al agregar o quitar fichas)
+        columnas = sorted(set(c for c in self.seleccion['mapa_nombres'].values() if c))
+        valores, validos = construir_matriz_lotes(df, columnas, np.float32 if float32 else np.float64)
+        datos = {f"v{j}": np.where(validos[:, j], valores[:, j], np.nan) for j in range(len(columnas))}
+        datos.update({f"i{j}": mascara.columna(c) for j, c in enumerate(columnas)})
+        meta = self.seleccion['meta']
+        datos['tipo'] = normalizar_serie(df[meta['tipo']]).to_numpy() if meta['tipo'] else ''
+        datos['gf'] = np.asarray(es_gf, dtype=bool)
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(datos), index=False).to_numpy()
+        return [f"{h:016x}" for h in hashes]
+
+    def _fichas_cambiadas(self, version):
+        """Posiciones de las fichas nuevas o modificadas después de `version`."""
+        return np.array([f for f, c in enumerate(self.codigos) if self.versiones.get(c, self.version + 1) > version],
+                        dtype=np.int64)
+
+    def _completos(self, df, fichas=None):
+        """Lista ordenada de todas las fichas compatibles de cada lote (posiciones en el índice)."""
+        evaluacion = evaluar_lotes(df, self.indice, self.seleccion, self.hoja, fichas)
+        _, listas = seleccionar_candidatos(evaluacion, self.indice, len(self.codigos))
+        return listas
+
+    def candidatos(self, df_retenidos, mascara, k=10):
+        """Como evaluar_lotes + seleccionar_candidatos, reutilizando lo guardado.
+
+        Devuelve (es_gf_lotes, n_compatibles, tops); `mascara` es la de imputados de estas filas.
+        """
+        float32 = any(df_retenidos[c].dtype == np.float32 for c in self.params['columnas'])
+        contexto = self._contexto(float32)
+        es_gf = condicion_gf(df_retenidos, self.seleccion['meta'], self.hoja)
+        identidades = self._identidades(df_retenidos)
+        huellas = self._huellas(df_retenidos, mascara, es_gf, float32)
+
+        with _conexion(self.ruta) as conn:
+            guardados = {}
+            for i in range(0, len(identidades), _TAMANO_CONSULTA):
+                lote_ids = list(dict.fromkeys(identidades[i:i + _TAMANO_CONSULTA]))
+                marcas = ','.join('?' * len(lote_ids))
+                for ident, huella, version, n, candidatos in conn.execute(
+                        f"SELECT identidad, huella, version, n_compatibles, candidatos FROM lotes "
+                        f"WHERE contexto = ? AND identidad IN ({marcas})", [contexto] + lote_ids):
+                    guardados[(ident, huella)] = (version, n, candidatos)
+
+        n_compatibles = np.zeros(len(df_retenidos), dtype=np.int64)
+        tops = [None] * len(df_retenidos)
+        listas = {}
+        usados, a_calcular, a_completar = [], [], {}
+        for pos, clave in enumerate(zip(identidades, huellas)):
+            guardado = guardados.get(clave)
+            if guardado is None or guardado[0] > self.version:
+                # Nuevo, cambiado o calculado con otro catálogo más reciente
+                a_calcular.append(pos)
+                continue
+            version, n, candidatos = guardado
+            if version == self.version:
+                # Acierto: solo se decodifican los K primeros. Un código que no está en el índice
+                # (almacén e índice desfasados) invalida la entrada: se recalcula
+                decodificados = _decodificar(candidatos, k)
+                if any(c not in self.posicion for c, *_ in decodificados):
+                    a_calcular.append(pos)
+                    continue
+                n_compatibles[pos] = n
+                tops[pos] = [(self.posicion[c], txt, score, aciertos, encontrados)
+                             for c, txt, score, aciertos, encontrados in decodificados]
+                usados.append(pos)
+                continue
+            # Versión anterior: fuera las fichas borradas y las cambiadas desde entonces. Una
+            # ficha que el almacén aún tiene pero el índice no, invalida la entrada
+            decodificados = _decodificar(candidatos)
+            if any(c not in self.posicion and c in self.versiones for c, *_ in decodificados):
+                a_calcular.append(pos)
+                continue
+            listas[pos] = [(self.posicion[c], txt, score, aciertos, encontrados)
+                           for c, txt, score, aciertos, encontrados in decodificados
+                           if c in self.posicion and self.versiones.get(c, self.version + 1) <= version]
+            a_completar.setdefault(version, []).append(pos)
+
+        if a_calcular:
+            for pos, lista in zip(a_calcular, self._completos(df_retenidos.iloc[a_calcular])):
+                listas[pos] = lista
+        for version, posiciones in a_completar.items():
+            cambiadas = self._fichas_cambiadas(version)
+            if len(cambiadas):
+                nuevas = self._completos(df_retenidos.iloc[posiciones], cambiadas)
+                for pos, lista in zip(posiciones, nuevas):
+                    listas[pos] = sorted(listas[pos] + lista, key=_orden)
+
+        for pos, lista in listas.items():
+            n_compatibles[pos] = len(lista)
+            tops[pos] = lista[:k]
+
+        ahora = time.time()
+        completados = [pos for posiciones in a_completar.values() for pos in posiciones]
+        with _conexion(self.ruta) as conn:
+            # Uso reciente por identidad (para descartar primero lo que no se consulta)
+            usados_ids = list(dict.fromkeys(identidades[pos] for pos in usados))
+            for i in range(0, len(usados_ids), _TAMANO_CONSULTA):
+                lote_ids = usados_ids[i:i + _TAMANO_CONSULTA]
+                conn.execute(f"UPDATE lotes SET usado = ? WHERE contexto = ? AND identidad IN ({','.join('?' * len(lote_ids))})",
+                             [ahora, contexto] + lote_ids)
+            conn.executemany(
+                "INSERT OR REPLACE INTO lotes (contexto, identidad, huella, version, n_compatibles, candidatos, usado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((contexto, identidades[pos], huellas[pos], self.version, len(listas[pos]),
+                  _codificar(listas[pos], self._codigos_json), ahora) for pos in a_calcular + completados))
+            for nombre, n in zip(CONTADORES, (len(df_retenidos), len(usados), len(completados))):
+                conn.execute("INSERT INTO meta (clave, valor) VALUES (?, ?) "
+                             "ON CONFLICT (clave) DO UPDATE SET valor = valor + excluded.valor", (nombre, n))
+            # Límite de tamaño: fuera los lotes usados hace más tiempo
+            sobrantes = conn.execute("SELECT COUNT(*) FROM lotes").fetchone()[0] - self.max_entradas
+            if sobrantes > 0:
+                conn.execute("DELETE FROM lotes WHERE rowid IN (SELECT rowid FROM lotes ORDER BY usado LIMIT ?)", (sobrantes,))
+
+        self.aciertos += len(usados)
+        self.parciales += len(completados)
+        self.calculados += len(a_calcular)
+        return es_gf, n_compatibles, tops
+
+
+def estadisticas(ruta=None):
+    """Tamaño y tasa de aciertos acumulada del caché de resultados.
+
+    {'entradas', 'consultas', 'aciertos', 'parciales', 'tasa_aciertos'}; los parciales
+    (lotes completados solo con las fichas cambiadas) no cuentan como aciertos.
+    """
+    with _conexion(ruta or ARCHIVO_RESULTADOS) as conn:
+        datos = dict.fromkeys(CONTADORES, 0)
+        datos.update(conn.execute("SELECT clave, valor FROM meta"))
+        datos['entradas'] = conn.execute("SELECT COUNT(*) FROM lotes").fetchone()[0]
+    datos['tasa_aciertos'] = datos['aciertos'] / datos['consultas'] if datos['consultas'] else None
+    return datos
@@ -0,0 +1,105 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+# ==========================================
+# 🧵 TRABAJOS EN SEGUNDO PLANO CON RESULTADOS PARCIALES
+# ==========================================
+# Un trabajo consume un generador en un hilo y guarda cada parte que produce; la página
+# lee lo acumulado en cada rerun (barra de progreso + primeras filas) sin esperar al
+# final. Los trabajos se registran por la clave de sus entradas:
+#   - misma clave -> se reutiliza el trabajo (en curso o terminado), aun entre sesiones;
+#     uno que falló conserva su error hasta que cambien las entradas o se pida reintentar
+#   - una sesión que cambia de clave suelta el anterior; si nadie más lo usa y sigue en
+#     curso, se cancela (el hilo se detiene antes de la siguiente parte)
+# Los terminados quedan en memoria (los MAX_TRABAJOS más recientes) para reutilizarlos.
+
+MAX_TRABAJOS = 8
+
+
+class Trabajo:
+    def __init__(self, clave, generador):
+        self.clave = clave
+        self.partes = []
+        self.error = None
+        self.terminado = False
+        self.inicio = time.perf_counter()
+        self.segundos = None
+        self._generador = generador
+        self._cancelar = threading.Event()
+        self._aviso = threading.Condition()
+        self._hilo = threading.Thread(target=self._correr, name=f"redestino-{hash(clave) & 0xffff:04x}", daemon=True)
+
+    def _correr(self):
+        try:
+            for parte in self._generador:
+                if self._cancelar.is_set(): break
+                with self._aviso:
+                    self.partes.append(parte)
+                    self._aviso.notify_all()
+        except Exception as e:  # se muestra en la página en vez de perderse en el hilo
+            self.error = f"{e}\n{traceback.format_exc(limit=3)}"
+        finally:
+            self._generador.close()
+            with self._aviso:
+                self.segundos = time.perf_counter() - self.inicio
+                self.terminado = True
+                self._aviso.notify_all()
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def esperar(self, segundos=None, partes=None):
+        """Espera a que termine (o a tener al menos `partes` partes). Devuelve si se cumplió."""
+        def listo():
+            return self.terminado or (partes is not None and len(self.partes) >= partes)
+        with self._aviso:
+            return self._aviso.wait_for(listo, segundos)
+
+    def estado(self):
+        """(terminado, partes) leídos juntos: si terminó, las partes están completas."""
+        with self._aviso:
+            return self.terminado, list(self.partes)
+
+
+_lock = threading.Lock()
+_trabajos = OrderedDict()
+_interesados = {}
+
+
+def obtener(clave, sesion, crear_generador, reintentar=False):
+    """Trabajo de `clave` para la `sesion` (lo inicia si no existe o fue cancelado).
+
+    Un trabajo que terminó con error se devuelve tal cual (volver a correrlo en cada
+    refresco repetiría el mismo fallo); con `reintentar` se inicia de nuevo.
+    `crear_generador()` solo se llama si hay que iniciar uno nuevo.
+    """
+    with _lock:
+        for otra, sesiones in _interesados.items():
+            if otra != clave and sesion in sesiones:
+                sesiones.discard(sesion)
+                trabajo = _trabajos.get(otra)
+                if not sesiones and trabajo is not None and not trabajo.terminado:
+                    trabajo.cancelar()
+                    del _trabajos[otra]
+
+        trabajo = _trabajos.get(clave)
+        if trabajo is None or trabajo.cancelado or (reintentar and trabajo.error):
+            trabajo = _trabajos[clave] = Trabajo(clave, crear_generador())
+            trabajo._hilo.start()
+        _trabajos.move_to_end(clave)
+        _interesados.setdefault(clave, set()).add(sesion)
+
+        # Se descartan los más antiguos (los que siguen en curso se cancelan)
+        while len(_trabajos) > MAX_TRABAJOS:
+            viejo_clave, viejo = _trabajos.popitem(last=False)
+            viejo.cancelar()
+            _interesados.pop(viejo_clave, None)
+        for c in [c for c, s in _interesados.items() if not s and c not in _trabajos]:
+            del _interesados[c]
+        return trabajo
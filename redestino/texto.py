@@ -0,0 +1,75 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 🔤 NORMALIZACIÓN DE TEXTO Y REGLAS DE FAMILIA
+# ==========================================
+# Tablas únicas de traducción (un solo pase por texto en vez de un replace por carácter)
+_TABLA_ACENTOS = str.maketrans('áéíóú', 'aeiou')
+_TABLA_PUNTUACION = str.maketrans({c: ' ' for c in '.,-/_%'})
+_ABREVIATURAS = ['n°', 'no.', 'num']
+
+
+@lru_cache(maxsize=65536)
+def _normalizar_str(texto):
+    texto = texto.lower().strip().translate(_TABLA_ACENTOS)
+    for abrev in _ABREVIATURAS:
+        texto = texto.replace(abrev, '')
+    return " ".join(texto.translate(_TABLA_PUNTUACION).split())
+
+def normalizar_texto(texto):
+    if not isinstance(texto, str): return str(texto)
+    return _normalizar_str(texto)
+
+def _factorizar_como_texto(serie):
+    """Códigos y textos únicos equivalentes a `serie.astype(str)`.
+
+    Si la columna trae valores no textuales (5 y 5.0 se factorizan juntos pero su
+    texto difiere) se convierte fila por fila antes de factorizar.
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    if any(not isinstance(v, str) and not pd.isna(v) for v in unicos):
+        codigos, unicos = pd.factorize(serie.map(lambda v: 'nan' if pd.isna(v) else str(v)), use_na_sentinel=False)
+    return codigos, ['nan' if pd.isna(v) else v for v in unicos]
+
+def _normalizar_unicos(serie):
+    # Se normaliza una sola vez cada valor distinto (estados, tipos, condiciones se repiten
+    # miles de veces) con operaciones `.str`; los códigos permiten expandir después
+    codigos, unicos = _factorizar_como_texto(serie)
+    textos = pd.Series(unicos, dtype=object).str.lower().str.translate(_TABLA_ACENTOS)
+    for abrev in _ABREVIATURAS:
+        textos = textos.str.replace(abrev, '', regex=False)
+    textos = textos.str.translate(_TABLA_PUNTUACION).str.split().str.join(' ')
+    return codigos, textos.to_numpy(dtype=object)
+
+def normalizar_serie(serie):
+    """Versión vectorizada de `serie.astype(str).map(normalizar_texto)`."""
+    codigos, textos = _normalizar_unicos(serie)
+    return pd.Series(textos[codigos], index=serie.index, dtype=object)
+
+def contiene_normalizado(serie, fragmento):
+    """Máscara booleana: el texto normalizado de cada fila contiene `fragmento`."""
+    codigos, textos = _normalizar_unicos(serie)
+    return pd.Series(np.array([fragmento in t for t in textos], dtype=bool)[codigos], index=serie.index)
+
+def detectar_familia_hoja(nombre_hoja):
+    h = normalizar_texto(nombre_hoja)
+    if 'groat' in h or 'pelada' in h: return 'groat'
+    if 'harina' in h: return 'harina'
+    if 'pillow' in h: return 'pillow'
+    if 'hojuela' in h: return 'hojuela'
+    return 'otros'
+
+def es_texto_gf(texto):
+    t = normalizar_texto(texto)
+    if 'gf' in t: return True
+    if 'gluten' in t and any(x in t for x in ['free', 'sin', 'libre', 'no']): return True
+    return False
+
+def es_texto_gf_serie(serie):
+    """Versión vectorizada de `serie.astype(str).map(es_texto_gf)` (arreglo booleano)."""
+    codigos, unicos = _factorizar_como_texto(serie)
+    marcas = np.array([es_texto_gf(v) for v in unicos], dtype=bool)
+    return marcas[codigos]
@@ -0,0 +1,166 @@
+import hashlib
+import json
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from redestino.config import ARCHIVO_SINONIMOS
+from redestino.texto import normalizar_texto
+
+# ==========================================
+# 🏷️ TIPOS DE PRODUCTO (SINÓNIMOS)
+# ==========================================
+# Tabla editable: tipo canónico -> variantes con que aparece en el producto de la ficha.
+# Puede reemplazarse sin tocar código con un JSON de la misma forma (ruta en la variable
+# de entorno REDESTINO_SINONIMOS). Claves y variantes se comparan ya normalizadas.
+SINONIMOS_TIPOS = {
+    'instantanea': ['quick', 'instant', 'instantanea', 'instantánea', 'inst'],
+    'tradicional': ['rolled', 'traditional', 'tradicional', 'regular', 'old fashioned'],
+    'integral': ['whole', 'wholegrain', 'integral', 'grano entero'],
+    'laminada': ['rolled', 'flake', 'laminada'],
+    'fina': ['fine', 'fina', 'baby'],
+    'ultra fina': ['super fine', 'ultra', 'dust'],
+    'avena pelada': ['groat', 'kernel', 'pelada'],
+    'estabilizada': ['stabilized', 'estabilizada']
+}
+
+
+# --- BÚSQUEDA MULTIPATRÓN ---
+class _AhoCorasick:
+    """Autómata de Aho-Corasick: todos los patrones contenidos en un texto en un solo pase."""
+
+    def __init__(self, patrones):
+        # patrones: {texto del patrón: conjunto de valores que aporta al aparecer}
+        self._sig = [{}]
+        self._fallo = [0]
+        self._salida = [set()]
+        for patron, valores in patrones.items():
+            if not patron: continue
+            nodo = 0
+            for ch in patron:
+                if ch not in self._sig[nodo]:
+                    self._sig[nodo][ch] = len(self._sig)
+                    self._sig.append({})
+                    self._fallo.append(0)
+                    self._salida.append(set())
+                nodo = self._sig[nodo][ch]
+            self._salida[nodo] |= set(valores)
+
+        # Enlaces de fallo por anchura: el sufijo propio más largo que también es prefijo
+        cola = deque(self._sig[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for ch, hijo in self._sig[nodo].items():
+                cola.append(hijo)
+                f = self._fallo[nodo]
+                while f and ch not in self._sig[f]:
+                    f = self._fallo[f]
+                self._fallo[hijo] = self._sig[f].get(ch, 0)
+                self._salida[hijo] |= self._salida[self._fallo[hijo]]
+
+    def buscar(self, texto):
+        """Unión de los valores de los patrones que aparecen en `texto`."""
+        sig, fallo, salida = self._sig, self._fallo, self._salida
+        encontrados = set()
+        nodo = 0
+        for ch in texto:
+            while nodo and ch not in sig[nodo]:
+                nodo = fallo[nodo]
+            nodo = sig[nodo].get(ch, 0)
+            if salida[nodo]:
+                encontrados |= salida[nodo]
+        return encontrados
+
+
+# --- CLASIFICADOR ---
+def _tipo_valido(tipo_norm):
+    return bool(tipo_norm) and tipo_norm != 'nan'
+
+
+class ClasificadorTipos:
+    """Etiquetas canónicas de tipo para lotes y fichas, compiladas una vez desde la tabla.
+
+    Un lote lleva la etiqueta `k` si su tipo contiene `k`; una ficha, si su producto
+    contiene alguna variante de `k`. Txt = 1 si comparten una etiqueta o si el tipo del
+    lote aparece tal cual en el producto de la ficha.
+    """
+
+    def __init__(self, sinonimos=None):
+        sinonimos = SINONIMOS_TIPOS if sinonimos is None else sinonimos
+        tabla = {}
+        for clave, variaciones in sinonimos.items():
+            tabla.setdefault(normalizar_texto(clave), []).extend(normalizar_texto(v) for v in variaciones)
+        self.etiquetas = list(tabla)
+        self.huella = hashlib.blake2b(json.dumps(tabla, ensure_ascii=False, sort_keys=True).encode('utf-8'),
+                                      digest_size=8).hexdigest()
+
+        variantes = {}
+        for k, clave in enumerate(self.etiquetas):
+            for var in tabla[clave]:
+                variantes.setdefault(var, set()).add(k)
+        self._claves = _AhoCorasick({clave: {k} for k, clave in enumerate(self.etiquetas)})
+        self._variantes = _AhoCorasick(variantes)
+
+    def etiquetas_lote(self, tipo_norm):
+        """Posiciones (en `etiquetas`) de los tipos canónicos que nombra el lote."""
+        return frozenset(self._claves.buscar(tipo_norm)) if _tipo_valido(tipo_norm) else frozenset()
+
+    def etiquetas_ficha(self, producto_norm):
+        """Posiciones (en `etiquetas`) de los tipos canónicos que menciona el producto de la ficha."""
+        return frozenset(self._variantes.buscar(producto_norm))
+
+    def _matriz(self, textos, etiquetar):
+        m = np.zeros((len(textos), len(self.etiquetas)), dtype=np.int32)
+        for i, texto in enumerate(textos):
+            m[i, list(etiquetar(texto))] = 1
+        return m
+
+    def tabla_txt(self, tipos_norm, productos_norm):
+        """Matriz booleana [tipo, producto]: Txt de cada par, sin recorrerlos de a uno.
+
+        Tipos y productos se etiquetan una vez por valor distinto; las etiquetas se cruzan
+        con un producto de matrices y la coincidencia literal se resuelve con un autómata
+        sobre los tipos y un pase por producto.
+        """
+        codigos_tipo, tipos_norm = pd.factorize(pd.Series(list(tipos_norm), dtype=object), use_na_sentinel=False)
+        tipos_norm = [str(t) for t in tipos_norm]
+        codigos, productos = pd.factorize(pd.Series(list(productos_norm), dtype=object), use_na_sentinel=False)
+        productos = [str(p) for p in productos]
+        tabla = (self._matriz(tipos_norm, self.etiquetas_lote) @ self._matriz(productos, self.etiquetas_ficha).T) > 0
+
+        literales = {}
+        for i, tipo in enumerate(tipos_norm):
+            if _tipo_valido(tipo):
+                literales.setdefault(tipo, set()).add(i)
+        if literales:
+            automata = _AhoCorasick(literales)
+            for j, producto in enumerate(productos):
+                filas = list(automata.buscar(producto))
+                tabla[filas, j] = True
+        return tabla[np.ix_(codigos_tipo, codigos)]
+
+
+def cargar_sinonimos(ruta):
+    """Tabla de sinónimos desde un JSON {tipo canónico: [variantes]}."""
+    with open(ruta, encoding='utf-8') as fh:
+        sinonimos = json.load(fh)
+    if not isinstance(sinonimos, dict) or not all(
+            isinstance(k, str) and isinstance(v, list) and all(isinstance(x, str) for x in v) for k, v in sinonimos.items()):
+        raise ValueError(f"{ruta}: se esperaba un objeto {{tipo: [variantes]}}")
+    return sinonimos
+
+
+@lru_cache(maxsize=1)
+def clasificador():
+    """Clasificador de la tabla vigente (la del JSON configurado, si hay uno)."""
+    return ClasificadorTipos(cargar_sinonimos(ARCHIVO_SINONIMOS) if ARCHIVO_SINONIMOS else SINONIMOS_TIPOS)
+
+
+def check_tipo_producto_score(lote_tipo_norm, ficha_producto_norm):
+    c = clasificador()
+    if not _tipo_valido(lote_tipo_norm): return 0
+
+    if lote_tipo_norm in ficha_producto_norm: return 1
+    return 1 if c.etiquetas_lote(lote_tipo_norm) & c.etiquetas_ficha(ficha_producto_norm) else 0